@@ -6,10 +6,23 @@ Agents:
 - Reasoner: Logical analysis and verification
 - Explainer: Plain-language translation
 
-Orchestration via LangGraph.
+Orchestration via LangGraph. Each agent's LLM calls go through a persistent
+response cache (llm_cache), then the dispatcher (dispatcher), which queues
+them by priority and user within the provider's limits.
 """
 
 from .orchestrator import build_graph, run_query, format_response
-from .state import AgentState
+from .retriever import batch_search_documents, document_refs, format_documents, render_documents
+from .state import AgentState, RetrievedDocument
 
-__all__ = ["build_graph", "run_query", "format_response", "AgentState"]
+__all__ = [
+    "build_graph",
+    "run_query",
+    "format_response",
+    "format_documents",
+    "document_refs",
+    "batch_search_documents",
+    "render_documents",
+    "AgentState",
+    "RetrievedDocument",
+]
@@ -0,0 +1,445 @@
+"""
+Central dispatcher for the agents' LLM calls.
+
+Every chat model the agents get is wrapped in a DispatchedChatModel, whose
+calls wait for a slot from the process-wide LLMDispatcher before reaching
+the provider. Replies served from the LLM cache never reach the wrapped
+model and take no slot.
+
+The dispatcher keeps one queue per priority class and grants slots:
+- interactive before batch: a batch call starts only when no interactive
+  call waits, and batch calls never hold more than LLM_BATCH_MAX_CONCURRENCY
+  of the LLM_MAX_CONCURRENCY slots, so chat keeps free slots while bulk
+  jobs run
+- round-robin between users within a class, so one user's 100-question
+  batch does not hold up another user's
+- within LLM_RPM requests and LLM_TPM tokens per minute (0: no limit); a
+  call is charged an estimate of its tokens when it starts, corrected by the
+  usage the provider reports when it ends
+
+The class and user of the calls are set per request with dispatch_as() (see
+api/main.py); calls outside of one are interactive. Time spent waiting is
+recorded in utils.metrics as "llm.queue.<class>".
+
+Each call has its stage's timeout (LLM_TIMEOUT_<STAGE>, else LLM_TIMEOUT),
+which for interactive calls includes the wait for a slot. Timeouts and
+provider outages (connection errors, 429, 5xx) are counted by a circuit
+breaker: after LLM_BREAKER_FAILURES in a row it opens, and calls fail at
+once for LLM_BREAKER_COOLDOWN seconds; then one probe call is let through,
+whose success closes it again. Calls that fail for either reason raise
+LLMUnavailableError, which the API answers with a retrieval-only response
+(agents/fallback.py).
+
+Limits are per process: the pre-fork server's workers (api/server.py) each
+get an equal share of them. Each worker has its own breaker.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from langchain_core.runnables import RunnableBinding, RunnableSequence
+
+from utils import metrics
+
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+_WORKERS = max(1, int(os.getenv("SERVICE_WORKERS", "1")))
+LLM_MAX_CONCURRENCY = max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "16")) // _WORKERS)
+LLM_BATCH_MAX_CONCURRENCY = max(1, int(os.getenv("LLM_BATCH_MAX_CONCURRENCY", "8")) // _WORKERS)
+LLM_RPM = int(os.getenv("LLM_RPM", "0")) / _WORKERS
+LLM_TPM = int(os.getenv("LLM_TPM", "0")) / _WORKERS
+
+# Seconds per call, by stage; stages not listed get LLM_TIMEOUT
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+STAGE_TIMEOUTS = {
+    stage: float(os.getenv(f"LLM_TIMEOUT_{stage.upper()}", default))
+    for stage, default in {"retriever": 20, "reasoner": 40, "explainer": 30, "summarizer": 60}.items()
+}
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# Tokens a call is assumed to generate until the provider reports its usage
+_OUTPUT_TOKENS_ESTIMATE = 512
+# Roughly 4 characters per token in English prompts
+_CHARS_PER_TOKEN = 4
+
+_context: ContextVar = ContextVar("llm_dispatch", default=(INTERACTIVE, ""))
+
+
+class LLMUnavailableError(RuntimeError):
+    """The LLM did not answer in time, is failing, or the circuit breaker is open."""
+
+
+def _outage_errors() -> tuple:
+    """Exceptions that mean the provider is down or overloaded, not that the call was wrong."""
+    errors = (TimeoutError, ConnectionError)
+    try:
+        import openai
+    except ImportError:
+        return errors
+    return errors + (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+@contextmanager
+def dispatch_as(priority: str, user_id: Optional[str] = None):
+    """LLM calls made in this context (and threads started from it) are queued as priority for user_id."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}'. Options: {', '.join(PRIORITIES)}")
+    token = _context.set((priority, user_id or ""))
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+class _Budget:
+    """Per-minute allowance, refilled continuously (a token bucket holding a minute's worth)."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait(self, amount: float, now: float) -> float:
+        """Seconds until amount is available (0 now); amounts over a minute's worth wait for a full bucket."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.available
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        # May go negative: a call larger than the bucket runs once it is full.
+        # Negative amounts refund an overestimate
+        self.available = min(self.capacity, self.available - amount)
+
+
+class CircuitBreaker:
+    """Refuses calls for `cooldown` seconds after `failures` outages in a row, then lets one probe through."""
+
+    def __init__(self, failures: int = LLM_BREAKER_FAILURES, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened: Optional[float] = None
+        self._probing = False
+
+    def _state(self) -> str:
+        if self._opened is None:
+            return "closed"
+        return "open" if time.monotonic() - self._opened < self.cooldown else "half-open"
+
+    @property
+    def state(self) -> str:
+        """"closed", "open" or "half-open"."""
+        with self._lock:
+            return self._state()
+
+    def is_open(self) -> bool:
+        """Whether calls fail at once now: open, or half-open with the probe in flight."""
+        with self._lock:
+            state = self._state()
+            return state == "open" or (state == "half-open" and self._probing)
+
+    def allow(self) -> bool:
+        """Whether a call may reach the provider; when half-open, only the first does (the probe)."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            if self._opened is not None:
+                print("LLM circuit breaker closed")
+            self._consecutive = 0
+            self._opened = None
+            self._probing = False
+
+    def end_probe(self):
+        """Lets another call probe, if the one in flight ended without success() or failure()."""
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or self._consecutive >= self.failures:
+                if self._state() == "closed" or self._probing:
+                    print(f"LLM circuit breaker opened for {self.cooldown:g}s")
+                    metrics.increment("llm.breaker.opened")
+                self._opened = time.monotonic()
+            self._probing = False
+
+
+@dataclass
+class _Ticket:
+    priority: str
+    user_id: str
+    tokens: int
+    enqueued: float = field(default_factory=time.monotonic)
+    granted: bool = False
+
+
+class LLMDispatcher:
+    """Grants LLM call slots by priority class, then round-robin per user, within the limits."""
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        batch_max_concurrency: int = LLM_BATCH_MAX_CONCURRENCY,
+        rpm: float = LLM_RPM,
+        tpm: float = LLM_TPM,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.breaker = breaker or CircuitBreaker()
+        self.max_concurrency = max_concurrency
+        self.batch_max_concurrency = min(batch_max_concurrency, max_concurrency)
+        self._requests = _Budget(rpm) if rpm else None
+        self._tokens = _Budget(tpm) if tpm else None
+        self._cond = threading.Condition()
+        # priority -> user -> waiting tickets; users are served in key order, then moved to the end
+        self._queues: Dict[str, OrderedDict] = {priority: OrderedDict() for priority in PRIORITIES}
+        self._running = {priority: 0 for priority in PRIORITIES}
+
+    def _limit(self, priority: str) -> bool:
+        """Whether priority may start one more call now, concurrency-wise."""
+        if sum(self._running.values()) >= self.max_concurrency:
+            return False
+        return priority != BATCH or self._running[BATCH] < self.batch_max_concurrency
+
+    def _dispatch(self) -> Optional[float]:
+        """Grant every ticket that can start now; the seconds until the next rate-limited one can, or None."""
+        now = time.monotonic()
+        for priority in PRIORITIES:
+            queue = self._queues[priority]
+            while queue:
+                if not self._limit(priority):
+                    return None
+                user_id, tickets = next(iter(queue.items()))
+                ticket = tickets[0]
+                wait = max(
+                    self._requests.wait(1, now) if self._requests else 0.0,
+                    self._tokens.wait(ticket.tokens, now) if self._tokens else 0.0,
+                )
+                if wait > 0:
+                    # Lower classes do not overtake a rate-limited higher one
+                    return wait
+
+                tickets.popleft()
+                if tickets:
+                    queue.move_to_end(user_id)
+                else:
+                    del queue[user_id]
+                if self._requests:
+                    self._requests.take(1)
+                if self._tokens:
+                    self._tokens.take(ticket.tokens)
+                self._running[priority] += 1
+                ticket.granted = True
+                self._cond.notify_all()
+        return None
+
+    def acquire(
+        self,
+        tokens: int,
+        priority: Optional[str] = None,
+        user_id: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> _Ticket:
+        """
+        Wait for a slot for a call of about `tokens` tokens; the class and user
+        default to dispatch_as()'s. LLMUnavailableError after `timeout` seconds.
+        """
+        context_priority, context_user = _context.get()
+        ticket = _Ticket(priority or context_priority, user_id if user_id is not None else context_user, tokens)
+        deadline = None if timeout is None else ticket.enqueued + timeout
+        with self._cond:
+            queue = self._queues[ticket.priority]
+            queue.setdefault(ticket.user_id, deque()).append(ticket)
+            while True:
+                wait = self._dispatch()
+                if ticket.granted:
+                    break
+                if deadline is not None:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        queue[ticket.user_id].remove(ticket)
+                        if not queue[ticket.user_id]:
+                            del queue[ticket.user_id]
+                        metrics.increment(f"llm.queue_timeouts.{ticket.priority}")
+                        raise LLMUnavailableError(f"No LLM call slot free within {timeout:g}s")
+                    wait = left if wait is None else min(wait, left)
+                self._cond.wait(wait)
+        metrics.record(f"llm.queue.{ticket.priority}", time.monotonic() - ticket.enqueued)
+        metrics.increment(f"llm.calls.{ticket.priority}")
+        return ticket
+
+    def release(self, ticket: _Ticket, tokens: Optional[int] = None):
+        """Free the ticket's slot; tokens: what the call really used, if known."""
+        with self._cond:
+            self._running[ticket.priority] -= 1
+            if self._tokens and tokens is not None:
+                self._tokens.take(tokens - ticket.tokens)
+            self._dispatch()
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        """Calls running and waiting per class, and the circuit breaker's state."""
+        with self._cond:
+            return {
+                **{
+                    priority: {
+                        "running": self._running[priority],
+                        "waiting": sum(len(tickets) for tickets in self._queues[priority].values()),
+                    }
+                    for priority in PRIORITIES
+                },
+                "breaker": self.breaker.state,
+            }
+
+
+_dispatcher: Optional[LLMDispatcher] = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> LLMDispatcher:
+    """The process-wide dispatcher."""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = LLMDispatcher()
+        return _dispatcher
+
+
+def llm_available() -> bool:
+    """False while the process-wide circuit breaker refuses LLM calls."""
+    return not get_dispatcher().breaker.is_open()
+
+
+def _estimate_tokens(messages: List[BaseMessage]) -> int:
+    return sum(len(str(message.content)) for message in messages) // _CHARS_PER_TOKEN + _OUTPUT_TOKENS_ESTIMATE
+
+
+def _used_tokens(result: ChatResult) -> Optional[int]:
+    """Total tokens the provider reported for a call, or None if it did not."""
+    used = [
+        getattr(generation.message, "usage_metadata", None) for generation in result.generations
+    ]
+    if not any(used):
+        return None
+    return sum(usage.get("total_tokens", 0) for usage in used if usage)
+
+
+class DispatchedChatModel(BaseChatModel):
+    """
+    A chat model whose calls go through the dispatcher, with the timeout of
+    its stage and behind the circuit breaker.
+
+    Cache keys are the wrapped model's, so existing cache entries stay valid.
+    The timeout is passed to the wrapped model as the `timeout` call argument
+    (ChatOpenAI hands it to the OpenAI client, per request attempt).
+    """
+
+    model: BaseChatModel
+    dispatcher: Optional[Any] = None  # LLMDispatcher; None for the process-wide one
+    stage: str = ""
+
+    @property
+    def temperature(self):
+        return getattr(self.model, "temperature", None)
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    @property
+    def _identifying_params(self) -> dict:
+        return self.model._identifying_params
+
+    def _get_llm_string(self, stop: Optional[List[str]] = None, **kwargs: Any) -> str:
+        return self.model._get_llm_string(stop=stop, **kwargs)
+
+    def with_structured_output(self, schema, **kwargs: Any):
+        """The wrapped model's structured output, its calls dispatched."""
+        structured = self.model.with_structured_output(schema, **kwargs)
+        # Models build it as their own model bound to extra call arguments, then a parser
+        steps = structured.steps if isinstance(structured, RunnableSequence) else []
+        if not steps or not isinstance(steps[0], RunnableBinding) or steps[0].bound is not self.model:
+            raise TypeError(f"Cannot dispatch the structured output of {type(self.model).__name__}")
+        first = self.bind(**steps[0].kwargs).with_config(steps[0].config)
+        return RunnableSequence(first, *steps[1:])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        dispatcher = self.dispatcher or get_dispatcher()
+        breaker = dispatcher.breaker
+        if breaker.is_open():
+            metrics.increment("llm.breaker.rejected")
+            raise LLMUnavailableError("The language model is unavailable (circuit breaker open)")
+
+        timeout = STAGE_TIMEOUTS.get(self.stage, LLM_TIMEOUT)
+        start = time.monotonic()
+        # Batch calls may queue for long behind chat; only their provider call is timed
+        interactive = _context.get()[0] == INTERACTIVE
+        ticket = dispatcher.acquire(_estimate_tokens(messages), timeout=timeout if interactive else None)
+        deadline = (start if interactive else time.monotonic()) + timeout
+        used = None
+        try:
+            if not breaker.allow():
+                metrics.increment("llm.breaker.rejected")
+                raise LLMUnavailableError("The language model is unavailable (circuit breaker open)")
+            try:
+                result = self.model._generate(
+                    messages, stop=stop, run_manager=run_manager,
+                    **{"timeout": max(0.1, deadline - time.monotonic()), **kwargs}
+                )
+            except _outage_errors() as e:
+                breaker.failure()
+                metrics.increment(f"llm.failures.{self.stage or 'other'}")
+                raise LLMUnavailableError(f"The language model did not answer: {e}") from e
+            except Exception:
+                # The provider answered, with an error of this call's own (a rejected
+                # request, an unparsable reply): it is up
+                breaker.success()
+                raise
+            finally:
+                # A probe cancelled mid-call ends too, so the next call probes again
+                breaker.end_probe()
+            breaker.success()
+            used = _used_tokens(result)
+            return result
+        finally:
+            dispatcher.release(ticket, used)
+
+
+def dispatched(llm, dispatcher: Optional[LLMDispatcher] = None, stage: str = ""):
+    """The chat model wrapped so its calls go through the dispatcher with the stage's timeout."""
+    if isinstance(llm, DispatchedChatModel):
+        return llm.model_copy(update={"stage": stage}) if stage and stage != llm.stage else llm
+    return DispatchedChatModel(model=llm, dispatcher=dispatcher, stage=stage)
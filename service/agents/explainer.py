@@ -5,6 +5,10 @@ Explainer Agent: Translates legal reasoning into plain language.
 from langchain_core.messages import AIMessage
 from langchain_core.prompts import ChatPromptTemplate
 
+from utils.metrics import timed
+
+from .memory import conversation_block
+
 
 DISCLAIMER = """
 
@@ -33,7 +37,7 @@ Guidelines:
 3. Highlight key points
 4. Emphasize this is NOT legal advice
 5. Encourage professional consultation"""),
-            ("human", """Question: {query}
+            ("human", """{conversation}Question: {query}
 
 Analysis:
 {reasoning}
@@ -49,18 +53,19 @@ Provide:
         ])
 
         chain = explainer_prompt | llm
-        result = chain.invoke({
-            "query": query,
-            "reasoning": "\n".join(reasoning_chain),
-            "status": verification_status
-        })
+        with timed("explainer.llm"):
+            result = chain.invoke({
+                "query": query,
+                "conversation": conversation_block(state.get("conversation")),
+                "reasoning": "\n".join(reasoning_chain),
+                "status": verification_status
+            })
 
         final_explanation = result.content + DISCLAIMER
 
         return {
-            **state,
             "final_explanation": final_explanation,
-            "messages": state["messages"] + [
+            "messages": [
                 AIMessage(content=f"[Explainer]\n\n{final_explanation}")
             ]
         }
@@ -0,0 +1,138 @@
+"""
+Retrieval-only answers, for when the LLM is unavailable.
+
+When the dispatcher's circuit breaker is open, or an LLM call of a query
+times out or fails (agents/dispatcher.py), the API answers with what
+retrieval alone can give: the top passages for the question, its words
+highlighted in bold (markdown, as the chat renders it), and the status
+UNVERIFIED since no agent analysed them.
+"""
+
+import re
+from typing import Optional
+
+from .explainer import DISCLAIMER
+from .retriever import search_documents
+from .state import RetrievedDocument
+
+
+UNVERIFIED = "UNVERIFIED"
+
+# Passages in the answer, and characters shown of each
+PASSAGES = 3
+EXCERPT_CHARS = 600
+
+_STOPWORDS = frozenset("""
+a about an and any are as at be by can could do does for from has have how i if in into is it its may me
+my no not of on or our shall should so than that the their them then there these they this those to under
+us was we were what when where which who whom why will with would you your
+""".split())
+_MARKDOWN = re.compile(r"([\\`*_\[\]<>#])")
+
+
+def _escape(text: str) -> str:
+    return _MARKDOWN.sub(r"\\\1", text)
+
+
+def _stems(query: str) -> set:
+    """Prefixes of the query's content words, so "terminate" also matches "termination"."""
+    words = {word.lower() for word in re.findall(r"[A-Za-z][A-Za-z-]+", query)}
+    return {
+        word[:max(5, len(word) - 3)] if len(word) > 5 else word
+        for word in words
+        if word not in _STOPWORDS
+    }
+
+
+def highlight_spans(text: str, query: str) -> list[tuple[int, int]]:
+    """Character spans of the words of text starting with a query word's stem; neighbours are merged."""
+    stems = _stems(query)
+    if not stems:
+        return []
+    pattern = re.compile(
+        r"\b(?:" + "|".join(map(re.escape, sorted(stems, key=len, reverse=True))) + r")[\w-]*", re.IGNORECASE
+    )
+    spans = []
+    for match in pattern.finditer(text):
+        if spans and text[spans[-1][1]:match.start()].strip(" ") == "":
+            spans[-1] = (spans[-1][0], match.end())
+        else:
+            spans.append((match.start(), match.end()))
+    return spans
+
+
+def _excerpt(text: str, spans: list[tuple[int, int]]) -> tuple[str, list[tuple[int, int]]]:
+    """At most EXCERPT_CHARS of text, starting a little before the first span, and the spans within it."""
+    if len(text) <= EXCERPT_CHARS:
+        return text, spans
+    start = max(0, spans[0][0] - EXCERPT_CHARS // 4) if spans else 0
+    if start:
+        # From the start of a word
+        start = text.find(" ", start) + 1 or start
+    end = min(len(text), start + EXCERPT_CHARS)
+    prefix = "…" if start else ""
+    # Spans shifted into the excerpt, cut at its ends
+    offset = start - len(prefix)
+    inside = [(max(s, start) - offset, min(e, end) - offset) for s, e in spans if s < end and e > start]
+    return prefix + text[start:end] + ("…" if end < len(text) else ""), inside
+
+
+def highlight(text: str, query: str) -> str:
+    """An excerpt of the passage as markdown, the query's words in bold."""
+    text = " ".join(text.split())
+    excerpt, spans = _excerpt(text, highlight_spans(text, query))
+    parts, last = [], 0
+    for start, end in spans:
+        parts.append(_escape(excerpt[last:start]))
+        parts.append("**" + _escape(excerpt[start:end]) + "**")
+        last = end
+    parts.append(_escape(excerpt[last:]))
+    return "".join(parts)
+
+
+def retrieval_only_result(
+    vector_db,
+    query: str,
+    documents: Optional[list[RetrievedDocument]] = None,
+    search_kwargs=None,
+    clause_lookup=None,
+    reason: str = "",
+    session_id: Optional[str] = None,
+) -> dict:
+    """
+    Answer to query from retrieval only, shaped like the state run_query returns.
+
+    documents: already retrieved state entries; searched for as the retriever
+    does otherwise (without rewriting follow-up questions, which needs the LLM).
+    reason: why the LLM was not used, for the reasoning chain.
+    session_id: chat session of the query, scoping the clause lookup.
+    """
+    if not documents:
+        documents = search_documents(vector_db, query, search_kwargs, clause_lookup, session_id)
+
+    passages = []
+    for document in documents[:PASSAGES]:
+        doc = vector_db.docstore.search(document["id"])
+        if isinstance(doc, str):
+            continue
+        source = doc.metadata.get("source") or doc.metadata.get("title")
+        heading = f"**Passage {len(passages) + 1}**" + (f" ({_escape(source)})" if source else "")
+        passages.append(f"{heading}\n> {highlight(doc.page_content, query)}")
+
+    if passages:
+        body = (
+            "The assistant cannot analyse your question right now. These are the passages of your documents "
+            "that best match it, with its words in bold. They have not been checked, so read them with care.\n\n"
+            + "\n\n".join(passages)
+        )
+    else:
+        body = "The assistant cannot analyse your question right now, and no passage of your documents matches it."
+
+    return {
+        "user_query": query,
+        "documents": documents,
+        "claims": [],
+        "reasoning_chain": [f"Retrieval only: {reason or 'the language model is unavailable'}."],
+        "verification_status": UNVERIFIED,
+        "final_explanation": body + DISCLAIMER,
+    }
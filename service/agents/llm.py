@@ -0,0 +1,169 @@
+"""
+Chat model construction for the agents.
+
+LLM_PROVIDER selects the model behind every agent:
+- "openai" (default): ChatOpenAI
+- "fake": a deterministic local model with configurable latency and output
+  length, for offline benchmarks; no API key needed and nothing is billed
+
+Calls are given a timeout by the dispatcher (agents/dispatcher.py); the
+OpenAI client retries a failed call LLM_MAX_RETRIES times, each attempt
+with that timeout.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import time
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+FAKE_LLM_TOKENS = int(os.getenv("FAKE_LLM_TOKENS", "200"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+
+_FAKE_VOCABULARY = [
+    "the", "agreement", "party", "shall", "terminate", "notice", "days", "clause",
+    "licensee", "warranty", "indemnify", "liability", "governing", "law", "term", "payment",
+]
+_WORDS_PER_LINE = 16
+# Items per array and words per string in structured (JSON) replies
+_FAKE_ARRAY_ITEMS = 2
+_FAKE_STRING_WORDS = 8
+
+
+def _fake_json(schema: dict, defs: dict, digits: Iterator[int]):
+    """Instance of a JSON schema, filled from a stream of hash digits."""
+    if "$ref" in schema:
+        return _fake_json(defs[schema["$ref"].rsplit("/", 1)[-1]], defs, digits)
+    if "enum" in schema:
+        return schema["enum"][next(digits) % len(schema["enum"])]
+
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: _fake_json(prop, defs, digits) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [_fake_json(schema.get("items", {}), defs, digits) for _ in range(_FAKE_ARRAY_ITEMS)]
+    if kind == "integer":
+        return 1 + next(digits) % 5
+    if kind == "number":
+        return next(digits) / 16
+    if kind == "boolean":
+        return next(digits) % 2 == 1
+    return " ".join(_FAKE_VOCABULARY[next(digits)] for _ in range(_FAKE_STRING_WORDS))
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic stand-in for a chat model.
+
+    The reply is derived from a hash of the rendered prompt, so identical
+    prompts get identical replies. Token usage is reported the same way
+    ChatOpenAI reports it (usage_metadata), counting whitespace-separated
+    words as tokens. with_structured_output replies with a JSON instance of
+    the schema instead of free text. A call with a `timeout` shorter than
+    the latency raises TimeoutError once it expires, as a slow provider would.
+    """
+
+    latency_ms: float = 0.0
+    output_tokens: int = 200
+    model_name: str = "fake-chat"
+    # Replies depend on the prompt alone, as at temperature 0
+    temperature: Optional[float] = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    @property
+    def _identifying_params(self) -> dict:
+        return {"model_name": self.model_name, "output_tokens": self.output_tokens}
+
+    def with_structured_output(self, schema, **kwargs: Any):
+        """Model whose replies are parsed into the pydantic schema."""
+        return self.bind(json_schema=schema.model_json_schema()) | PydanticOutputParser(pydantic_object=schema)
+
+    def _delay(self, timeout: Optional[float]) -> float:
+        """Seconds to wait before replying, at most the timeout."""
+        return min(self.latency_ms / 1000, timeout if timeout is not None else float("inf"))
+
+    def _check_timeout(self, timeout: Optional[float]):
+        if timeout is not None and self.latency_ms / 1000 > timeout:
+            raise TimeoutError(f"No reply within {timeout:.1f}s")
+
+    def _reply(self, messages: List[BaseMessage], json_schema: Optional[dict] = None) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+        if json_schema is not None:
+            digits = itertools.cycle(int(digit, 16) for digit in digest)
+            content = json.dumps(_fake_json(json_schema, json_schema.get("$defs", {}), digits))
+            output_tokens = len(content.split())
+        else:
+            words = [
+                _FAKE_VOCABULARY[int(digest[i % len(digest)], 16)]
+                for i in range(self.output_tokens)
+            ]
+            content = "\n".join(
+                " ".join(words[i:i + _WORDS_PER_LINE])
+                for i in range(0, len(words), _WORDS_PER_LINE)
+            )
+            output_tokens = self.output_tokens
+
+        input_tokens = len(prompt.split())
+        message = AIMessage(
+            content=content,
+            usage_metadata={
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens,
+            },
+            response_metadata={"model_name": self.model_name},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        if self.latency_ms:
+            time.sleep(self._delay(kwargs.get("timeout")))
+            self._check_timeout(kwargs.get("timeout"))
+        return self._reply(messages, kwargs.get("json_schema"))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        if self.latency_ms:
+            await asyncio.sleep(self._delay(kwargs.get("timeout")))
+            self._check_timeout(kwargs.get("timeout"))
+        return self._reply(messages, kwargs.get("json_schema"))
+
+
+def get_llm(model_name: str = "gpt-4o-mini", temperature: float = 0, provider: Optional[str] = None):
+    """Create the chat model the agents run on."""
+    provider = (provider or LLM_PROVIDER).lower()
+
+    if provider == "fake":
+        return FakeChatModel(latency_ms=FAKE_LLM_LATENCY_MS, output_tokens=FAKE_LLM_TOKENS)
+    if provider == "openai":
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(model=model_name, temperature=temperature, max_retries=LLM_MAX_RETRIES)
+
+    raise ValueError(f"Unknown LLM_PROVIDER '{provider}'. Options: openai, fake")
@@ -0,0 +1,245 @@
+"""
+Persistent LLM response cache.
+
+A SQLite-backed LangChain cache, attached to the chat model each agent gets
+(the model's `cache` field), so identical calls -- same model and
+parameters, same rendered messages -- are answered from disk. Entries are
+evicted least recently used once the cache outgrows LLM_CACHE_MAX_MB, and
+hits and misses are counted per agent stage in utils.metrics.
+
+The file can be shared by several worker processes: its total size is kept
+in the database by triggers, not counted per process.
+
+Only models with temperature explicitly 0 are cached.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Optional
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from pydantic import BaseModel
+
+from utils import metrics
+
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") == "1"
+LLM_CACHE_PATH = Path(
+    os.getenv("LLM_CACHE_PATH", str(Path(__file__).parent.parent / "data" / "llm_cache.sqlite"))
+)
+LLM_CACHE_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+
+# Eviction trims the cache to this fraction of its maximum size
+_EVICT_TO = 0.9
+
+
+def _plain(return_val: list) -> list:
+    """
+    Generations with the pydantic object of a structured reply turned into
+    plain data. ChatOpenAI's json_schema mode puts it in the message's
+    additional_kwargs["parsed"], which dumps cannot serialize; its parser
+    accepts the dict as well.
+    """
+    generations = []
+    for generation in return_val:
+        message = getattr(generation, "message", None)
+        parsed = message.additional_kwargs.get("parsed") if message is not None else None
+        if isinstance(parsed, BaseModel):
+            additional_kwargs = {**message.additional_kwargs, "parsed": parsed.model_dump(mode="json")}
+            message = message.model_copy(update={"additional_kwargs": additional_kwargs})
+            generation = generation.model_copy(update={"message": message})
+        generations.append(generation)
+    return generations
+
+
+class SQLiteLLMCache(BaseCache):
+    """LangChain cache in a SQLite file with size-based LRU eviction."""
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+        with self._transaction():
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)"
+            )
+            # Caches created before the size table start from their current size
+            self._conn.execute(
+                "INSERT OR IGNORE INTO llm_cache_size VALUES (0, (SELECT COALESCE(SUM(size), 0) FROM llm_cache))"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS llm_cache_insert AFTER INSERT ON llm_cache "
+                "BEGIN UPDATE llm_cache_size SET bytes = bytes + NEW.size; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS llm_cache_update AFTER UPDATE OF size ON llm_cache "
+                "BEGIN UPDATE llm_cache_size SET bytes = bytes - OLD.size + NEW.size; END"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS llm_cache_delete AFTER DELETE ON llm_cache "
+                "BEGIN UPDATE llm_cache_size SET bytes = bytes - OLD.size; END"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction, serialized with the other processes using the file."""
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _size(self) -> int:
+        return self._conn.execute("SELECT bytes FROM llm_cache_size").fetchone()[0]
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        return hashlib.sha256(f"{llm_string}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[list]:
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            try:
+                value = loads(row[0], allowed_objects="core")
+            except Exception as e:
+                # Written by another LangChain version, or not loadable at all: a miss,
+                # and the call's reply replaces it
+                print(f"LLM cache: dropping unreadable entry ({e})")
+                metrics.increment("llm_cache.unreadable")
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        return value
+
+    def update(self, prompt: str, llm_string: str, return_val: list) -> None:
+        key = self._key(prompt, llm_string)
+        value = dumps(_plain(return_val))
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+
+        with self._lock, self._transaction():
+            # An upsert, not INSERT OR REPLACE: the replaced row must go through the size triggers
+            self._conn.execute(
+                "INSERT INTO llm_cache (key, value, size, last_used) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "last_used = excluded.last_used",
+                (key, value, size, time.time())
+            )
+            if self._size() > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries down to _EVICT_TO of max_bytes (in a transaction)."""
+        target = self.max_bytes * _EVICT_TO
+        total = self._size()
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_used")
+        doomed = []
+        for key, size in rows:
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", doomed)
+        metrics.increment("llm_cache.evictions", len(doomed))
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+
+    def stats(self) -> dict:
+        """Entry count and size on disk."""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+            size = self._size()
+        return {"entries": entries, "bytes": size, "max_bytes": self.max_bytes}
+
+    def for_stage(self, stage: str) -> "StageCache":
+        """View of this cache that counts hits and misses for one agent stage."""
+        return StageCache(self, stage)
+
+
+class StageCache(BaseCache):
+    """Shares a SQLiteLLMCache, recording llm_cache.<stage>.hits / .misses."""
+
+    def __init__(self, store: SQLiteLLMCache, stage: str):
+        self.store = store
+        self.stage = stage
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[list]:
+        result = self.store.lookup(prompt, llm_string)
+        metrics.increment(f"llm_cache.{self.stage}.{'hits' if result is not None else 'misses'}")
+        return result
+
+    def update(self, prompt: str, llm_string: str, return_val: list) -> None:
+        self.store.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.store.clear()
+
+
+_cache: Optional[SQLiteLLMCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[SQLiteLLMCache]:
+    """The process-wide cache, or None when LLM_CACHE=0."""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SQLiteLLMCache()
+        return _cache
+
+
+def with_cache(llm, stage: str):
+    """
+    Copy of a chat model that answers repeated calls from the cache.
+
+    Models whose temperature is not explicitly 0 are returned unchanged: a
+    temperature of None means the provider's default (1.0 for OpenAI).
+    """
+    cache = get_llm_cache()
+    if cache is None or getattr(llm, "temperature", None) != 0:
+        return llm
+    return llm.model_copy(update={"cache": cache.for_stage(stage)})
+
+
+def cache_stats() -> dict:
+    """Size of the cache and hit rate per stage, from the metrics counters."""
+    cache = get_llm_cache()
+    if cache is None:
+        return {"enabled": False}
+
+    counters = metrics.snapshot()["counters"]
+    stages = {}
+    for name, value in counters.items():
+        parts = name.split(".")
+        if len(parts) == 3 and parts[0] == "llm_cache":
+            stages.setdefault(parts[1], {"hits": 0, "misses": 0})[parts[2]] = int(value)
+    for counts in stages.values():
+        total = counts["hits"] + counts["misses"]
+        counts["hit_rate"] = counts["hits"] / total if total else 0.0
+
+    return {"enabled": True, **cache.stats(), "stages": stages}
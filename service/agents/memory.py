@@ -0,0 +1,209 @@
+"""
+Conversation memory for chat sessions.
+
+Each (user, session) keeps its most recent turns plus a rolling summary of
+everything older, in SQLite. Prompts only ever see a window of at most
+HISTORY_MAX_TOKENS tokens: the summary (capped at SUMMARY_MAX_TOKENS) and as
+many recent turns as fit. When the stored turns outgrow the window, the
+oldest ones are folded into the summary by the LLM, off the request path.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.prompts import ChatPromptTemplate
+
+from utils.chunking import count_tokens, token_spans
+
+
+SESSION_DB_PATH = Path(
+    os.getenv("SESSION_DB_PATH", str(Path(__file__).parent.parent / "data" / "sessions.sqlite"))
+)
+HISTORY_MAX_TOKENS = int(os.getenv("HISTORY_MAX_TOKENS", "768"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "256"))
+# Longest stored turn; long answers keep their beginning
+TURN_MAX_TOKENS = 256
+
+Turn = Tuple[str, str]  # (role, content), role "user" or "assistant"
+
+_ELLIPSIS = " ..."
+_SUMMARY_LABEL = "Summary of earlier conversation: "
+_TURNS_LABEL = "Recent turns:"
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Beginning of a text, at most max_tokens tokens counting the " ..." marking the cut."""
+    starts, ends = token_spans(text)
+    if len(starts) <= max_tokens:
+        return text
+    keep = max_tokens - count_tokens(_ELLIPSIS)
+    return text[:ends[keep - 1]] + _ELLIPSIS if keep > 0 else ""
+
+
+def _render_turn(turn: Turn) -> str:
+    role, content = turn
+    return f"{'User' if role == 'user' else 'Assistant'}: {content}"
+
+
+def render_window(summary: str, turns: List[Turn], max_tokens: int = HISTORY_MAX_TOKENS) -> str:
+    """
+    Conversation context for a prompt, at most max_tokens tokens.
+
+    The summary comes first; then the most recent turns that fit, oldest
+    first. Labels count towards the budget. Returns "" when there is no
+    history.
+    """
+    budget = max_tokens
+    parts = []
+    if summary:
+        summary = truncate_tokens(summary, min(SUMMARY_MAX_TOKENS, budget - count_tokens(_SUMMARY_LABEL)))
+        if summary:
+            budget -= count_tokens(_SUMMARY_LABEL + summary)
+
+    recent = []
+    budget -= count_tokens(_TURNS_LABEL)
+    for turn in reversed(turns):
+        rendered = _render_turn((turn[0], truncate_tokens(turn[1], TURN_MAX_TOKENS)))
+        cost = count_tokens(rendered)
+        if cost > budget:
+            break
+        recent.append(rendered)
+        budget -= cost
+
+    if summary:
+        parts.append(_SUMMARY_LABEL + summary)
+    if recent:
+        parts.append(_TURNS_LABEL + "\n" + "\n".join(reversed(recent)))
+    return "\n".join(parts)
+
+
+def conversation_block(conversation: str) -> str:
+    """Conversation window as a prompt preamble, or "" without history."""
+    if not conversation:
+        return ""
+    return f"Conversation so far:\n{conversation}\n\n"
+
+
+CONDENSE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Rewrite the user's follow-up question as a standalone search query for
+the legal documents, resolving references to earlier turns. Reply with the query only."""),
+    ("human", """{conversation}Follow-up question: {query}""")
+])
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You maintain a running summary of a conversation about legal documents.
+Merge the new turns into the existing summary. Keep the facts, the documents and
+clauses discussed and any open questions. Write at most {max_words} words."""),
+    ("human", """Existing summary:
+{summary}
+
+New turns:
+{turns}""")
+])
+
+
+class SessionMemory:
+    """Recent turns and a rolling summary per (user, session), stored in SQLite."""
+
+    def __init__(self, path: Path = SESSION_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._session_locks: Dict[Tuple[str, str], threading.Lock] = defaultdict(threading.Lock)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " user_id TEXT NOT NULL, session_id TEXT NOT NULL, summary TEXT NOT NULL,"
+            " turns TEXT NOT NULL, updated REAL NOT NULL, PRIMARY KEY (user_id, session_id))"
+        )
+
+    def load(self, user_id: str, session_id: str) -> Tuple[str, List[Turn]]:
+        """(summary, turns) of a session; empty for a new one."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, turns FROM sessions WHERE user_id = ? AND session_id = ?",
+                (user_id, session_id)
+            ).fetchone()
+        if row is None:
+            return "", []
+        return row[0], [tuple(turn) for turn in json.loads(row[1])]
+
+    def _save(self, user_id: str, session_id: str, summary: str, turns: List[Turn]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (user_id, session_id, summary, turns, updated) VALUES (?, ?, ?, ?, ?)",
+                (user_id, session_id, summary, json.dumps(turns), time.time())
+            )
+
+    def window(self, user_id: str, session_id: str, max_tokens: int = HISTORY_MAX_TOKENS) -> str:
+        """Bounded conversation context of a session (see render_window)."""
+        summary, turns = self.load(user_id, session_id)
+        return render_window(summary, turns, max_tokens)
+
+    def append_turn(self, user_id: str, session_id: str, question: str, answer: str) -> bool:
+        """
+        Record a question and its answer.
+
+        Returns:
+            True when the stored turns no longer fit the window and should be
+            folded into the summary (see compact)
+        """
+        with self._session_locks[(user_id, session_id)]:
+            summary, turns = self.load(user_id, session_id)
+            turns = turns + [
+                ("user", truncate_tokens(question, TURN_MAX_TOKENS)),
+                ("assistant", truncate_tokens(answer, TURN_MAX_TOKENS)),
+            ]
+            self._save(user_id, session_id, summary, turns)
+        return self._turn_tokens(turns) > HISTORY_MAX_TOKENS - SUMMARY_MAX_TOKENS
+
+    @staticmethod
+    def _turn_tokens(turns: List[Turn]) -> int:
+        return sum(count_tokens(_render_turn(turn)) for turn in turns)
+
+    def compact(self, user_id: str, session_id: str, llm) -> None:
+        """Fold the oldest turns into the summary until the rest fit the window."""
+        with self._session_locks[(user_id, session_id)]:
+            summary, turns = self.load(user_id, session_id)
+            budget = HISTORY_MAX_TOKENS - SUMMARY_MAX_TOKENS
+            split = 0
+            # Always keep the latest exchange verbatim
+            while split < len(turns) - 2 and self._turn_tokens(turns[split:]) > budget:
+                split += 2
+            if split == 0:
+                return
+
+            result = (SUMMARY_PROMPT | llm).invoke({
+                "summary": summary or "(none)",
+                "turns": "\n".join(_render_turn(turn) for turn in turns[:split]),
+                "max_words": SUMMARY_MAX_TOKENS * 3 // 4,
+            })
+            summary = truncate_tokens(result.content.strip(), SUMMARY_MAX_TOKENS)
+            self._save(user_id, session_id, summary, turns[split:])
+
+    def delete(self, user_id: str, session_id: str) -> None:
+        """Forget a session."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE user_id = ? AND session_id = ?", (user_id, session_id)
+            )
+
+
+_memory: Optional[SessionMemory] = None
+_memory_lock = threading.Lock()
+
+
+def get_session_memory() -> SessionMemory:
+    """The process-wide session store."""
+    global _memory
+    with _memory_lock:
+        if _memory is None:
+            _memory = SessionMemory()
+        return _memory
@@ -2,27 +2,48 @@
 Multi-Agent Orchestrator using LangGraph.
 """
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 from langgraph.graph import StateGraph, END
 
-from .state import AgentState
+from .dispatcher import dispatched
+from .llm import get_llm
+from .llm_cache import with_cache
+from .state import AgentState, RetrievedDocument
 from .retriever import create_retriever_agent
 from .reasoner import create_reasoner_agent
 from .explainer import create_explainer_agent
 
 
-def build_graph(vector_db=None, model_name="gpt-4o-mini", temperature=0):
+def build_graph(
+    vector_db=None,
+    model_name="gpt-4o-mini",
+    temperature=0,
+    search_kwargs=None,
+    llm=None,
+    clause_lookup=None
+):
     """
     Build the multi-agent workflow graph.
 
     Flow: Retriever -> Reasoner -> Explainer
+
+    llm overrides the chat model picked by LLM_PROVIDER (see agents/llm.py);
+    either way its calls go through the dispatcher (agents/dispatcher.py),
+    with each stage's timeout.
+    clause_lookup lets the retriever rank first the chunks of the clause
+    types a query names (see utils.user_index.clause_lookup).
     """
-    llm = ChatOpenAI(model=model_name, temperature=temperature)
+    llm = llm or get_llm(model_name, temperature)
+
+    def stage_llm(stage: str):
+        # The model dispatched with the stage's timeout, the persistent response cache attached
+        return with_cache(dispatched(llm, stage=stage), stage)
 
-    retriever = create_retriever_agent(vector_db, llm)
-    reasoner = create_reasoner_agent(llm)
-    explainer = create_explainer_agent(llm)
+    retriever = create_retriever_agent(
+        vector_db, stage_llm("retriever"), search_kwargs=search_kwargs, clause_lookup=clause_lookup
+    )
+    reasoner = create_reasoner_agent(stage_llm("reasoner"), vector_db)
+    explainer = create_explainer_agent(stage_llm("explainer"))
 
     workflow = StateGraph(AgentState)
 
@@ -38,17 +59,38 @@ def build_graph(vector_db=None, model_name="gpt-4o-mini", temperature=0):
     return workflow.compile()
 
 
-def run_query(app, query: str) -> dict:
-    """Run a query through the multi-agent system."""
+def run_query(
+    app,
+    query: str,
+    documents: list[RetrievedDocument] = None,
+    conversation: str = "",
+    callbacks: list = None,
+    session_id: str = ""
+) -> dict:
+    """
+    Run a query through the multi-agent system.
+
+    documents: already retrieved documents (see retriever.document_refs);
+    the retriever then skips its own search.
+    conversation: window of the earlier turns of a chat (see
+    agents.memory.render_window), so follow-up questions can be resolved.
+    callbacks: LangChain callback handlers every chain call reports to
+    (e.g. agents.usage.UsageCallback).
+    session_id: chat session of the query, whose documents the clause
+    lookup is limited to.
+    """
     initial_state = {
         "user_query": query,
-        "retrieved_documents": [],
+        "session_id": session_id or "",
+        "conversation": conversation,
+        "documents": documents or [],
+        "claims": [],
         "reasoning_chain": [],
         "verification_status": "",
         "final_explanation": "",
         "messages": [HumanMessage(content=query)]
     }
-    return app.invoke(initial_state)
+    return app.invoke(initial_state, config={"callbacks": callbacks} if callbacks else None)
 
 
 def format_response(state: dict) -> str:
@@ -58,7 +100,7 @@ def format_response(state: dict) -> str:
         "LEGAL ASSISTANT ANALYSIS",
         "=" * 60,
         f"\nQUESTION: {state['user_query']}\n",
-        f"DOCUMENTS: Found {len(state['retrieved_documents'])} relevant documents\n",
+        f"DOCUMENTS: Found {len(state['documents'])} relevant documents\n",
         f"STATUS: {state['verification_status']}\n",
         "EXPLANATION:",
         "-" * 60,
@@ -2,65 +2,120 @@
 Reasoner Agent: Constructs verifiable logical connections.
 """
 
+from typing import Literal
+
+from langchain_core.exceptions import OutputParserException
 from langchain_core.messages import AIMessage
 from langchain_core.prompts import ChatPromptTemplate
+from pydantic import BaseModel, Field
 
+from utils.metrics import timed
 
-def create_reasoner_agent(llm):
-    """
-    Create a Reasoner Agent that analyzes and verifies legal information.
-    """
+from .memory import conversation_block
+from .retriever import render_documents
+from .state import Claim
+
+
+Status = Literal["VERIFIED", "PARTIALLY_VERIFIED", "INSUFFICIENT_EVIDENCE"]
 
-    def reason(state: dict) -> dict:
-        query = state["user_query"]
-        documents = state["retrieved_documents"]
 
-        reasoning_prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a legal reasoning specialist.
+class ClaimOutput(BaseModel):
+    statement: str = Field(description="One statement answering part of the query, in a sentence")
+    documents: list[int] = Field(description="Numbers n of the [Document n] entries that support it")
+
+
+class ReasoningOutput(BaseModel):
+    """Structured reply of the reasoner."""
+    concepts: list[str] = Field(description="Key legal concepts involved, a few words each")
+    claims: list[ClaimOutput] = Field(description="Claims supported by the evidence, with citations")
+    gaps: list[str] = Field(description="What the evidence does not establish")
+    status: Status = Field(
+        description="VERIFIED if the claims fully answer the query, PARTIALLY_VERIFIED if only in part, "
+                    "INSUFFICIENT_EVIDENCE if the evidence does not answer it"
+    )
+
+
+REASONING_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are a legal reasoning specialist.
 1. Analyze retrieved legal documents
 2. Identify relevant clauses and terms
-3. Construct logical chains with citations
+3. State claims that answer the query, citing the documents that support each
 4. Verify claims against evidence
 5. Flag gaps or uncertainties
 
-IMPORTANT: Only cite supported claims. Do NOT provide legal advice."""),
-            ("human", """Query: {query}
+IMPORTANT: Only cite supported claims. Do NOT provide legal advice.
+Keep every item short."""),
+    ("human", """{conversation}Query: {query}
 
 Evidence:
-{documents}
-
-Provide:
-1. Key Legal Concepts
-2. Evidence with Citations
-3. Logical Connections
-4. Verification Status
-5. Gaps/Uncertainties""")
-        ])
-
-        chain = reasoning_prompt | llm
-        result = chain.invoke({
-            "query": query,
-            "documents": "\n\n".join(documents)
-        })
-
-        reasoning_chain = [
-            step.strip() for step in result.content.split("\n") if step.strip()
-        ]
-
-        content_lower = result.content.lower()
-        if "insufficient" in content_lower or "not supported" in content_lower:
-            status = "INSUFFICIENT_EVIDENCE"
-        elif "partially" in content_lower:
-            status = "PARTIALLY_VERIFIED"
-        else:
-            status = "VERIFIED"
+{documents}""")
+])
+
+
+def _verification_status(output: ReasoningOutput, claims: list[Claim]) -> Status:
+    """
+    The model's status, made consistent with its own result: no cited claim
+    means insufficient evidence, open gaps mean at most partial verification.
+    """
+    if not claims:
+        return "INSUFFICIENT_EVIDENCE"
+    if output.status == "VERIFIED" and output.gaps:
+        return "PARTIALLY_VERIFIED"
+    return output.status
+
+
+def _reasoning_lines(output: ReasoningOutput, claims: list[Claim], numbers: list[list[int]]) -> list[str]:
+    """Compact rendering of the result for the explainer and the API."""
+    lines = []
+    if output.concepts:
+        lines.append("Concepts: " + "; ".join(output.concepts))
+    for claim, cited in zip(claims, numbers):
+        lines.append(f"Claim: {claim['statement']} [Documents {', '.join(map(str, cited))}]")
+    lines.extend(f"Gap: {gap}" for gap in output.gaps)
+    return lines
+
+
+def create_reasoner_agent(llm, vector_db=None):
+    """
+    Create a Reasoner Agent that analyzes and verifies legal information.
+
+    vector_db is the store the retrieved documents' texts are read from.
+    The model replies with a ReasoningOutput; claims citing no retrieved
+    document are dropped and the remaining citations become docstore ids.
+    """
+    chain = REASONING_PROMPT | llm.with_structured_output(ReasoningOutput)
+
+    def reason(state: dict) -> dict:
+        query = state["user_query"]
+        documents = state["documents"]
+
+        try:
+            with timed("reasoner.llm"):
+                output = chain.invoke({
+                    "query": query,
+                    "conversation": conversation_block(state.get("conversation")),
+                    "documents": "\n\n".join(render_documents(vector_db, documents))
+                })
+        except OutputParserException as e:
+            print(f"Reasoner returned malformed output: {e}")
+            output = ReasoningOutput(concepts=[], claims=[], gaps=["The analysis failed."], status="INSUFFICIENT_EVIDENCE")
+
+        claims, numbers = [], []
+        for claim in output.claims:
+            cited = sorted({n for n in claim.documents if 1 <= n <= len(documents)})
+            if cited:
+                claims.append({"statement": claim.statement, "documents": [documents[n - 1]["id"] for n in cited]})
+                numbers.append(cited)
+
+        status = _verification_status(output, claims)
+        reasoning_chain = _reasoning_lines(output, claims, numbers)
 
         return {
-            **state,
+            "claims": claims,
             "reasoning_chain": reasoning_chain,
             "verification_status": status,
-            "messages": state["messages"] + [
-                AIMessage(content=f"[Reasoner] Status: {status}\n\n{result.content}")
+            "messages": [
+                AIMessage(content=f"[Reasoner] Status: {status}\n\n" + "\n".join(reasoning_chain))
             ]
         }
 
@@ -2,32 +2,129 @@
 Retriever Agent: Searches for relevant legal documents.
 """
 
+from langchain_core.documents import Document
 from langchain_core.messages import AIMessage
 from langchain_core.prompts import ChatPromptTemplate
 
+from utils.clauses import expand_query
+from utils.metrics import timed
+from utils.vectorstore import batch_fused_similarity_search, fused_similarity_search
 
-def create_retriever_agent(vector_db, llm):
+from .memory import CONDENSE_PROMPT, conversation_block
+from .state import RetrievedDocument
+
+
+# How deep a search goes when the chunks of the clause types a query names are ranked first
+CLAUSE_CANDIDATES = 20
+
+
+def format_documents(docs) -> list[str]:
+    """Render retrieved documents the way the agents cite them."""
+    return [
+        f"[Document {i}] {doc.page_content[:1500]}"
+        for i, doc in enumerate(docs, 1)
+    ]
+
+
+def document_refs(docs_and_scores) -> list[RetrievedDocument]:
+    """State entries for (Document, score) pairs, as similarity_search_with_score returns them."""
+    return [{"id": doc.id, "score": float(score)} for doc, score in docs_and_scores]
+
+
+def render_documents(vector_db, documents: list[RetrievedDocument]) -> list[str]:
+    """
+    Texts of the documents in the state, read from the vector store's docstore
+    and formatted by format_documents. Numbering follows the state's order.
+    """
+    if vector_db is None:
+        return ["No vector database available."]
+    docs = [vector_db.docstore.search(document["id"]) for document in documents]
+    # A missing id comes back as an error string (chunk compacted away meanwhile)
+    return format_documents([
+        doc if not isinstance(doc, str) else Document(page_content="(removed from the index)")
+        for doc in docs
+    ])
+
+
+def batch_search_documents(
+    vector_db, queries: list[str], search_kwargs=None, clause_lookup=None, session_id=None
+) -> list[list[RetrievedDocument]]:
+    """
+    State entries of the chunks each query retrieves: the top 5 of a vector
+    search for the query and its rephrasings (expand_query), fused, with all
+    queries embedded in one pass and searched with one FAISS call.
+
+    clause_lookup(query, session_id) gives the ids of the chunks classified
+    under the clause types a query names (see utils.user_index.clause_lookup);
+    those found among the top CLAUSE_CANDIDATES results rank first. Both
+    groups keep their order of similarity to the query.
+    """
+    if vector_db is None:
+        return [[] for _ in queries]
+
+    clause_chunks = [set() for _ in queries]
+    if clause_lookup is not None:
+        with timed("retriever.clause_lookup"):
+            clause_chunks = [clause_lookup(query, session_id) for query in queries]
+    depth = CLAUSE_CANDIDATES if clause_lookup is not None else 5
+    search_kwargs = search_kwargs or {}
+
+    with timed("retriever.search"):
+        if len(queries) == 1:
+            results = [fused_similarity_search(vector_db, expand_query(queries[0]), k=depth, **search_kwargs)]
+        else:
+            results = batch_fused_similarity_search(
+                vector_db, [expand_query(query) for query in queries], depth, **search_kwargs
+            )
+    return [
+        document_refs(sorted(docs, key=lambda pair: pair[0].id not in chunks)[:5])
+        for docs, chunks in zip(results, clause_chunks)
+    ]
+
+
+def search_documents(
+    vector_db, query: str, search_kwargs=None, clause_lookup=None, session_id=None
+) -> list[RetrievedDocument]:
+    """batch_search_documents for one query."""
+    return batch_search_documents(vector_db, [query], search_kwargs, clause_lookup, session_id)[0]
+
+
+def create_retriever_agent(vector_db, llm, search_kwargs=None, clause_lookup=None):
     """
     Create a Retriever Agent that searches and reranks legal documents.
+
+    search_kwargs are passed to similarity_search_with_score (e.g. a metadata
+    filter). Documents already in the state (fetched by a batched search) are
+    reranked without searching again. clause_lookup(query, session_id) gives
+    the chunks of the clause types a query names, ranked first among the
+    search results of the state's session (see search_documents). In a
+    conversation, the question is first rewritten into a standalone search
+    query.
     """
 
     def retrieve(state: dict) -> dict:
         query = state["user_query"]
+        conversation = conversation_block(state.get("conversation"))
+        documents = state.get("documents")
 
-        if vector_db is not None:
-            docs = vector_db.similarity_search(query, k=5)
-            retrieved_texts = [
-                f"[Document {i}] {doc.page_content[:1500]}"
-                for i, doc in enumerate(docs, 1)
-            ]
-        else:
-            retrieved_texts = ["No vector database available."]
+        if not documents:
+            search_query = query
+            if conversation:
+                with timed("retriever.condense"):
+                    condensed = (CONDENSE_PROMPT | llm).invoke({"conversation": conversation, "query": query})
+                search_query = condensed.content.strip() or query
+
+            documents = search_documents(
+                vector_db, search_query, search_kwargs, clause_lookup, state.get("session_id") or None
+            )
+
+        retrieved_texts = render_documents(vector_db, documents or [])
 
         rerank_prompt = ChatPromptTemplate.from_messages([
             ("system", """You are a legal document retrieval specialist.
 Analyze the retrieved documents and identify which are most relevant.
 Return a brief summary of key findings."""),
-            ("human", """Query: {query}
+            ("human", """{conversation}Query: {query}
 
 Documents:
 {documents}
@@ -38,15 +135,16 @@ Provide:
         ])
 
         chain = rerank_prompt | llm
-        result = chain.invoke({
-            "query": query,
-            "documents": "\n\n".join(retrieved_texts)
-        })
+        with timed("retriever.llm"):
+            result = chain.invoke({
+                "query": query,
+                "conversation": conversation,
+                "documents": "\n\n".join(retrieved_texts)
+            })
 
         return {
-            **state,
-            "retrieved_documents": retrieved_texts,
-            "messages": state["messages"] + [
+            "documents": documents or [],
+            "messages": [
                 AIMessage(content=f"[Retriever] Found {len(retrieved_texts)} documents.\n{result.content}")
             ]
         }
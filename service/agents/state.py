@@ -7,10 +7,34 @@ from langchain_core.messages import BaseMessage
 import operator
 
 
+class RetrievedDocument(TypedDict):
+    """A retrieved chunk: its docstore id in the vector store and search score."""
+    id: str
+    score: float
+
+
+class Claim(TypedDict):
+    """A statement the reasoner found support for, with the ids of the supporting documents."""
+    statement: str
+    documents: list[str]
+
+
 class AgentState(TypedDict):
-    """State shared between agents in the workflow."""
+    """
+    State shared between agents in the workflow.
+
+    Nodes return only the keys they change. Retrieved chunks are referenced
+    by id; their text stays in the vector store's docstore and is rendered
+    into prompts on demand (see agents.retriever.render_documents).
+    """
     user_query: str
-    retrieved_documents: list[str]
+    # Chat session the question comes from ("" if none): scopes the clause lookup
+    session_id: str
+    # Bounded window of earlier turns and their summary (see agents/memory.py)
+    conversation: str
+    documents: list[RetrievedDocument]
+    claims: list[Claim]
+    # Compact rendering of the reasoner's structured result, one line per item
     reasoning_chain: list[str]
     verification_status: str
     final_explanation: str
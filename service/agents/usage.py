@@ -0,0 +1,125 @@
+"""
+Per-user daily LLM token budgets.
+
+Every chain call of a query reports its token usage (usage_metadata, as
+ChatOpenAI and the fake model return it) to a UsageCallback, which adds it
+to the user's total for the day (UTC) in a SQLite file shared by all worker
+processes. Answers served from the LLM cache cost nothing and are not
+counted. Once a user has spent DAILY_TOKEN_BUDGET tokens, the API turns
+their queries away with 429 until the day ends; a query admitted under the
+budget runs to completion, so a user can overshoot it by one query.
+"""
+
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils import metrics
+
+
+# Tokens a user may spend per day, 0 for no limit
+DAILY_TOKEN_BUDGET = int(os.getenv("DAILY_TOKEN_BUDGET", "200000"))
+TOKEN_USAGE_PATH = Path(
+    os.getenv("TOKEN_USAGE_PATH", str(Path(__file__).parent.parent / "data" / "token_usage.sqlite"))
+)
+# Days of usage kept in the file
+_KEEP_DAYS = 7
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def seconds_until_reset() -> int:
+    """Seconds until the budgets reset, at the next UTC midnight."""
+    now = datetime.now(timezone.utc)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), timezone.utc)
+    return max(1, int((midnight - now).total_seconds()) + 1)
+
+
+class TokenUsage:
+    """Tokens spent per (user, day), stored in SQLite."""
+
+    def __init__(self, path: Path = TOKEN_USAGE_PATH, budget: int = DAILY_TOKEN_BUDGET):
+        self.path = Path(path)
+        self.budget = budget
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS token_usage ("
+            " user_id TEXT NOT NULL, day TEXT NOT NULL, tokens INTEGER NOT NULL, PRIMARY KEY (user_id, day))"
+        )
+        self._pruned = None
+
+    def used(self, user_id: str) -> int:
+        """Tokens the user spent today."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tokens FROM token_usage WHERE user_id = ? AND day = ?", (user_id, _today())
+            ).fetchone()
+        return row[0] if row else 0
+
+    def remaining(self, user_id: str) -> Optional[int]:
+        """Tokens left in the user's budget today, or None without a budget."""
+        if not self.budget:
+            return None
+        return max(0, self.budget - self.used(user_id))
+
+    def add(self, user_id: str, tokens: int) -> None:
+        """Count tokens the user spent just now."""
+        if tokens <= 0:
+            return
+        day = _today()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO token_usage (user_id, day, tokens) VALUES (?, ?, ?) "
+                "ON CONFLICT (user_id, day) DO UPDATE SET tokens = tokens + excluded.tokens",
+                (user_id, day, tokens)
+            )
+            if self._pruned != day:
+                cutoff = (datetime.now(timezone.utc).date() - timedelta(days=_KEEP_DAYS)).isoformat()
+                self._conn.execute("DELETE FROM token_usage WHERE day < ?", (cutoff,))
+                self._pruned = day
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Adds the tokens of every LLM call it sees to a user's daily usage."""
+
+    def __init__(self, user_id: str, usage: Optional[TokenUsage] = None):
+        self.user_id = user_id
+        self.usage = usage or get_token_usage()
+        self.tokens = 0
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                # LangChain marks replies served from the cache with a zero cost
+                if usage.get("total_cost") == 0:
+                    continue
+                tokens += usage.get("total_tokens", 0)
+        if tokens:
+            self.tokens += tokens
+            self.usage.add(self.user_id, tokens)
+            metrics.increment("llm.tokens", tokens)
+
+
+_usage: Optional[TokenUsage] = None
+_usage_lock = threading.Lock()
+
+
+def get_token_usage() -> TokenUsage:
+    """The process-wide usage store."""
+    global _usage
+    with _usage_lock:
+        if _usage is None:
+            _usage = TokenUsage()
+        return _usage
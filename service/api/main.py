@@ -1,25 +1,47 @@
+import asyncio
+import json
 import os
-import io
-import docx
+import sys
+import threading
+import time
 import uvicorn
 
 from pathlib import Path
+from typing import Optional
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import BackgroundTasks, FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from PyPDF2 import PdfReader
 
-from agents import build_graph, run_query
+# The agent stack (LangChain, LangGraph, the embedding model) is imported in
+# functions: the startup warmup loads it in the background, so the process
+# answers /health/live right away
+from api.uploads import UploadSizeLimitMiddleware, spool_upload
 from utils import (
     get_embedder,
+    get_query_embedder,
     load_vectorstore,
     save_vectorstore,
     build_vectorstore,
-    chunk_text
+    index_exists,
+    index_user_document,
+    user_index_path,
+    SUPPORTED_EXTENSIONS
 )
+from utils import metrics
+from utils.user_index import (
+    clause_lookup,
+    compact_user_index,
+    merge_user_index,
+    remove_user_documents,
+    tombstone_filter,
+    user_index_version
+)
+from utils.extraction import shutdown_pool
 
 # os.environ["TOKENIZERS_PARALLELISM"] = "false"
 load_dotenv()
@@ -30,13 +52,52 @@ VECTOR_DB_PATH = os.getenv(
     str(SERVICE_ROOT.parent / "data" / "embeddings" / "faiss_index")
 )
 INDEX_PATH = Path(VECTOR_DB_PATH)
+# Build the shared index from CUAD at startup when it is missing
+AUTO_BUILD_INDEX = os.getenv("AUTO_BUILD_INDEX", "1") == "1"
+# Map index vectors from disk instead of reading them into memory, so the
+# workers of the pre-fork server (api/server.py) share one copy
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+
+# /query/batch: most questions per request, and questions in the LLM stages at once
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "64"))
+QUERY_BATCH_CONCURRENCY = int(os.getenv("QUERY_BATCH_CONCURRENCY", "4"))
 
 ml_agent = None
 vector_db = None
+# user_id -> (agent, vector store, search kwargs, clause lookup, index version)
+user_agents = {}
+_agent_lock = threading.Lock()
+
+# Bumped by reload_indexes when the shared index was rebuilt; the shared
+# index and agent are reloaded on next use when older
+index_generation = 0
+_loaded_generation = 0
+# Set by preload(), in the pre-fork server's master: startup work the workers inherit
+preloaded = False
+
+# Background startup work; /health/ready answers 200 once it has finished
+warmup = {"state": "starting", "seconds": None, "error": None}
+
+
+class ChatTurn(BaseModel):
+    role: str  # "user" or "assistant"
+    content: str
 
 
 class QueryRequest(BaseModel):
     query: str
+    user_id: Optional[str] = None
+    # Earlier turns are taken from `history` when given, else from the
+    # service's memory of `session_id`, which the answer is then added to
+    session_id: Optional[str] = None
+    history: Optional[list[ChatTurn]] = None
+
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str]
+    user_id: Optional[str] = None
+    # Chat session whose documents the clause lookup is limited to
+    session_id: Optional[str] = None
 
 
 class QueryResponse(BaseModel):
@@ -47,26 +108,149 @@ class QueryResponse(BaseModel):
     final_explanation: str
 
 
+def reload_indexes(signum=None, frame=None):
+    """
+    Reload the shared index on next use.
+
+    The pre-fork server relays SIGHUP to this handler in each worker once
+    the shared index was rebuilt (user indexes need no signal, see
+    _lazy_load_user_index). Safe in a signal handler: it only bumps a counter.
+    """
+    global index_generation
+    index_generation += 1
+
+
+def _load_shared_index():
+    """The shared vector store, (re)loaded if missing or older than index_generation (_agent_lock held)."""
+    global vector_db, _loaded_generation
+
+    if vector_db is None or _loaded_generation != index_generation:
+        generation = index_generation
+        print(f"Loading vector index from {INDEX_PATH}...")
+        vector_db = load_vectorstore(str(INDEX_PATH), get_query_embedder(), mmap=INDEX_MMAP)
+        _loaded_generation = generation
+    return vector_db
+
+
 def _lazy_load_agent():
     """Load agent only when first needed."""
-    global ml_agent, vector_db
+    global ml_agent
+
+    with _agent_lock:
+        if ml_agent is not None and _loaded_generation == index_generation:
+            return ml_agent
+
+        if not index_exists(INDEX_PATH):
+            raise RuntimeError(
+                f"Vector index not found at {INDEX_PATH}. "
+                "Please upload a document first or wait for index to build."
+            )
+
+        from agents import build_graph
+
+        print(f"Loading ML agent from {INDEX_PATH}...")
+        ml_agent = build_graph(vector_db=_load_shared_index())
+        print("ML agent loaded!")
 
-    if ml_agent is not None:
         return ml_agent
 
-    if not INDEX_PATH.exists():
-        raise RuntimeError(
-            f"Vector index not found at {INDEX_PATH}. "
-            "Please upload a document first or wait for index to build."
-        )
 
-    print(f"Loading ML agent from {INDEX_PATH}...")
-    embedder = get_embedder()
-    vector_db = load_vectorstore(str(INDEX_PATH), embedder)
-    ml_agent = build_graph(vector_db=vector_db)
-    print("ML agent loaded!")
+def _lazy_load_user_index(user_id: Optional[str]):
+    """
+    Load an agent over a user's own index, falling back to the shared one.
+
+    A cached agent is reused while the user's index and registry are
+    unchanged; uploads and deletions handled by other worker processes
+    change their version too.
+
+    Returns:
+        (agent, vector store, search kwargs the agent searches with,
+        clause lookup or None)
+    """
+    if not user_id or not index_exists(user_index_path(user_id)):
+        agent = _lazy_load_agent()
+        return agent, vector_db, {}, None
+
+    version = user_index_version(user_id)
+    cached = user_agents.get(user_id)
+    if cached is not None and cached[4] == version:
+        return cached[:4]
+
+    from agents import build_graph
+
+    print(f"Loading ML agent for user {user_id}...")
+    user_db = load_vectorstore(str(user_index_path(user_id)), get_query_embedder(), mmap=INDEX_MMAP)
+    search_kwargs = {"filter": tombstone_filter(user_id), "fetch_k": 20}
+    lookup = clause_lookup(user_id)
+    agent = build_graph(vector_db=user_db, search_kwargs=search_kwargs, clause_lookup=lookup)
+    user_agents[user_id] = (agent, user_db, search_kwargs, lookup, version)
+
+    return agent, user_db, search_kwargs, lookup
+
+
+def _build_shared_index():
+    """Build the shared index from the CUAD dataset (first deployment)."""
+    print("Vector index not found. Building index from CUAD dataset...")
+    try:
+        from utils import load_documents
+
+        # Build with a reasonable number of contracts
+        print("Loading documents...")
+        texts, metadatas = load_documents(str(SERVICE_ROOT / "data"), max_contracts=20)
+
+        print("Creating embeddings...")
+        embedder = get_embedder()
+        vector_db_temp = build_vectorstore(texts, metadatas, embedder)
+
+        print(f"Saving index to {INDEX_PATH}...")
+        save_vectorstore(vector_db_temp, str(INDEX_PATH))
+        print("Index built successfully!")
+    except Exception as e:
+        print(f"Warning: Could not auto-build index: {e}")
+        print("Service will work with user-uploaded documents only.")
+
+
+def preload():
+    """
+    Startup work of the pre-fork server (api/server.py), done once in its
+    master process before it forks the workers: build the shared index if
+    missing, import the agent stack, load the embedding model and the shared
+    index. Workers inherit all of it copy-on-write. Nothing that opens
+    network clients is created here; each worker's warmup does the rest.
+    """
+    global preloaded
 
-    return ml_agent
+    start = time.perf_counter()
+    if not index_exists(INDEX_PATH) and AUTO_BUILD_INDEX:
+        _build_shared_index()
+    import agents  # noqa: F401 (LangChain and LangGraph)
+    get_embedder()
+    if index_exists(INDEX_PATH):
+        with _agent_lock:
+            _load_shared_index()
+    preloaded = True
+    print(f"Preload done in {time.perf_counter() - start:.1f}s")
+
+
+def _warmup():
+    """
+    Startup work, off the event loop: build the shared index if missing,
+    load the embedding model and the agent stack, and the shared agent.
+    After preload() only what each process needs of its own is left.
+    """
+    start = time.perf_counter()
+    try:
+        if not preloaded and not index_exists(INDEX_PATH) and AUTO_BUILD_INDEX:
+            _build_shared_index()
+        get_query_embedder().embed_query("warm up")
+        import agents  # noqa: F401 (LangChain and LangGraph)
+        if index_exists(INDEX_PATH):
+            _lazy_load_agent()
+        warmup.update(state="ready", seconds=time.perf_counter() - start)
+        print(f"Warmup done in {warmup['seconds']:.1f}s")
+    except Exception as e:
+        warmup.update(state="failed", seconds=time.perf_counter() - start, error=str(e))
+        print(f"Warmup failed: {e}")
 
 
 @asynccontextmanager
@@ -74,29 +258,12 @@ async def lifespan(app: FastAPI):
     print("ML Agent Service starting...")
     print(f"Vector DB path: {INDEX_PATH}")
 
-    # Auto-build index on first deployment if it doesn't exist
-    if not INDEX_PATH.exists():
-        print("Vector index not found. Building index from CUAD dataset...")
-        try:
-            from utils import load_documents, save_vectorstore
-
-            # Build with a reasonable number of contracts
-            print("Loading documents...")
-            texts, metadatas = load_documents(str(SERVICE_ROOT / "data"), max_contracts=20)
-
-            print("Creating embeddings...")
-            embedder = get_embedder()
-            vector_db_temp = build_vectorstore(texts, metadatas, embedder)
-
-            print(f"Saving index to {INDEX_PATH}...")
-            save_vectorstore(vector_db_temp, str(INDEX_PATH))
-            print("Index built successfully!")
-        except Exception as e:
-            print(f"Warning: Could not auto-build index: {e}")
-            print("Service will work with user-uploaded documents only.")
+    warmup_task = asyncio.create_task(run_in_threadpool(_warmup))
 
     yield
     print("Shutting down ML Agent Service...")
+    warmup_task.cancel()
+    shutdown_pool()
 
 
 app = FastAPI(
@@ -110,6 +277,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(UploadSizeLimitMiddleware)
 
 
 @app.get("/")
@@ -123,38 +291,225 @@ def root():
 
 @app.get("/health")
 def health():
+    # Importing the agents (LangGraph, LangChain) takes longer than a health
+    # check may; until a query has loaded them, no LLM call was made either
+    dispatcher = sys.modules.get("agents.dispatcher")
     return {
         "status": "healthy" if ml_agent else "degraded",
+        "pid": os.getpid(),
+        "llm_breaker": dispatcher.get_dispatcher().breaker.state if dispatcher else "unknown",
+        "warmup": warmup["state"],
         "vector_db_loaded": vector_db is not None,
-        "index_exists": INDEX_PATH.exists(),
+        "index_exists": index_exists(INDEX_PATH),
         "index_path": str(INDEX_PATH)
     }
 
 
+@app.get("/health/live")
+async def health_live():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: the startup warmup has finished (503 until then, or if it failed)."""
+    body = {"status": warmup["state"], "warmup_seconds": warmup["seconds"], "error": warmup["error"]}
+    if warmup["state"] != "ready":
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+def _query_response(result: dict, db) -> QueryResponse:
+    """API response for a finished graph run over the vector store db."""
+    from agents import render_documents
+
+    return QueryResponse(
+        query=result["user_query"],
+        retrieved_documents=render_documents(db, result["documents"]),
+        reasoning_chain=result["reasoning_chain"],
+        verification_status=result["verification_status"],
+        final_explanation=result["final_explanation"]
+    )
+
+
+def _conversation(request: QueryRequest) -> str:
+    """Bounded window of the earlier turns of a query's conversation."""
+    from agents.memory import get_session_memory, render_window
+
+    if request.history is not None:
+        return render_window("", [(turn.role, turn.content) for turn in request.history])
+    if request.session_id:
+        return get_session_memory().window(request.user_id or "", request.session_id)
+    return ""
+
+
+def _check_budget(user_id: Optional[str]):
+    """429 with Retry-After once the user has spent today's token budget (see agents/usage.py)."""
+    from agents.usage import get_token_usage, seconds_until_reset
+
+    if get_token_usage().remaining(user_id or "") == 0:
+        metrics.increment("budget.rejected")
+        raise HTTPException(
+            status_code=429,
+            detail="Daily token budget exhausted",
+            headers={"Retry-After": str(seconds_until_reset())}
+        )
+
+
+def _run_or_degrade(agent, db, query: str, documents=None, search_kwargs=None, lookup=None, **kwargs) -> dict:
+    """
+    run_query, or a retrieval-only answer (agents/fallback.py) when the LLM
+    is unavailable: at once while the circuit breaker is open, else once a
+    call of the query timed out or failed.
+    """
+    from agents import run_query
+    from agents.dispatcher import LLMUnavailableError, llm_available
+    from agents.fallback import retrieval_only_result
+
+    reason = "the language model is unavailable (circuit breaker open)"
+    if llm_available():
+        try:
+            with metrics.timed("query.graph"):
+                return run_query(agent, query, documents, **kwargs)
+        except LLMUnavailableError as e:
+            reason = str(e)
+    metrics.increment("query.degraded")
+    with metrics.timed("query.degraded"):
+        return retrieval_only_result(
+            db, query, documents, search_kwargs, lookup, reason=reason, session_id=kwargs.get("session_id")
+        )
+
+
+def _summarize_session(user_id: str, session_id: str):
+    from agents.dispatcher import BATCH, LLMUnavailableError, dispatch_as, dispatched
+    from agents.llm import get_llm
+    from agents.llm_cache import with_cache
+    from agents.memory import get_session_memory
+    from agents.usage import UsageCallback
+
+    llm = with_cache(dispatched(get_llm(), stage="summarizer"), "summarizer").with_config(callbacks=[UsageCallback(user_id)])
+    # Nobody waits for the summary: it queues behind chat
+    with dispatch_as(BATCH, user_id):
+        try:
+            get_session_memory().compact(user_id, session_id, llm)
+        except LLMUnavailableError as e:
+            # The turns stay as they are; the next turn tries again
+            print(f"Session summary skipped: {e}")
+
+
 @app.post("/query", response_model=QueryResponse)
-def query_agent(request: QueryRequest):
+def query_agent(request: QueryRequest, background_tasks: BackgroundTasks):
+    """
+    Answer a question with the agents. While the LLM is unavailable, the
+    answer is the top retrieved passages, verification_status UNVERIFIED.
+    """
+    from agents.dispatcher import INTERACTIVE, dispatch_as
+    from agents.explainer import DISCLAIMER
+    from agents.memory import get_session_memory
+    from agents.usage import UsageCallback
+
     if not request.query.strip():
         raise HTTPException(status_code=400, detail="Query cannot be empty")
+    _check_budget(request.user_id)
 
     try:
-        agent = _lazy_load_agent()
+        agent, db, search_kwargs, lookup = _lazy_load_user_index(request.user_id)
+
+        with dispatch_as(INTERACTIVE, request.user_id):
+            result = _run_or_degrade(
+                agent, db, request.query.strip(), search_kwargs=search_kwargs, lookup=lookup,
+                conversation=_conversation(request), callbacks=[UsageCallback(request.user_id or "")],
+                session_id=request.session_id or ""
+            )
+
+        if request.session_id and request.history is None:
+            user_id = request.user_id or ""
+            needs_summary = get_session_memory().append_turn(
+                user_id, request.session_id, result["user_query"], result["final_explanation"].removesuffix(DISCLAIMER)
+            )
+            if needs_summary:
+                background_tasks.add_task(_summarize_session, user_id, request.session_id)
 
-        result = run_query(agent, request.query.strip())
-        return QueryResponse(
-            query=result["user_query"],
-            retrieved_documents=result["retrieved_documents"],
-            reasoning_chain=result["reasoning_chain"],
-            verification_status=result["verification_status"],
-            final_explanation=result["final_explanation"]
+        return _query_response(result, db)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+
+
+@app.post("/query/batch")
+async def query_batch(request: BatchQueryRequest):
+    """
+    Run many questions over the same index, streaming results as they finish.
+
+    All questions, with their rephrasings (query expansion), are embedded in
+    one pass and searched with one FAISS call; the chunks of the clause types
+    a question names (of session_id's documents, when given) rank first.
+    Their LLM stages then run concurrently, at most QUERY_BATCH_CONCURRENCY
+    questions at a time, their LLM calls at batch priority. The response is
+    NDJSON in completion order: a QueryResponse plus the question's "index"
+    in the request, or
+    {"index", "query", "error"} for a question that failed. Questions not
+    started yet when the user's token budget runs out fail; while the LLM is
+    unavailable, questions get retrieval-only answers, as /query does.
+    """
+    queries = [query.strip() for query in request.queries]
+    if not queries or not all(queries):
+        raise HTTPException(status_code=400, detail="Queries cannot be empty")
+    if len(queries) > QUERY_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"At most {QUERY_BATCH_MAX} queries per batch")
+
+    from agents import batch_search_documents
+    from agents.dispatcher import BATCH, dispatch_as
+    from agents.usage import UsageCallback, get_token_usage
+
+    _check_budget(request.user_id)
+    usage = UsageCallback(request.user_id or "")
+
+    try:
+        agent, db, search_kwargs, lookup = await run_in_threadpool(_lazy_load_user_index, request.user_id)
+        documents = await run_in_threadpool(
+            batch_search_documents, db, queries, search_kwargs, lookup, request.session_id
         )
     except RuntimeError as e:
         raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+    semaphore = asyncio.Semaphore(QUERY_BATCH_CONCURRENCY)
+
+    async def answer(i: int) -> dict:
+        async with semaphore:
+            try:
+                if get_token_usage().remaining(usage.user_id) == 0:
+                    raise RuntimeError("Daily token budget exhausted")
+                # LLM calls queue behind interactive queries (agents/dispatcher.py)
+                with dispatch_as(BATCH, request.user_id):
+                    result = await run_in_threadpool(
+                        _run_or_degrade, agent, db, queries[i], documents[i], search_kwargs, lookup,
+                        callbacks=[usage], session_id=request.session_id or ""
+                    )
+                return {"index": i, **_query_response(result, db).model_dump()}
+            except Exception as e:
+                return {"index": i, "query": queries[i], "error": str(e)}
+
+    async def stream():
+        tasks = [asyncio.create_task(answer(i)) for i in range(len(queries))]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # Client went away: questions not started yet are dropped
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
 
 @app.post("/index-document")
 async def index_document(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     user_id: str = Form(...),
     session_id: str = Form(None)
@@ -164,115 +519,101 @@ async def index_document(
 
     Supported file types: .pdf, .txt, .md, .doc, .docx
     """
-    try:
-        # Read file
-        file_bytes = await file.read()
-        filename = file.filename.lower()
-
-        # Extract text based on file type
-        if filename.endswith('.pdf'):
-            # PDF extraction
-            pdf_file = io.BytesIO(file_bytes)
-            reader = PdfReader(pdf_file)
-
-            text_parts = []
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:
-                    text_parts.append(text)
-
-            if not text_parts:
-                raise HTTPException(status_code=400, detail="No text could be extracted from PDF")
-
-            full_text = "\n\n".join(text_parts)
-
-        elif filename.endswith('.txt') or filename.endswith('.md'):
-            # Plain text or Markdown
-            try:
-                full_text = file_bytes.decode('utf-8')
-            except UnicodeDecodeError:
-                # Try with different encoding
-                full_text = file_bytes.decode('latin-1')
-
-        elif filename.endswith('.doc') or filename.endswith('.docx'):
-            # Word documents (requires python-docx)
-            try:
-                doc_file = io.BytesIO(file_bytes)
-                doc = docx.Document(doc_file)
-                full_text = "\n\n".join([para.text for para in doc.paragraphs if para.text.strip()])
-            except ImportError:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Word document support not available. Please convert to PDF or TXT."
-                )
-
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="Unsupported file type. Supported: .pdf, .txt, .md, .doc, .docx"
-            )
-
-        if not full_text or not full_text.strip():
-            raise HTTPException(status_code=400, detail="No text could be extracted from file")
-
-        # Chunk the text
-        chunks = chunk_text(full_text, chunk_size=1500, overlap=200)
-
-        # Create metadata for each chunk
-        metadatas = [
-            {
-                "source": file.filename,
-                "user_id": user_id,
-                "session_id": session_id or "",
-                "chunk_index": i,
-                "total_chunks": len(chunks),
-                "type": "user_upload"
-            }
-            for i in range(len(chunks))
-        ]
-
-        # Get embedder
-        embedder = get_embedder()
+    filename = file.filename.lower()
+    if not filename.endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(
+            status_code=400,
+            detail="Unsupported file type. Supported: .pdf, .txt, .md, .doc, .docx"
+        )
 
-        # User-specific vector store path
-        user_index_dir = SERVICE_ROOT / "data" / "embeddings" / "users"
-        user_index_dir.mkdir(parents=True, exist_ok=True)
-        user_index_path = user_index_dir / f"user_{user_id}_faiss"
-
-        # Load or create vector store
-        if user_index_path.exists():
-            # Add to existing user index
-            vector_db = load_vectorstore(str(user_index_path), embedder)
-            vector_db.add_texts(texts=chunks, metadatas=metadatas)
-        else:
-            # Create new index - start with CUAD if available
-            if INDEX_PATH.exists():
-                # Copy CUAD index and add user documents
-                vector_db = load_vectorstore(str(INDEX_PATH), embedder)
-                vector_db.add_texts(texts=chunks, metadatas=metadatas)
-            else:
-                # Create completely new index
-                vector_db = build_vectorstore(
-                    texts=chunks,
-                    metadatas=metadatas,
-                    embedder=embedder
-                )
-
-        # Save updated index
-        save_vectorstore(vector_db, str(user_index_path))
+    tmp_path = None
+    try:
+        # Stream the upload to disk, hashing it; parsers read from the file
+        with metrics.timed("index.spool"):
+            tmp_path, content_hash = await spool_upload(file, suffix=Path(filename).suffix)
+
+        # Identical files are short-circuited; revisions only embed changed chunks
+        result = await run_in_threadpool(
+            index_user_document,
+            user_id,
+            session_id,
+            file.filename,
+            tmp_path,
+            content_hash,
+            get_embedder(),
+            INDEX_PATH
+        )
+        user_agents.pop(user_id, None)
+        if result.get("needs_merge"):
+            background_tasks.add_task(merge_user_index, user_id)
 
         return {
             "status": "success",
             "filename": file.filename,
             "user_id": user_id,
-            "chunks_created": len(chunks),
-            "index_path": str(user_index_path)
+            **result
         }
 
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to process document: {str(e)}")
+    finally:
+        if tmp_path:
+            os.unlink(tmp_path)
+
+
+def _remove_documents(user_id: str, background_tasks: BackgroundTasks, **target) -> dict:
+    """Tombstone documents, schedule compaction if needed and drop the cached agent."""
+    result = remove_user_documents(user_id, **target)
+    user_agents.pop(user_id, None)
+
+    if result["needs_compaction"]:
+        background_tasks.add_task(compact_user_index, user_id)
+
+    return {"status": "success", "user_id": user_id, **result}
+
+
+@app.get("/metrics")
+def get_metrics(reset: bool = False):
+    """Per-stage latency percentiles, counters, LLM cache hit rates, LLM queues and memory usage of this process."""
+    from agents.dispatcher import get_dispatcher
+    from agents.llm_cache import cache_stats
+
+    llm_cache = cache_stats()
+    return {**metrics.snapshot(reset=reset), "llm_cache": llm_cache, "llm_dispatch": get_dispatcher().stats()}
+
+
+@app.get("/users/{user_id}/usage")
+def get_usage(user_id: str):
+    """Tokens the user spent today against their daily budget."""
+    from agents.usage import get_token_usage, seconds_until_reset
+
+    usage = get_token_usage()
+    return {
+        "user_id": user_id,
+        "tokens_used": usage.used(user_id),
+        "daily_budget": usage.budget or None,
+        "tokens_remaining": usage.remaining(user_id),
+        "resets_in_seconds": seconds_until_reset(),
+    }
+
+
+@app.delete("/users/{user_id}/sessions/{session_id}")
+def delete_session_documents(user_id: str, session_id: str, background_tasks: BackgroundTasks):
+    """Remove the vectors of documents uploaded in a chat session, and its conversation memory."""
+    from agents.memory import get_session_memory
+
+    get_session_memory().delete(user_id, session_id)
+    return _remove_documents(user_id, background_tasks, session_id=session_id)
+
+
+@app.delete("/users/{user_id}/documents/{document_id}")
+def delete_document(user_id: str, document_id: str, background_tasks: BackgroundTasks):
+    """Remove a single document's vectors from a user's index."""
+    return _remove_documents(user_id, background_tasks, document_id=document_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+"""
+Pre-fork server: the ML service on several worker processes.
+
+The master process does the startup work once (api.main.preload: build the
+shared index if missing, import the agent stack, load the embedding model
+and the shared index), opens the listening socket, then forks
+SERVICE_WORKERS uvicorn workers that all accept on it. Workers share the
+model weights copy-on-write and the index vectors, memory-mapped, through
+the page cache: an extra worker costs its own request state, not another
+copy of the model and index.
+
+Signals to the master, whose pid is written to SERVICE_PID_FILE:
+- SIGHUP: the shared index was rebuilt. Relayed to every worker, which
+  reloads it on its next request. `python main.py build` sends it.
+- SIGTERM / SIGINT: stop the workers (in-flight requests finish), then exit.
+Workers that exit on their own are replaced.
+
+User indexes need no signal: workers check their version on each request
+(see api/main.py). Metrics (/metrics) are per worker.
+
+Usage:
+    SERVICE_WORKERS=4 python -m api.server
+"""
+
+import os
+import signal
+import socket
+import time
+from pathlib import Path
+from typing import Dict
+
+
+SERVICE_ROOT = Path(__file__).parent.parent
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "1"))
+SERVICE_PID_FILE = Path(os.getenv("SERVICE_PID_FILE", str(SERVICE_ROOT / "data" / "service.pid")))
+
+# Seconds workers get to finish their requests on shutdown before being killed
+GRACEFUL_TIMEOUT = 30
+# A worker that exits sooner than this after starting is restarted after a pause
+MIN_WORKER_SECONDS = 5
+
+
+def notify_reload(pid_file: Path = SERVICE_PID_FILE) -> bool:
+    """Tell a running pre-fork server that the shared index was rebuilt; False if none runs."""
+    try:
+        pid = int(pid_file.read_text())
+        # A stale pid file may name an unrelated process by now
+        cmdline = Path(f"/proc/{pid}/cmdline")
+        if cmdline.exists() and b"api.server" not in cmdline.read_bytes():
+            return False
+        os.kill(pid, signal.SIGHUP)
+    except (FileNotFoundError, ValueError, ProcessLookupError, PermissionError):
+        return False
+    return True
+
+
+def _listen(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket) -> None:
+    """Body of a forked worker: serve the preloaded app on the shared socket."""
+    import uvicorn
+
+    from api import main as service
+
+    # Handlers installed by the master are inherited; uvicorn sets its own
+    # for SIGINT and SIGTERM while it runs
+    signal.signal(signal.SIGHUP, service.reload_indexes)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_DFL)
+
+    config = uvicorn.Config(service.app, log_level=os.getenv("LOG_LEVEL", "info"))
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(workers: int = SERVICE_WORKERS, host: str = "0.0.0.0", port: int = 8000) -> None:
+    """Run the master process until SIGTERM or SIGINT."""
+    # Split the cores between the workers' embedding calls; read by
+    # utils.embeddings when it is first imported, just below
+    os.environ.setdefault("EMBEDDING_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
+    from api import main as service
+
+    sock = _listen(host, port)
+    print(f"Pre-fork master {os.getpid()}: preloading the service...")
+    service.preload()
+
+    received = []
+    for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+        signal.signal(sig, lambda signum, frame: received.append(signum))
+
+    children: Dict[int, float] = {}  # pid -> start time
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                _run_worker(sock)
+                code = 0
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+        print(f"Started worker {pid}")
+
+    SERVICE_PID_FILE.parent.mkdir(parents=True, exist_ok=True)
+    SERVICE_PID_FILE.write_text(str(os.getpid()))
+    try:
+        for _ in range(workers):
+            spawn()
+        print(f"Serving on {host}:{port} with {workers} workers")
+
+        stopping = None
+        while children:
+            while received:
+                signum = received.pop(0)
+                if signum == signal.SIGHUP:
+                    print("Reloading the shared index in every worker")
+                    for pid in children:
+                        os.kill(pid, signal.SIGHUP)
+                    # Workers forked from now on inherit the new index
+                    service.reload_indexes()
+                    service.preload()
+                elif signum in (signal.SIGTERM, signal.SIGINT) and stopping is None:
+                    print("Stopping workers...")
+                    stopping = time.monotonic()
+                    for pid in children:
+                        os.kill(pid, signal.SIGTERM)
+
+            while children:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if not pid:
+                    break
+                started = children.pop(pid, None)
+                if started is None or stopping is not None:
+                    continue
+                print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting it")
+                if time.monotonic() - started < MIN_WORKER_SECONDS:
+                    time.sleep(1)
+                spawn()
+
+            if stopping is not None and time.monotonic() - stopping > GRACEFUL_TIMEOUT:
+                for pid in children:
+                    os.kill(pid, signal.SIGKILL)
+            time.sleep(0.1)
+    finally:
+        SERVICE_PID_FILE.unlink(missing_ok=True)
+        sock.close()
+
+
+if __name__ == "__main__":
+    serve(host=os.getenv("HOST", "0.0.0.0"), port=int(os.getenv("PORT", 8000)))
@@ -0,0 +1,124 @@
+"""
+Streaming upload handling for the ML service.
+
+Uploads are copied to a temp file in fixed-size chunks instead of being read
+into memory, and a size cap is enforced on the raw request body as it
+arrives, so oversized files are rejected before they are fully received.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+UPLOAD_DIR = os.getenv("UPLOAD_DIR") or None  # None: system temp dir
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _too_large_response(max_bytes: int) -> JSONResponse:
+    return JSONResponse(
+        status_code=413,
+        content={"detail": f"File too large. Maximum upload size is {max_bytes // (1024 * 1024)} MB"}
+    )
+
+
+class UploadSizeLimitMiddleware:
+    """
+    ASGI middleware that caps the request body size on upload routes.
+
+    Requests with a Content-Length over the cap are refused up front;
+    chunked requests are counted as they stream in and cut off with a 413
+    as soon as they cross it. A malformed Content-Length is refused with
+    a 400.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES, paths: tuple = ("/index-document",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length:
+            try:
+                declared = int(content_length)
+            except ValueError:
+                declared = -1
+            if declared < 0:
+                await JSONResponse(status_code=400, content={"detail": "Invalid Content-Length header"})(
+                    scope, receive, send
+                )
+                return
+            if declared > self.max_bytes:
+                await _too_large_response(self.max_bytes)(scope, receive, send)
+                return
+
+        received = 0
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            message = await receive()
+            if message["type"] == "http.request" and not rejected:
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Answer now and make the body parser stop reading
+                    rejected = True
+                    await _too_large_response(self.max_bytes)(scope, receive, send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            # Once the 413 is out, drop whatever the app answers to the disconnect
+            if not rejected:
+                await send(message)
+
+        await self.app(scope, limited_receive, guarded_send)
+
+
+async def spool_upload(
+    file: UploadFile,
+    suffix: str = "",
+    max_bytes: int = MAX_UPLOAD_BYTES
+) -> tuple[str, str]:
+    """
+    Copy an upload to a temp file chunk by chunk, hashing it on the way.
+
+    Args:
+        file: The uploaded file
+        suffix: Temp file suffix (parsers pick up the extension from it)
+        max_bytes: Size cap, enforced while copying
+
+    Returns:
+        (path, sha256 hex digest); the caller is responsible for deleting the file
+
+    Raises:
+        HTTPException: 413 if the file is larger than max_bytes
+    """
+    size = 0
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(suffix=suffix, dir=UPLOAD_DIR, delete=False) as tmp:
+        try:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"File too large. Maximum upload size is {max_bytes // (1024 * 1024)} MB"
+                    )
+                digest.update(chunk)
+                tmp.write(chunk)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)
+            raise
+
+    return tmp.name, digest.hexdigest()
@@ -0,0 +1,7 @@
+"""
+Performance benchmarks for the ML service.
+
+Each module is a standalone script, run from the service directory:
+
+    python -m benchmarks.pdf_extraction contracts/*.pdf
+"""
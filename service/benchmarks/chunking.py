@@ -0,0 +1,74 @@
+"""
+Chunking throughput and chunk size distribution: chunk_text vs chunk_contract.
+
+Usage:
+    python -m benchmarks.chunking --data-dir ../data --max-contracts 510
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from utils.chunking import MAX_TOKENS, chunk_contract, count_tokens
+from utils.data_loader import chunk_text, load_cuad_contracts
+
+
+CHUNKERS = {
+    "chunk_text": lambda text: chunk_text(text, chunk_size=2000, overlap=200),
+    "chunk_contract": chunk_contract,
+}
+
+
+def bench_chunker(name: str, texts: list[str], repeat: int) -> dict:
+    """Chunk the whole corpus `repeat` times; report best time and size stats."""
+    chunker = CHUNKERS[name]
+    best = float("inf")
+    chunks = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = [chunk for text in texts for chunk in chunker(text)]
+        best = min(best, time.perf_counter() - start)
+
+    tokens = np.array([count_tokens(chunk) for chunk in chunks])
+    chars = np.array([len(chunk) for chunk in chunks])
+    return {
+        "chunker": name,
+        "seconds": best,
+        "chunks": len(chunks),
+        "tokens_p5": np.percentile(tokens, 5),
+        "tokens_p50": np.percentile(tokens, 50),
+        "tokens_p95": np.percentile(tokens, 95),
+        "tokens_max": tokens.max(),
+        "over_budget": float((tokens > MAX_TOKENS).mean()),
+        "chars_p50": np.percentile(chars, 50),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=None, help="Directory containing CUADv1.json")
+    parser.add_argument("--max-contracts", type=int, default=None, help="Defaults to the full corpus")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = [text for text, _ in load_cuad_contracts(args.data_dir, args.max_contracts)]
+    size_mb = sum(len(t) for t in texts) / 1e6
+    print(f"{len(texts)} contracts, {size_mb:.1f}M chars, token budget {MAX_TOKENS}")
+    print(
+        f"{'chunker':<15} {'seconds':>8} {'MB/s':>7} {'chunks':>7} {'tok p5':>7} {'tok p50':>8} "
+        f"{'tok p95':>8} {'tok max':>8} {f'>{MAX_TOKENS} tok':>9} {'chars p50':>10}"
+    )
+
+    for name in CHUNKERS:
+        r = bench_chunker(name, texts, args.repeat)
+        print(
+            f"{r['chunker']:<15} {r['seconds']:>8.3f} {size_mb / r['seconds']:>7.1f} {r['chunks']:>7} "
+            f"{r['tokens_p5']:>7.0f} {r['tokens_p50']:>8.0f} {r['tokens_p95']:>8.0f} {r['tokens_max']:>8} "
+            f"{r['over_budget']:>9.1%} {r['chars_p50']:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
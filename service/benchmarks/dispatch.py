@@ -0,0 +1,136 @@
+"""
+Chat latency while batch jobs run, under the LLM dispatcher (agents/dispatcher.py).
+
+The service is started with the fake LLM, as benchmarks/load_test.py --spawn
+does, with LLM_MAX_CONCURRENCY slots for LLM calls. /query is then driven
+twice: alone, and while --batch-clients clients keep sending /query/batch
+requests of --batch-size questions. Reported per phase: p50/p95 of /query
+and how long LLM calls waited for a slot, per class (llm.queue.* in
+/metrics). Interactive calls are served before batch ones and batch calls
+hold at most LLM_BATCH_MAX_CONCURRENCY slots, so /query should barely slow
+down while the batch traffic absorbs the queueing.
+
+Usage:
+    python -m benchmarks.dispatch --queries 100 --concurrency 4 \\
+        --batch-clients 4 --batch-size 20 --max-concurrency 8 --batch-max-concurrency 4
+    python -m benchmarks.dispatch --upload contracts/a.pdf
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import urllib.request
+from pathlib import Path
+
+from benchmarks.load_test import QUERIES, _post_file, _post_json, _request, run_workload, spawn_service
+
+
+def _post_batch(url: str, payload: dict) -> int:
+    """POST a /query/batch request and read its NDJSON stream to the end; returns the status."""
+    request = urllib.request.Request(url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=600) as response:
+            response.read()
+            return response.status
+    except OSError:
+        return 0
+
+
+def _queue_waits(url: str) -> dict:
+    status, server = _request("GET", f"{url}/metrics?reset=true")
+    stages = server.get("stages", {}) if status == 200 else {}
+    return {name: stages.get(f"llm.queue.{name}", {"count": 0}) for name in ("interactive", "batch")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=100, help="/query requests per phase")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent /query clients")
+    parser.add_argument("--batch-clients", type=int, default=4, help="Clients sending /query/batch meanwhile")
+    parser.add_argument("--batch-size", type=int, default=20, help="Questions per /query/batch request")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="LLM_MAX_CONCURRENCY")
+    parser.add_argument("--batch-max-concurrency", type=int, default=4, help="LLM_BATCH_MAX_CONCURRENCY")
+    parser.add_argument("--llm-latency-ms", type=float, default=100, help="Fake LLM latency per call")
+    parser.add_argument("--upload", type=Path, help="Query indexes built from this file, not the shared one")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="dispatch_")
+    process = spawn_service(args.port, {
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        # Every call must reach the (fake) provider
+        "LLM_CACHE": "0",
+        "LLM_MAX_CONCURRENCY": str(args.max_concurrency),
+        "LLM_BATCH_MAX_CONCURRENCY": str(args.batch_max_concurrency),
+        "USER_INDEX_DIR": scratch,
+        "SERVICE_PID_FILE": os.path.join(scratch, "service.pid"),
+    })
+    url = f"http://127.0.0.1:{args.port}"
+    results = []
+    try:
+        # Eight chat users and the batch clients' users each query their own index
+        chat_users = [f"chat-{i}" for i in range(8)]
+        batch_users = [f"batch-{c}" for c in range(args.batch_clients)]
+        if args.upload:
+            for user_id in chat_users + batch_users:
+                _post_file(f"{url}/index-document", {"user_id": user_id, "session_id": "setup"}, args.upload)
+
+        def query(i):
+            user_id = chat_users[i % len(chat_users)]
+            return _post_json(f"{url}/query", {"query": QUERIES[i % len(QUERIES)], "user_id": user_id})
+
+        run_workload("warmup", query, len(chat_users), args.concurrency)
+        _queue_waits(url)
+        alone = run_workload("/query", query, args.queries, args.concurrency)
+        results.append({"phase": "alone", **alone, "queue": _queue_waits(url)})
+
+        stop = threading.Event()
+        batches = {"requests": 0, "errors": 0}
+
+        def batch_client(client):
+            payload = {
+                "queries": [QUERIES[(client + i) % len(QUERIES)] for i in range(args.batch_size)],
+                "user_id": batch_users[client],
+            }
+            while not stop.is_set():
+                status = _post_batch(f"{url}/query/batch", payload)
+                batches["requests"] += 1
+                batches["errors"] += status != 200
+
+        clients = [threading.Thread(target=batch_client, args=(c,)) for c in range(args.batch_clients)]
+        for client in clients:
+            client.start()
+        try:
+            loaded = run_workload("/query", query, args.queries, args.concurrency)
+        finally:
+            stop.set()
+            for client in clients:
+                client.join()
+        results.append({"phase": "with batch", **loaded, "queue": _queue_waits(url), "batches": batches})
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(
+        f"{'phase':<11} {'QPS':>6} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} "
+        f"{'wait p95 interactive':>21} {'wait p95 batch':>15} {'batch calls':>12}"
+    )
+    for r in results:
+        queue = r["queue"]
+        print(
+            f"{r['phase']:<11} {r['qps']:>6.1f} {r.get('p50_ms', 0):>8.1f} {r.get('p95_ms', 0):>8.1f} "
+            f"{sum(r['errors'].values()):>7} {queue['interactive'].get('p95_ms', 0):>21.1f} "
+            f"{queue['batch'].get('p95_ms', 0):>15.1f} {queue['batch']['count']:>12}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "results": results}, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Embedding backends compared: load time, memory, throughput and recall.
+
+Each backend (see utils/embeddings.py) runs in a fresh process, so load time
+and memory are those of a cold service. Reported per backend:
+- load: seconds until the first embedding, and RSS growth
+- throughput: chunks embedded per second (contract-256 chunks of CUAD)
+- query latency: embed_query p50/p95
+- recall@k and MRR@10 of a flat index, as in benchmarks/retrieval.py
+- peak RSS of the process
+
+Usage:
+    python -m benchmarks.embeddings --data-dir ../data --max-contracts 20
+    python -m benchmarks.embeddings --backends torch onnx-int8
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.retrieval import KS, build_corpus, query_text, run_config
+from utils import metrics
+from utils.data_loader import load_cuad_qas
+from utils.embeddings import BACKENDS, get_embedder
+
+
+def measure(backend: str, data_dir, max_contracts: int, max_queries: int) -> dict:
+    """All measurements for one backend, in this process."""
+    rss_before = metrics.rss_mb()
+    start = time.perf_counter()
+    embedder = get_embedder(backend=backend)
+    embedder.embed_query("warm up")
+    load_seconds = time.perf_counter() - start
+    load_rss_mb = metrics.rss_mb() - rss_before
+
+    contracts, qas = load_cuad_qas(data_dir, max_contracts)
+    if max_queries and len(qas) > max_queries:
+        rng = np.random.default_rng(0)
+        qas = [qas[i] for i in sorted(rng.choice(len(qas), max_queries, replace=False))]
+    for qa in qas:
+        qa["query"] = query_text(qa)
+    corpus = build_corpus(contracts, "contract-256")
+
+    start = time.perf_counter()
+    vectors = np.asarray(embedder.embed_documents(corpus[0]), dtype=np.float32)
+    embed_seconds = time.perf_counter() - start
+
+    query_vectors, query_latencies = [], []
+    for qa in qas:
+        start = time.perf_counter()
+        query_vectors.append(embedder.embed_query(qa["query"]))
+        query_latencies.append(time.perf_counter() - start)
+
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    query_vectors = np.asarray(query_vectors, dtype=np.float32)
+    query_vectors /= np.maximum(np.linalg.norm(query_vectors, axis=1, keepdims=True), 1e-12)
+    retrieval = run_config("contract-256", "flat", "dense", corpus, vectors, query_vectors, qas, "contract", None)
+
+    return {
+        "backend": backend,
+        "load_seconds": load_seconds,
+        "load_rss_mb": load_rss_mb,
+        "chunks": len(corpus[0]),
+        "chunks_per_second": len(corpus[0]) / embed_seconds,
+        "query_latency": metrics.summarize(query_latencies),
+        **{key: retrieval[key] for key in [f"recall@{k}" for k in KS] + ["mrr@10"]},
+        "peak_rss_mb": metrics.peak_rss_mb(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--data-dir", default=None, help="Directory containing CUADv1.json")
+    parser.add_argument("--max-contracts", type=int, default=20)
+    parser.add_argument("--max-queries", type=int, default=500)
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    parser.add_argument("--worker", choices=BACKENDS, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.data_dir, args.max_contracts, args.max_queries)))
+        return
+
+    print(
+        f"{'backend':<10} {'load s':>7} {'load MB':>8} {'chunks/s':>9} {'q p50 ms':>9} {'q p95 ms':>9} "
+        + " ".join(f"{f'R@{k}':>6}" for k in KS)
+        + f" {'MRR':>6} {'peak MB':>8}"
+    )
+    results = []
+    for backend in args.backends:
+        command = [
+            sys.executable, "-m", "benchmarks.embeddings", "--worker", backend,
+            "--max-contracts", str(args.max_contracts), "--max-queries", str(args.max_queries),
+        ]
+        if args.data_dir:
+            command += ["--data-dir", args.data_dir]
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(f"{backend:<10} failed: {completed.stderr.strip().splitlines()[-1]}")
+            continue
+
+        r = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(r)
+        print(
+            f"{r['backend']:<10} {r['load_seconds']:>7.2f} {r['load_rss_mb']:>8.0f} {r['chunks_per_second']:>9.1f} "
+            f"{r['query_latency']['p50_ms']:>9.2f} {r['query_latency']['p95_ms']:>9.2f} "
+            + " ".join(f"{r[f'recall@{k}']:>6.3f}" for k in KS)
+            + f" {r['mrr@10']:>6.3f} {r['peak_rss_mb']:>8.0f}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "results": results}, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Per-query cost of the agent graph's state, with a fake LLM.
+
+Runs questions through build_graph over a small synthetic index and reports
+per query: wall time, peak Python allocation during the run (tracemalloc),
+the size of the final state (strings, messages and containers it holds) and
+its message count. The LLM is agents.llm.FakeChatModel with no latency, so
+the numbers are the graph's own overhead (the LLM cache is bypassed).
+
+Usage:
+    python -m benchmarks.graph_state --queries 200
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from langchain_core.messages import BaseMessage
+
+from agents import build_graph, llm_cache, run_query
+from agents.llm import FakeChatModel
+from utils import build_vectorstore, get_embedder
+from utils.metrics import summarize
+
+
+def deep_size(value) -> int:
+    """Bytes of a state value and everything it references."""
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(deep_size(k) + deep_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(deep_size(v) for v in value)
+    if isinstance(value, BaseMessage):
+        return sys.getsizeof(value) + deep_size(value.content)
+    return sys.getsizeof(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--chunks", type=int, default=200, help="Chunks in the synthetic index")
+    parser.add_argument("--chunk-chars", type=int, default=2000)
+    parser.add_argument("--llm-tokens", type=int, default=120, help="Fake LLM reply length")
+    args = parser.parse_args(argv)
+
+    words = "party agreement term termination notice license payment liability".split()
+    texts = [
+        " ".join(words[(i + j) % len(words)] for j in range(args.chunk_chars // 8))[:args.chunk_chars]
+        for i in range(args.chunks)
+    ]
+    vector_db = build_vectorstore(texts, [{"chunk": i} for i in range(args.chunks)], get_embedder())
+    # Every call would miss; keep SQLite writes out of the numbers
+    llm_cache.LLM_CACHE_ENABLED = False
+    app = build_graph(vector_db, llm=FakeChatModel(latency_ms=0, output_tokens=args.llm_tokens))
+    run_query(app, "warm up")
+
+    latencies, peaks, sizes, messages = [], [], [], []
+    tracemalloc.start()
+    for i in range(args.queries):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        state = run_query(app, f"What are the {words[i % len(words)]} obligations? ({i})")
+        latencies.append(time.perf_counter() - start)
+        peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        sizes.append(deep_size(state))
+        messages.append(len(state["messages"]))
+    tracemalloc.stop()
+
+    latency = summarize(latencies)
+    print(f"{args.queries} queries over {args.chunks} chunks")
+    print(f"latency       p50 {latency['p50_ms']:.2f} ms  p95 {latency['p95_ms']:.2f} ms")
+    print(f"peak alloc    {sum(peaks) / len(peaks) / 1024:.1f} KiB/query")
+    print(f"final state   {sum(sizes) / len(sizes) / 1024:.1f} KiB/query")
+    print(f"messages      {max(messages)} per query")
+
+
+if __name__ == "__main__":
+    main()
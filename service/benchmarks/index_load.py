@@ -0,0 +1,121 @@
+"""
+Index persistence: LangChain's pickled save_local against the chunk store format.
+
+Builds a synthetic index (random unit vectors, contract-sized chunk texts),
+saves it in both formats and loads each in a fresh process. Reported per
+format:
+- size on disk
+- load: seconds until the store is usable, and RSS growth
+- first search: latency of the first similarity search after loading
+  (includes reading the returned chunks)
+- search p50: latency of later searches
+
+Usage:
+    python -m benchmarks.index_load --chunks 50000
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from utils import metrics
+from utils.index_store import read_index
+from utils.vectorstore import build_vectorstore, save_vectorstore
+
+
+FORMATS = ("pickle", "chunks")
+DIM = 384
+CHUNK_WORDS = 180
+SEARCHES = 200
+
+_WORDS = ["party", "shall", "agreement", "notice", "terminate", "license", "payment", "term", "law", "clause"]
+
+
+def build_index(out_dir: Path, chunks: int):
+    """Save the same synthetic index in both formats under out_dir."""
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((chunks, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    words = rng.integers(len(_WORDS), size=(chunks, CHUNK_WORDS))
+    texts = [" ".join(_WORDS[w] for w in row) for row in words]
+    metadatas = [{"title": f"Contract {i // 50}", "chunk_index": i % 50, "source": "CUAD"} for i in range(chunks)]
+
+    vector_db = build_vectorstore(texts, metadatas, DeterministicFakeEmbedding(size=DIM), vectors=vectors.tolist())
+    vector_db.save_local(str(out_dir / "pickle"))
+    save_vectorstore(vector_db, str(out_dir / "chunks"))
+
+
+def measure(fmt: str, path: Path) -> dict:
+    """Load one format and search it, in this process."""
+    from langchain_community.vectorstores import FAISS
+
+    embedder = DeterministicFakeEmbedding(size=DIM)
+    rss_before = metrics.rss_mb()
+    start = time.perf_counter()
+    if fmt == "pickle":
+        vector_db = FAISS.load_local(str(path), embedder, allow_dangerous_deserialization=True)
+    else:
+        vector_db = read_index(path, embedder)
+    load_seconds = time.perf_counter() - start
+    load_rss_mb = metrics.rss_mb() - rss_before
+
+    latencies = []
+    for i in range(SEARCHES):
+        start = time.perf_counter()
+        vector_db.similarity_search_with_score(f"query {i}", k=5)
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "format": fmt,
+        "disk_mb": sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 2**20,
+        "load_seconds": load_seconds,
+        "load_rss_mb": load_rss_mb,
+        "first_search_ms": latencies[0] * 1000,
+        "search": metrics.summarize(latencies[1:]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=50000)
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    parser.add_argument("--worker", choices=FORMATS, help=argparse.SUPPRESS)
+    parser.add_argument("--path", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.path)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        build_index(Path(tmp), args.chunks)
+        print(f"{'format':<8} {'disk MB':>8} {'load s':>8} {'load MB':>8} {'1st ms':>8} {'p50 ms':>8}")
+        for fmt in FORMATS:
+            command = [sys.executable, "-m", "benchmarks.index_load", "--worker", fmt, "--path", str(Path(tmp) / fmt)]
+            completed = subprocess.run(command, capture_output=True, text=True)
+            if completed.returncode != 0:
+                print(f"{fmt:<8} failed: {completed.stderr.strip().splitlines()[-1]}")
+                continue
+
+            r = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(r)
+            print(
+                f"{r['format']:<8} {r['disk_mb']:>8.1f} {r['load_seconds']:>8.3f} {r['load_rss_mb']:>8.0f} "
+                f"{r['first_search_ms']:>8.2f} {r['search']['p50_ms']:>8.2f}"
+            )
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "results": results}, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
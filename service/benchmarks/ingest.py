@@ -0,0 +1,114 @@
+"""
+Cost of adding one document to indexes of growing size.
+
+For each index size, a synthetic index is saved, then one document's chunks
+are added the two ways the service can:
+- rewrite: load the whole index, add the chunks, save it all again (what
+  uploads did before segments)
+- append: write the chunks as a new segment (utils/index_store.py)
+and the index is loaded back once to time a search over all its segments.
+Reported per size: seconds and bytes written by each, and the search latency
+after the append.
+
+Usage:
+    python -m benchmarks.ingest --sizes 10000 50000 100000 --doc-chunks 100
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.index_load import DIM, build_index
+from utils import metrics
+from utils.index_store import append_segment
+from utils.vectorstore import load_vectorstore, save_vectorstore
+
+
+SEARCHES = 100
+
+
+def _disk_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def _document(doc_chunks: int, seed: int):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((doc_chunks, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    texts = [f"Uploaded clause {i} of document {seed}" for i in range(doc_chunks)]
+    metadatas = [{"source": f"upload-{seed}.pdf", "chunk_index": i} for i in range(doc_chunks)]
+    ids = [f"doc{seed}-{i}" for i in range(doc_chunks)]
+    return texts, vectors.tolist(), metadatas, ids
+
+
+def measure(size: int, doc_chunks: int) -> dict:
+    embedder = DeterministicFakeEmbedding(size=DIM)
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "chunks"
+        build_index(Path(tmp), size)
+        texts, vectors, metadatas, ids = _document(doc_chunks, 1)
+
+        before = _disk_bytes(root)
+        start = time.perf_counter()
+        vector_db = load_vectorstore(str(root), embedder)
+        vector_db.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        save_vectorstore(vector_db, str(root))
+        rewrite_seconds = time.perf_counter() - start
+        # The whole index is written again
+        rewrite_bytes = _disk_bytes(root) - before
+        del vector_db
+
+        texts, vectors, metadatas, ids = _document(doc_chunks, 2)
+        segments = {path.name for path in (root / "segments").iterdir()}
+        start = time.perf_counter()
+        append_segment(root, texts, vectors, metadatas, ids)
+        append_seconds = time.perf_counter() - start
+        new_segment = next(path for path in (root / "segments").iterdir() if path.name not in segments)
+        append_bytes = _disk_bytes(new_segment)
+
+        vector_db = load_vectorstore(str(root), embedder)
+        latencies = []
+        for i in range(SEARCHES):
+            start = time.perf_counter()
+            vector_db.similarity_search_with_score(f"query {i}", k=5)
+            latencies.append(time.perf_counter() - start)
+
+    return {
+        "size": size,
+        "rewrite_seconds": rewrite_seconds,
+        "rewrite_mb": rewrite_bytes / 2**20,
+        "append_seconds": append_seconds,
+        "append_mb": append_bytes / 2**20,
+        "search": metrics.summarize(latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--doc-chunks", type=int, default=100)
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    print(f"{'size':>8} {'rewrite s':>10} {'rewrite MB':>11} {'append s':>9} {'append MB':>10} {'search p50 ms':>14}")
+    results = []
+    for size in args.sizes:
+        r = measure(size, args.doc_chunks)
+        results.append(r)
+        print(
+            f"{r['size']:>8} {r['rewrite_seconds']:>10.3f} {r['rewrite_mb']:>11.1f} {r['append_seconds']:>9.3f} "
+            f"{r['append_mb']:>10.2f} {r['search']['p50_ms']:>14.2f}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "results": results}, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+End-to-end load test of the ML service, offline, with a stubbed LLM.
+
+Drives /query and /index-document concurrently and reports client-side
+latency percentiles and QPS per endpoint, the server's per-stage breakdown
+(from /metrics) and its memory usage. With --spawn the service is started
+locally with LLM_PROVIDER=fake and a scratch USER_INDEX_DIR, so runs cost
+nothing, need no network and are comparable from commit to commit. With
+--workers the spawned service is the pre-fork server (api/server.py) with
+that many workers; benchmarks/workers.py compares worker counts.
+
+Usage:
+    python -m benchmarks.load_test --spawn --queries 200 --concurrency 8 \\
+        --upload contracts/a.pdf --uploads 20 --upload-concurrency 2 \\
+        --llm-latency-ms 300 --json results.json
+    python -m benchmarks.load_test --url http://localhost:8000 --queries 100
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Optional
+
+from utils.metrics import summarize
+
+
+SERVICE_ROOT = Path(__file__).parent.parent
+
+QUERIES = [
+    "What are the termination conditions?",
+    "Explain the indemnification clause.",
+    "Are there non-compete restrictions?",
+    "Who owns the intellectual property created under this agreement?",
+    "What is the governing law?",
+    "Can the agreement be assigned without consent?",
+    "What are the payment terms?",
+    "Is there a cap on liability?",
+]
+
+
+def _request(method: str, url: str, body: Optional[bytes] = None, headers: Optional[dict] = None, timeout: float = 300):
+    """Send a request; returns (status, payload). HTTP errors are returned, not raised."""
+    request = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b"null")
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode("utf-8", "replace")
+    except (urllib.error.URLError, OSError) as e:
+        return 0, str(e)
+
+
+def _post_json(url: str, payload: dict):
+    return _request("POST", url, json.dumps(payload).encode(), {"Content-Type": "application/json"})
+
+
+def _post_file(url: str, fields: dict, path: Path):
+    """POST a file as multipart/form-data (file field "file")."""
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{path.name}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n".encode()
+    )
+    body = b"".join(parts) + path.read_bytes() + f"\r\n--{boundary}--\r\n".encode()
+    return _request("POST", url, body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+
+def run_workload(name: str, call: Callable[[int], tuple], total: int, concurrency: int) -> dict:
+    """Issue `total` calls from `concurrency` threads; time each one."""
+    latencies, errors = [], {}
+
+    def timed_call(i):
+        start = time.perf_counter()
+        status, payload = call(i)
+        elapsed = time.perf_counter() - start
+        if 200 <= status < 300:
+            latencies.append(elapsed)
+        else:
+            errors[status] = errors.get(status, 0) + 1
+            if sum(errors.values()) == 1:
+                print(f"  first {name} error ({status}): {str(payload)[:200]}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed_call, range(total)))
+    wall = time.perf_counter() - start
+
+    return {
+        "endpoint": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_seconds": wall,
+        "qps": len(latencies) / wall if wall else 0.0,
+        **summarize(latencies),
+    }
+
+
+def spawn_service(port: int, env: dict, workers: int = 0) -> subprocess.Popen:
+    """
+    Start the API and wait until it is ready (/health/ready): with uvicorn,
+    or with the pre-fork server when workers is given.
+    """
+    if workers:
+        command = [sys.executable, "-m", "api.server"]
+        env = {"PORT": str(port), "SERVICE_WORKERS": str(workers), "LOG_LEVEL": "warning", **env}
+    else:
+        command = [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=SERVICE_ROOT, env={**os.environ, **env})
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Service exited with code {process.returncode}")
+        status, _ = _request("GET", f"http://127.0.0.1:{port}/health/ready", timeout=2)
+        if status == 200:
+            return process
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("Service did not become ready in time")
+
+
+def print_report(results: list[dict], server: dict):
+    print(
+        f"\n{'endpoint':<16} {'requests':>8} {'errors':>7} {'wall s':>8} {'QPS':>7} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['endpoint']:<16} {r['requests']:>8} {sum(r['errors'].values()):>7} {r['wall_seconds']:>8.2f} "
+            f"{r['qps']:>7.2f} {r.get('p50_ms', 0):>8.1f} {r.get('p95_ms', 0):>8.1f} {r.get('p99_ms', 0):>8.1f}"
+        )
+
+    if not server:
+        return
+    print(f"\n{'server stage':<22} {'count':>6} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stage, s in sorted(server.get("stages", {}).items()):
+        if s["count"]:
+            print(
+                f"{stage:<22} {s['count']:>6} {s['mean_ms']:>8.1f} {s['p50_ms']:>8.1f} "
+                f"{s['p95_ms']:>8.1f} {s['p99_ms']:>8.1f}"
+            )
+    for name, value in sorted(server.get("counters", {}).items()):
+        print(f"{name:<22} {value:>6g}")
+    print(f"\nserver RSS: {server['rss_mb']:.0f} MB (peak {server['peak_rss_mb']:.0f} MB)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", default="http://127.0.0.1:8000", help="Service to test")
+    target.add_argument("--spawn", action="store_true", help="Start a local service with the fake LLM")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --spawn")
+    parser.add_argument("--llm-latency-ms", type=float, default=200, help="Fake LLM latency per call (--spawn)")
+    parser.add_argument("--llm-tokens", type=int, default=200, help="Fake LLM output tokens per call (--spawn)")
+    parser.add_argument("--workers", type=int, default=0, help="Pre-fork server workers (--spawn; 0: plain uvicorn)")
+    parser.add_argument("--queries", type=int, default=100, help="Number of /query requests")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent /query clients")
+    parser.add_argument("--user-id", default="bench", help="User whose index is queried ('' for the shared index)")
+    parser.add_argument("--upload", type=Path, nargs="*", default=[], help="Files to upload")
+    parser.add_argument("--uploads", type=int, default=0, help="Number of /index-document requests")
+    parser.add_argument("--upload-concurrency", type=int, default=2, help="Concurrent upload clients")
+    parser.add_argument(
+        "--same-user", action="store_true",
+        help="Upload everything to --user-id (exercises dedup) instead of one fresh user per upload"
+    )
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    if args.uploads and not args.upload:
+        parser.error("--uploads needs at least one --upload file")
+
+    process = None
+    url = args.url.rstrip("/")
+    if args.spawn:
+        scratch = tempfile.mkdtemp(prefix="load_test_")
+        process = spawn_service(args.port, {
+            "LLM_PROVIDER": "fake",
+            "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+            "FAKE_LLM_TOKENS": str(args.llm_tokens),
+            "USER_INDEX_DIR": scratch,
+            "SERVICE_PID_FILE": os.path.join(scratch, "service.pid"),
+        }, workers=args.workers)
+        url = f"http://127.0.0.1:{args.port}"
+        print(f"Spawned service pid {process.pid} (fake LLM, {args.llm_latency_ms:g} ms/call), indexes in {scratch}")
+
+    try:
+        # Warm up outside the measurement: give the query user an index, load the agent
+        if args.upload and args.user_id:
+            _post_file(f"{url}/index-document", {"user_id": args.user_id, "session_id": "warmup"}, args.upload[0])
+        query_payload = {"user_id": args.user_id} if args.user_id else {}
+        _post_json(f"{url}/query", {"query": QUERIES[0], **query_payload})
+        _request("GET", f"{url}/metrics?reset=true")
+
+        def query(i):
+            return _post_json(f"{url}/query", {"query": QUERIES[i % len(QUERIES)], **query_payload})
+
+        def upload(i):
+            user_id = args.user_id if args.same_user else f"{args.user_id or 'bench'}-{uuid.uuid4().hex[:8]}"
+            return _post_file(
+                f"{url}/index-document",
+                {"user_id": user_id, "session_id": f"bench-{i}"},
+                args.upload[i % len(args.upload)]
+            )
+
+        workloads = [("/query", query, args.queries, args.concurrency)]
+        if args.uploads:
+            workloads.append(("/index-document", upload, args.uploads, args.upload_concurrency))
+
+        # Queries and uploads run at the same time, as they would in production
+        with ThreadPoolExecutor(max_workers=len(workloads)) as pool:
+            results = list(pool.map(lambda w: run_workload(*w), workloads))
+
+        status, server = _request("GET", f"{url}/metrics")
+        server = server if status == 200 else {}
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print_report(results, server)
+    if args.json:
+        report = {"args": vars(args), "results": results, "server": server}
+        args.json.write_text(json.dumps(report, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+PDF extraction throughput per backend and worker count.
+
+Usage:
+    python -m benchmarks.pdf_extraction path/to/contract.pdf [more.pdf ...]
+    python -m benchmarks.pdf_extraction --workers 1 4 8 contracts/*.pdf
+"""
+
+import argparse
+import os
+import time
+
+from utils import extraction
+from utils.chunking import iter_contract_chunks
+from utils.extraction import available_pdf_backends, iter_pdf_pages, shutdown_pool
+
+
+def bench_backend(paths: list[str], backend: str, workers: int, repeat: int) -> dict:
+    """Extract and chunk every PDF `repeat` times; return best-of timings."""
+    best = float("inf")
+    pages = chars = chunks = 0
+
+    for _ in range(repeat):
+        pages = chars = chunks = 0
+        start = time.perf_counter()
+        for path in paths:
+            page_texts = []
+            for text in iter_pdf_pages(path, backend=backend, workers=workers):
+                pages += 1
+                chars += len(text)
+                page_texts.append(f"\n\n{text}")
+            chunks += sum(1 for _ in iter_contract_chunks(page_texts))
+        best = min(best, time.perf_counter() - start)
+
+    return {
+        "backend": backend,
+        "workers": workers,
+        "seconds": best,
+        "pages": pages,
+        "pages_per_sec": pages / best if best else 0.0,
+        "chars": chars,
+        "chunks": chunks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Sample contract PDFs")
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backends", nargs="+", default=None, help="Defaults to every installed backend")
+    args = parser.parse_args()
+
+    backends = args.backends or available_pdf_backends()
+    size_mb = sum(os.path.getsize(p) for p in args.paths) / 1e6
+    print(f"{len(args.paths)} file(s), {size_mb:.1f} MB, backends: {', '.join(backends)}")
+    print(f"{'backend':<10} {'workers':>7} {'seconds':>9} {'pages':>7} {'pages/s':>9} {'MB/s':>7} {'chars':>10} {'chunks':>7}")
+
+    # The shared pool has one process per worker of the widest setting
+    extraction.PDF_WORKERS = max(args.workers)
+    try:
+        for backend in backends:
+            for workers in args.workers:
+                r = bench_backend(args.paths, backend, workers, args.repeat)
+                print(
+                    f"{r['backend']:<10} {r['workers']:>7} {r['seconds']:>9.3f} {r['pages']:>7} "
+                    f"{r['pages_per_sec']:>9.1f} {size_mb / r['seconds']:>7.2f} {r['chars']:>10} {r['chunks']:>7}"
+                )
+    finally:
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
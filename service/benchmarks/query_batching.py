@@ -0,0 +1,101 @@
+"""
+Query embedding throughput and latency with micro-batching.
+
+--concurrency threads each embed queries one at a time (as /query's
+searches do) through MicroBatchingEmbeddings (utils/embeddings.py) with
+each window of --wait-ms; a window of 0 embeds every query on its own, as
+before. Reported per concurrency and window: queries per second, p50/p95/p99
+latency of embed_query and the mean number of queries per forward pass.
+Batching trades up to one window of added latency for fewer, larger
+forward passes; it pays off once queries arrive faster than one pass takes.
+
+Usage:
+    python -m benchmarks.query_batching --backend onnx --concurrency 1 8 32 --wait-ms 0 1 2 5
+"""
+
+import argparse
+import json
+import threading
+import time
+from pathlib import Path
+
+from utils import metrics
+from utils.embeddings import EMBEDDING_MICROBATCH_SIZE, MicroBatchingEmbeddings, get_embedder
+
+
+QUERIES = [
+    "Can either party terminate the agreement for convenience?",
+    "What notice is required before termination?",
+    "Who owns the intellectual property developed under the contract?",
+    "Is there a limitation of liability clause?",
+    "Which law governs the agreement?",
+    "Does the licensee have to pay minimum royalties?",
+    "Is assignment allowed without consent?",
+    "How long does the non-compete last after termination?",
+]
+
+
+def run(embedder, concurrency: int, queries_per_thread: int) -> dict:
+    latencies, lock = [], threading.Lock()
+
+    def client(c):
+        mine = []
+        for i in range(queries_per_thread):
+            # Distinct texts, so nothing could be served from a cache
+            text = f"{QUERIES[(c + i) % len(QUERIES)]} ({c}-{i})"
+            start = time.perf_counter()
+            embedder.embed_query(text)
+            mine.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(mine)
+
+    metrics.snapshot(reset=True)
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    counters = metrics.snapshot()["counters"]
+    batches = counters.get("embed.batches", 0)
+    return {
+        "qps": len(latencies) / elapsed,
+        **metrics.summarize(latencies),
+        "mean_batch": counters.get("embed.batched_queries", 0) / batches if batches else 1.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default=None, help="EMBEDDING_BACKEND (default: the environment's)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--wait-ms", type=float, nargs="+", default=[0, 1, 2, 5])
+    parser.add_argument("--max-batch", type=int, default=EMBEDDING_MICROBATCH_SIZE)
+    parser.add_argument("--queries", type=int, default=50, help="Queries per thread")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    model = get_embedder(backend=args.backend)
+    model.embed_query("warm up")
+
+    results = []
+    print(f"{'threads':>7} {'wait ms':>8} {'QPS':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'batch':>6}")
+    for concurrency in args.concurrency:
+        for wait_ms in args.wait_ms:
+            embedder = MicroBatchingEmbeddings(model, max_batch=args.max_batch, max_wait_ms=wait_ms)
+            r = {"concurrency": concurrency, "wait_ms": wait_ms, **run(embedder, concurrency, args.queries)}
+            results.append(r)
+            print(
+                f"{concurrency:>7} {wait_ms:>8g} {r['qps']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+                f"{r['p99_ms']:>8.2f} {r['mean_batch']:>6.1f}"
+            )
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "results": results}, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
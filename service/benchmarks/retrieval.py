@@ -0,0 +1,294 @@
+"""
+Retrieval quality and search latency on CUAD question/answer spans.
+
+Every answerable CUAD question becomes a query ("<clause type>: <details>").
+A retrieved chunk is a hit when it overlaps a gold answer span by at least
+half of the shorter of the two. Each retriever configuration (chunker x
+index type x dense/BM25/hybrid ranking) is scored by recall@k and MRR@10,
+and timed per query (query embedding excluded, it is the same for all).
+
+The expanded mode searches the query together with its rephrasings from
+the clause type table (clauses.expand_query), stacked into one FAISS call,
+and fuses the rankings by reciprocal rank fusion, as /query does; its
+latency includes embedding the extra phrasings in one batch, the cost
+expansion adds over the dense mode.
+
+By default a query only searches the chunks of its own contract, as a user
+asking about an uploaded contract does; --scope global searches the corpus.
+
+Usage:
+    python -m benchmarks.retrieval --data-dir ../data --max-contracts 100
+    python -m benchmarks.retrieval --chunkers contract-256 chars-2000 \\
+        --indexes flat hnsw --modes dense hybrid --scope global
+    python -m benchmarks.retrieval --chunkers contract-256 --indexes flat --modes dense expanded
+"""
+
+import argparse
+import json
+import math
+import re
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from utils.chunking import chunk_spans
+from utils.clauses import expand_query
+from utils.data_loader import load_cuad_qas
+from utils.embeddings import get_embedder
+from utils.metrics import summarize
+
+
+KS = (1, 3, 5, 10)
+CANDIDATES = 50  # per ranking, fused by hybrid
+RRF_K = 60
+
+
+def _char_spans(text: str, chunk_size: int = 2000, overlap: int = 200) -> list[tuple[int, int]]:
+    """Chunk boundaries of data_loader.chunk_text, as character spans."""
+    if len(text) <= chunk_size:
+        return [(0, len(text))]
+    spans, start = [], 0
+    while start < len(text):
+        end = start + chunk_size
+        if end < len(text):
+            last_period = text.rfind(".", start + chunk_size - 100, end)
+            if last_period > start:
+                end = last_period + 1
+        spans.append((start, min(end, len(text))))
+        start = end - overlap
+    return spans
+
+
+CHUNKERS = {
+    "chars-2000": _char_spans,
+    "contract-128": lambda text: [(s, e) for s, e, _ in chunk_spans(text, 128, 16)],
+    "contract-256": lambda text: [(s, e) for s, e, _ in chunk_spans(text, 256, 32)],
+    "contract-512": lambda text: [(s, e) for s, e, _ in chunk_spans(text, 512, 64)],
+}
+
+
+def _flat_index(vectors: np.ndarray):
+    index = faiss.IndexFlatIP(vectors.shape[1])
+    index.add(vectors)
+    return index, lambda sel: faiss.SearchParameters(sel=sel)
+
+
+def _hnsw_index(vectors: np.ndarray, m: int = 32, ef_search: int = 64):
+    index = faiss.IndexHNSWFlat(vectors.shape[1], m, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = 80
+    index.add(vectors)
+    return index, lambda sel: faiss.SearchParametersHNSW(sel=sel, efSearch=ef_search)
+
+
+def _ivf_index(vectors: np.ndarray, nprobe: int = 8):
+    nlist = max(1, min(int(4 * math.sqrt(len(vectors))), len(vectors) // 39))
+    quantizer = faiss.IndexFlatIP(vectors.shape[1])
+    index = faiss.IndexIVFFlat(quantizer, vectors.shape[1], nlist, faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.add(vectors)
+    return index, lambda sel: faiss.SearchParametersIVF(sel=sel, nprobe=min(nprobe, nlist))
+
+
+INDEXES = {
+    "flat": _flat_index,
+    "hnsw": _hnsw_index,
+    "ivf": _ivf_index,
+}
+MODES = ("dense", "bm25", "hybrid", "expanded")
+
+_WORD = re.compile(r"\w+")
+
+
+class BM25:
+    """Okapi BM25 over an inverted index of the chunks (lowercased \\w+ terms)."""
+
+    def __init__(self, texts: list[str], k1: float = 1.2, b: float = 0.75):
+        self.k1, self.b = k1, b
+        postings = defaultdict(lambda: ([], []))
+        lengths = np.zeros(len(texts), dtype=np.float32)
+        for i, text in enumerate(texts):
+            terms = Counter(_WORD.findall(text.lower()))
+            lengths[i] = sum(terms.values())
+            for term, tf in terms.items():
+                postings[term][0].append(i)
+                postings[term][1].append(tf)
+
+        self.n = len(texts)
+        self.norm = k1 * (1 - b + b * lengths / max(lengths.mean(), 1))
+        self.postings = {
+            term: (np.array(ids), np.array(tfs, dtype=np.float32), math.log(1 + (self.n - len(ids) + 0.5) / (len(ids) + 0.5)))
+            for term, (ids, tfs) in postings.items()
+        }
+
+    def search(self, query: str, k: int, lo: int = 0, hi: int = None) -> np.ndarray:
+        """Ids of the k best chunks among ids [lo, hi)."""
+        scores = np.zeros(self.n, dtype=np.float32)
+        for term in set(_WORD.findall(query.lower())):
+            if term in self.postings:
+                ids, tfs, idf = self.postings[term]
+                scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + self.norm[ids])
+        scores = scores[lo:hi]
+        top = np.argsort(-scores, kind="stable")[:k]
+        return top[scores[top] > 0] + lo
+
+
+def _fuse(*rankings: np.ndarray) -> np.ndarray:
+    """Reciprocal rank fusion."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking.tolist()):
+            scores[doc] += 1 / (RRF_K + rank + 1)
+    return np.array(sorted(scores, key=scores.get, reverse=True), dtype=np.int64)
+
+
+def _is_hit(chunk: tuple[int, int], answers: list[tuple[int, int]]) -> bool:
+    start, end = chunk
+    for a_start, a_end in answers:
+        overlap = min(end, a_end) - max(start, a_start)
+        if overlap > 0 and overlap >= min(end - start, a_end - a_start) / 2:
+            return True
+    return False
+
+
+def build_corpus(contracts: list, chunker: str):
+    """Chunk every contract; chunk ids of contract i are offsets[i]..offsets[i+1]."""
+    texts, spans, offsets = [], [], [0]
+    for text, _ in contracts:
+        for start, end in CHUNKERS[chunker](text):
+            texts.append(text[start:end])
+            spans.append((start, end))
+        offsets.append(len(texts))
+    return texts, spans, offsets
+
+
+def query_text(qa: dict) -> str:
+    """The search query a CUAD question becomes."""
+    return f"{qa['clause_type']}: {qa['details']}" if qa["details"] else qa["clause_type"]
+
+
+def _embed(embedder, texts: list[str]) -> np.ndarray:
+    vectors = np.asarray(embedder.embed_documents(texts), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def evaluate(rankings: list[np.ndarray], qas: list[dict], spans: list, latencies: list[float]) -> dict:
+    """recall@k and MRR@10 of ranked chunk ids against the gold spans."""
+    first_hits = []
+    for ranking, qa in zip(rankings, qas):
+        rank = next(
+            (r for r, doc in enumerate(ranking[:max(KS)].tolist(), 1) if _is_hit(spans[doc], qa["answers"])),
+            None
+        )
+        first_hits.append(rank)
+
+    result = {f"recall@{k}": float(np.mean([r is not None and r <= k for r in first_hits])) for k in KS}
+    result["mrr@10"] = float(np.mean([1 / r if r else 0.0 for r in first_hits]))
+    result["latency"] = summarize(latencies)
+    return result
+
+
+def run_config(chunker, index_name, mode, corpus, vectors, query_vectors, qas, scope, bm25, embedder):
+    texts, spans, offsets = corpus
+    k = max(KS)
+
+    index, params, build_seconds = None, None, 0.0
+    if mode != "bm25":
+        build_start = time.perf_counter()
+        index, params = INDEXES[index_name](vectors)
+        build_seconds = time.perf_counter() - build_start
+
+    rankings, latencies = [], []
+    for qa, query_vector in zip(qas, query_vectors):
+        lo, hi = (offsets[qa["contract"]], offsets[qa["contract"] + 1]) if scope == "contract" else (0, len(texts))
+        selector = faiss.IDSelectorRange(lo, hi) if scope == "contract" else None
+        depth = k if mode in ("dense", "expanded") else CANDIDATES
+        query = qa["query"]
+
+        start = time.perf_counter()
+        dense = sparse = None
+        if mode == "expanded":
+            variants = expand_query(query)[1:]
+            stacked = np.vstack([query_vector[None, :], _embed(embedder, variants)]) if variants else query_vector[None, :]
+            _, ids = index.search(stacked, depth, params=params(selector))
+            ranking = _fuse(*(row[row >= 0] for row in ids))
+        else:
+            if mode != "bm25":
+                _, ids = index.search(query_vector[None, :], depth, params=params(selector))
+                dense = ids[0][ids[0] >= 0]
+            if mode != "dense":
+                sparse = bm25.search(query, depth, lo, hi)
+            ranking = dense if mode == "dense" else sparse if mode == "bm25" else _fuse(dense, sparse)
+        latencies.append(time.perf_counter() - start)
+        rankings.append(ranking[:k])
+
+    return {
+        "chunker": chunker,
+        "index": index_name if mode != "bm25" else "-",
+        "mode": mode,
+        "chunks": len(texts),
+        "build_seconds": build_seconds,
+        "index_mb": faiss.serialize_index(index).nbytes / 1e6 if index is not None else 0.0,
+        **evaluate(rankings, qas, spans, latencies),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-dir", default=None, help="Directory containing CUADv1.json")
+    parser.add_argument("--max-contracts", type=int, default=50)
+    parser.add_argument("--max-queries", type=int, default=None, help="Subsample the questions")
+    parser.add_argument("--chunkers", nargs="+", choices=CHUNKERS, default=list(CHUNKERS))
+    parser.add_argument("--indexes", nargs="+", choices=INDEXES, default=list(INDEXES))
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--scope", choices=("contract", "global"), default="contract")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    contracts, qas = load_cuad_qas(args.data_dir, args.max_contracts)
+    if args.max_queries and len(qas) > args.max_queries:
+        rng = np.random.default_rng(0)
+        qas = [qas[i] for i in sorted(rng.choice(len(qas), args.max_queries, replace=False))]
+    if not qas:
+        parser.error("No answerable questions in the selected contracts")
+    for qa in qas:
+        qa["query"] = query_text(qa)
+
+    embedder = get_embedder()
+    start = time.perf_counter()
+    query_vectors = _embed(embedder, [qa["query"] for qa in qas])
+    embed_ms = (time.perf_counter() - start) / len(qas) * 1000
+    print(f"{len(contracts)} contracts, {len(qas)} questions, scope {args.scope}, query embedding {embed_ms:.1f} ms/query")
+
+    print(
+        f"\n{'chunker':<13} {'index':<5} {'mode':<8} {'chunks':>7} {'build s':>8} {'MB':>6} "
+        + " ".join(f"{f'R@{k}':>6}" for k in KS)
+        + f" {'MRR':>6} {'p50 ms':>7} {'p95 ms':>7}"
+    )
+    results = []
+    for chunker in args.chunkers:
+        corpus = build_corpus(contracts, chunker)
+        vectors = _embed(embedder, corpus[0])
+        bm25 = BM25(corpus[0]) if set(args.modes) & {"bm25", "hybrid"} else None
+
+        configs = [(index, mode) for mode in args.modes for index in (args.indexes if mode != "bm25" else ["flat"])]
+        for index_name, mode in configs:
+            r = run_config(chunker, index_name, mode, corpus, vectors, query_vectors, qas, args.scope, bm25, embedder)
+            results.append(r)
+            print(
+                f"{r['chunker']:<13} {r['index']:<5} {r['mode']:<8} {r['chunks']:>7} {r['build_seconds']:>8.2f} "
+                f"{r['index_mb']:>6.1f} "
+                + " ".join(f"{r[f'recall@{k}']:>6.3f}" for k in KS)
+                + f" {r['mrr@10']:>6.3f} {r['latency']['p50_ms']:>7.2f} {r['latency']['p95_ms']:>7.2f}"
+            )
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "results": results}, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Search latency of a sharded index against a single one.
+
+Builds the synthetic index of benchmarks/index_load.py and saves it twice:
+as one index, and sharded by size into --shards shards (index_store.py).
+Both are loaded and searched with the same queries, one at a time (the
+chat path) and in batches of --batch-size (the /query/batch path). Sharded
+searches scatter over SHARD_SEARCH_THREADS threads (--threads) and merge
+the shards' top k, so they return the same results; the speed-up comes
+from FAISS searching the shards in parallel, which single flat searches
+of one query do not.
+
+Usage:
+    python -m benchmarks.shards --chunks 200000 --shards 4 --threads 4
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from benchmarks.index_load import DIM, build_index
+from utils import index_store, metrics, vectorstore
+from utils.vectorstore import batch_similarity_search, load_vectorstore, save_vectorstore
+
+
+def measure(name: str, vector_db, queries: list, batch_size: int) -> dict:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        vector_db.similarity_search_with_score(query, k=5)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, len(queries), batch_size):
+        batch_similarity_search(vector_db, queries[i:i + batch_size], k=5)
+    batch_seconds = time.perf_counter() - start
+
+    return {"index": name, "search": metrics.summarize(latencies), "batch_qps": len(queries) / batch_seconds}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=4, help="SHARD_SEARCH_THREADS")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    vectorstore.SHARD_SEARCH_THREADS = args.threads
+    embedder = DeterministicFakeEmbedding(size=DIM)
+    queries = [f"query {i}" for i in range(args.queries)]
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        build_index(Path(tmp), args.chunks)
+        single = load_vectorstore(str(Path(tmp) / "chunks"), embedder)
+        results.append(measure("single", single, queries, args.batch_size))
+
+        # The pickled copy build_index also writes is loaded in memory to save it sharded
+        from langchain_community.vectorstores import FAISS
+
+        in_memory = FAISS.load_local(str(Path(tmp) / "pickle"), embedder, allow_dangerous_deserialization=True)
+        index_store.SHARD_MAX_VECTORS = -(-args.chunks // args.shards)
+        save_vectorstore(in_memory, str(Path(tmp) / "sharded"), shard_by="size")
+        sharded = load_vectorstore(str(Path(tmp) / "sharded"), embedder)
+        results.append(measure(f"{len(sharded.shards)} shards", sharded, queries, args.batch_size))
+
+        # Same top 5 for every query
+        for query in queries[:20]:
+            expected = [doc.id for doc, _ in single.similarity_search_with_score(query, k=5)]
+            assert [doc.id for doc, _ in sharded.similarity_search_with_score(query, k=5)] == expected
+        del single, sharded, in_memory
+
+    print(f"{'index':<10} {'p50 ms':>8} {'p95 ms':>8} {'batch QPS':>10}")
+    for r in results:
+        print(f"{r['index']:<10} {r['search']['p50_ms']:>8.2f} {r['search']['p95_ms']:>8.2f} {r['batch_qps']:>10.0f}")
+    speedup = results[0]["search"]["p50_ms"] / max(results[1]["search"]["p50_ms"], 1e-9)
+    print(f"Single-query speed-up: {speedup:.2f}x with {args.threads} threads")
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "results": results}, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
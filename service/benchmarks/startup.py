@@ -0,0 +1,104 @@
+"""
+Time to first healthy: how long the ML service takes to come up.
+
+Starts the API with uvicorn several times and polls it from the moment the
+process is launched. Reported per run and as the median:
+- live: first 200 from /health/live (the process is serving)
+- ready: first 200 from /health/ready (the warmup has loaded the embedding
+  model, the agent stack and the shared index, if there is one)
+- the warmup's own duration and the server's RSS once ready
+
+The service runs with the fake LLM and its usual VECTOR_DB_PATH; pass
+--no-index to start it without a shared index.
+
+Usage:
+    python -m benchmarks.startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.load_test import SERVICE_ROOT, _request
+
+
+POLL_SECONDS = 0.02
+
+
+def start_once(port: int, env: dict, timeout: float) -> dict:
+    """Launch the service, wait for liveness and readiness, stop it."""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=SERVICE_ROOT,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+    )
+    live = ready = None
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"Service exited with code {process.returncode}")
+            if live is None and _request("GET", f"http://127.0.0.1:{port}/health/live", timeout=1)[0] == 200:
+                live = time.perf_counter() - start
+            if live is not None:
+                status, body = _request("GET", f"http://127.0.0.1:{port}/health/ready", timeout=1)
+                if status == 200:
+                    ready = time.perf_counter() - start
+                    break
+            time.sleep(POLL_SECONDS)
+        if ready is None:
+            raise RuntimeError("Service did not become ready in time")
+
+        _, server = _request("GET", f"http://127.0.0.1:{port}/metrics")
+        return {
+            "live_seconds": live,
+            "ready_seconds": ready,
+            "warmup_seconds": body["warmup_seconds"],
+            "rss_mb": server["rss_mb"],
+        }
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=300, help="Seconds to wait for readiness")
+    parser.add_argument("--no-index", action="store_true", help="Start without a shared index")
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    scratch = tempfile.mkdtemp(prefix="startup_")
+    env = {"LLM_PROVIDER": "fake", "USER_INDEX_DIR": scratch}
+    if args.no_index:
+        env.update(VECTOR_DB_PATH=str(Path(scratch) / "no_index"), AUTO_BUILD_INDEX="0")
+
+    print(f"{'run':>3} {'live s':>7} {'ready s':>8} {'warmup s':>9} {'RSS MB':>7}")
+    runs = []
+    for i in range(args.runs):
+        r = start_once(args.port, env, args.timeout)
+        runs.append(r)
+        print(f"{i + 1:>3} {r['live_seconds']:>7.2f} {r['ready_seconds']:>8.2f} {r['warmup_seconds']:>9.2f} {r['rss_mb']:>7.0f}")
+
+    median = {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+    print(
+        f"med {median['live_seconds']:>7.2f} {median['ready_seconds']:>8.2f} "
+        f"{median['warmup_seconds']:>9.2f} {median['rss_mb']:>7.0f}"
+    )
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "runs": runs, "median": median}, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
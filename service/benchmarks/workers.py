@@ -0,0 +1,111 @@
+"""
+Throughput and memory of the pre-fork server (api/server.py) by worker count.
+
+For each worker count the service is started with the fake LLM, as
+benchmarks/load_test.py --spawn does, warmed up, and driven with /query
+requests. Reported per count:
+- QPS and p50/p95 latency of /query
+- memory of all the service's processes: the sum of their RSS, which counts
+  pages shared between processes (model weights, mapped index vectors) once
+  per process, and the sum of their PSS, which splits shared pages between
+  the processes sharing them: what the workers really cost together
+
+With a fake LLM latency the workload is mostly waiting, which one worker
+already overlaps; --llm-latency-ms 0 measures the CPU-bound part (embedding,
+search, the graph) that more workers parallelize.
+
+Usage:
+    python -m benchmarks.workers --workers 1 2 4 --queries 400 --concurrency 16
+    python -m benchmarks.workers --upload contracts/a.pdf --llm-latency-ms 0
+"""
+
+import argparse
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from benchmarks.load_test import QUERIES, _post_file, _post_json, run_workload, spawn_service
+
+
+def _process_tree(pid: int) -> list:
+    """pid and its children (the pre-fork master and its workers)."""
+    try:
+        children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+    except FileNotFoundError:
+        children = []
+    return [pid, *map(int, children)]
+
+
+def _memory_mb(pids: list) -> dict:
+    """Summed RSS and PSS of processes, from /proc/<pid>/smaps_rollup."""
+    totals = {"rss_mb": 0.0, "pss_mb": 0.0}
+    for pid in pids:
+        try:
+            lines = Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss"):
+                totals[f"{name.lower()}_mb"] += int(value.split()[0]) / 1024
+    return totals
+
+
+def measure(workers: int, args) -> dict:
+    scratch = tempfile.mkdtemp(prefix="workers_")
+    process = spawn_service(args.port, {
+        "LLM_PROVIDER": "fake",
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+        "USER_INDEX_DIR": scratch,
+        "SERVICE_PID_FILE": os.path.join(scratch, "service.pid"),
+    }, workers=workers)
+    url = f"http://127.0.0.1:{args.port}"
+    try:
+        payload = {}
+        if args.upload:
+            _post_file(f"{url}/index-document", {"user_id": "bench", "session_id": "warmup"}, args.upload)
+            payload = {"user_id": "bench"}
+
+        def query(i):
+            return _post_json(f"{url}/query", {"query": QUERIES[i % len(QUERIES)], **payload})
+
+        # Every worker loads its agent before the measurement
+        run_workload("warmup", query, 4 * workers, workers)
+        result = run_workload("/query", query, args.queries, args.concurrency)
+        memory = _memory_mb(_process_tree(process.pid))
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {"workers": workers, **memory, **result}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--queries", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency-ms", type=float, default=50, help="Fake LLM latency per call")
+    parser.add_argument("--upload", type=Path, help="Query a user index built from this file, not the shared one")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--json", type=Path, help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    print(f"{'workers':>7} {'QPS':>7} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7} {'RSS MB':>8} {'PSS MB':>8}")
+    results = []
+    for workers in args.workers:
+        r = measure(workers, args)
+        results.append(r)
+        print(
+            f"{r['workers']:>7} {r['qps']:>7.1f} {r.get('p50_ms', 0):>8.1f} {r.get('p95_ms', 0):>8.1f} "
+            f"{sum(r['errors'].values()):>7} {r['rss_mb']:>8.0f} {r['pss_mb']:>8.0f}"
+        )
+
+    if args.json:
+        args.json.write_text(json.dumps({"args": vars(args), "results": results}, indent=2, default=str))
+        print(f"Results written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,11 @@
 Legal Assistant Agent - Main Entry Point
 
 Commands:
-    python main.py build    - Build vector index from CUAD dataset
+    python main.py build    - Build vector index from CUAD dataset (a running api.server reloads it)
     python main.py run      - Run interactive agent
-    python main.py eval     - Run evaluation
+    python main.py eval     - Retrieval recall/MRR/latency on CUAD QA (see benchmarks/retrieval.py)
+    python main.py bench    - Load test the API offline (see benchmarks/load_test.py)
+    python main.py export-onnx - Export the embedding model for EMBEDDING_BACKEND=onnx / onnx-int8
 """
 
 import sys
@@ -27,6 +29,7 @@ INDEX_PATH = DATA_DIR / "embeddings" / "faiss_index"
 def build_index(max_contracts: int = 20):
     """Build vector index from CUAD dataset."""
     from utils import get_embedder, build_vectorstore, save_vectorstore, load_documents
+    from utils.clauses import build_clause_prototypes
 
     print("Building vector index...")
     texts, metadatas = load_documents(str(DATA_DIR), max_contracts=max_contracts)
@@ -37,12 +40,20 @@ def build_index(max_contracts: int = 20):
 
     print(f"Saving index to {INDEX_PATH}...")
     save_vectorstore(vector_db, str(INDEX_PATH))
+
+    print("Building clause prototypes...")
+    build_clause_prototypes(embedder, str(DATA_DIR), max_contracts=max_contracts)
+
+    from api.server import notify_reload
+
+    if notify_reload():
+        print("Told the running service to reload the index")
     print("Done!")
 
 
 def run_agent():
     """Run interactive legal assistant."""
-    from utils import get_embedder, load_vectorstore
+    from utils import get_embedder, index_exists, load_vectorstore
     from agents import build_graph, run_query, format_response
 
     print("=" * 60)
@@ -51,7 +62,7 @@ def run_agent():
 
     # Load vector store
     vector_db = None
-    if INDEX_PATH.exists():
+    if index_exists(INDEX_PATH):
         print("\nLoading knowledge base...")
         embedder = get_embedder()
         vector_db = load_vectorstore(str(INDEX_PATH), embedder)
@@ -84,47 +95,10 @@ def run_agent():
 
 
 def run_evaluation():
-    """Run evaluation metrics."""
-    from utils import get_embedder, load_vectorstore
-    from agents import build_graph, run_query
-    from evaluation.metrics import evaluate_agent_response, EvaluationRunner, print_evaluation_report
+    """Score retrieval against the CUAD gold answer spans (see benchmarks/retrieval.py)."""
+    from benchmarks.retrieval import main as retrieval_benchmark
 
-    if not INDEX_PATH.exists():
-        print("No index found. Run 'python main.py build' first.")
-        return
-
-    embedder = get_embedder()
-    vector_db = load_vectorstore(str(INDEX_PATH), embedder)
-    app = build_graph(vector_db=vector_db)
-
-    queries = [
-        "What are the termination conditions?",
-        "Explain the indemnification clause.",
-        "Are there non-compete restrictions?",
-    ]
-
-    runner = EvaluationRunner()
-    for i, query in enumerate(queries, 1):
-        print(f"\n[{i}/{len(queries)}] Evaluating: {query}")
-        print("-" * 60)
-        result = run_query(app, query)
-        eval_result = evaluate_agent_response(
-            query=query,
-            retrieved_docs=result["retrieved_documents"],
-            reasoning_chain=result["reasoning_chain"],
-            final_explanation=result["final_explanation"]
-        )
-        runner.add_result(eval_result)
-
-        # Print detailed report for each query
-        print(print_evaluation_report(eval_result, verbose=True))
-        print("\n")
-
-    # Print aggregate summary at the end
-    print("\n" + "=" * 60)
-    print("FINAL AGGREGATE SUMMARY")
-    print("=" * 60)
-    print(runner.print_summary())
+    retrieval_benchmark(["--data-dir", str(DATA_DIR), *sys.argv[2:]])
 
 
 def main():
@@ -141,6 +115,14 @@ def main():
         run_agent()
     elif command == "eval":
         run_evaluation()
+    elif command == "export-onnx":
+        from utils.embeddings import export_onnx
+
+        print(f"ONNX model written to {export_onnx()}")
+    elif command == "bench":
+        from benchmarks.load_test import main as load_test
+
+        load_test(sys.argv[2:])
     else:
         print(f"Unknown command: {command}")
         print(__doc__)
@@ -1,3 +1,3 @@
 #!/bin/bash
 export PYTHONPATH=.
-python api/main.py
+python -m api.server
@@ -0,0 +1,62 @@
+"""Fixtures shared by the service tests: fake embedders, a small contract index, appends, and no LLM cache."""
+
+import time
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agents import llm_cache
+from utils import build_vectorstore
+from utils.index_store import append_chunks
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Records the size of every forward pass (embed_documents call); each takes `latency` seconds."""
+
+    batches: list = []
+    latency: float = 0.0
+    fail: bool = False
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        self.batches.append(len(texts))
+        if self.fail:
+            raise RuntimeError("model crashed")
+        return super().embed_documents(texts)
+
+
+@pytest.fixture(autouse=True)
+def no_llm_cache(monkeypatch):
+    """Tests never read or write the on-disk LLM cache."""
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", False)
+
+
+@pytest.fixture
+def embedder():
+    return DeterministicFakeEmbedding(size=32)
+
+
+@pytest.fixture
+def counting_embedder():
+    """counting_embedder(**fields): a new CountingEmbeddings with its own list of batches."""
+    return lambda **fields: CountingEmbeddings(**{"size": 32, "batches": [], **fields})
+
+
+@pytest.fixture
+def vector_db(embedder):
+    """20 termination clauses of one contract, ids c0 to c19."""
+    texts = [f"Clause {i}: either party may terminate on {i} days notice." for i in range(20)]
+    metadatas = [{"chunk": i, "chunk_id": f"c{i}", "source": "contract.txt"} for i in range(20)]
+    return build_vectorstore(texts, metadatas, embedder, ids=[m["chunk_id"] for m in metadatas])
+
+
+@pytest.fixture
+def append(embedder):
+    """append(root, start, count, **metadata) adds royalty clauses a<start>... to an index as new segments."""
+    def append(root, start, count, **metadata):
+        texts = [f"Appendix {i}: the licensee shall pay royalties quarterly." for i in range(start, start + count)]
+        ids = [f"a{i}" for i in range(start, start + count)]
+        metadatas = [{"chunk": i, "chunk_id": f"a{i}", **metadata} for i in range(start, start + count)]
+        return append_chunks(root, texts, embedder.embed_documents(texts), metadatas, ids)
+
+    return append
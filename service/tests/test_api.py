@@ -0,0 +1,115 @@
+"""HTTP API: health checks, the upload size limit and batch queries."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from agents import build_graph, usage
+from agents.llm import FakeChatModel
+from agents.usage import TokenUsage
+from api import main
+from api.uploads import UploadSizeLimitMiddleware
+
+
+SERVICE_DIR = Path(__file__).parent.parent
+
+
+def test_health_does_not_import_the_agents():
+    # In a fresh process: the tests' own imports load the agents
+    code = """
+import json, sys
+from fastapi.testclient import TestClient
+from api.main import app
+body = TestClient(app).get("/health").json()
+print(json.dumps({"breaker": body["llm_breaker"], "agents": "agents" in sys.modules}))
+"""
+    output = subprocess.run([sys.executable, "-c", code], cwd=SERVICE_DIR, capture_output=True, text=True, check=True)
+    assert json.loads(output.stdout.strip().splitlines()[-1]) == {"breaker": "unknown", "agents": False}
+
+
+def test_upload_size_limit():
+    app = FastAPI()
+
+    @app.post("/index-document")
+    async def index_document(request: Request):
+        return {"size": len(await request.body())}
+
+    app.add_middleware(UploadSizeLimitMiddleware, max_bytes=100)
+    # The endpoint fails on the disconnect the middleware feeds it after a 413
+    client = TestClient(app, raise_server_exceptions=False)
+
+    assert client.post("/index-document", content=b"x" * 100).json() == {"size": 100}
+    assert client.post("/index-document", content=b"x" * 101).status_code == 413
+    # Chunked: no Content-Length, counted as it streams in
+    assert client.post("/index-document", content=iter([b"x" * 60, b"x" * 60])).status_code == 413
+    for content_length in ("abc", "-5"):
+        response = client.post("/index-document", content=b"x", headers={"content-length": content_length})
+        assert response.status_code == 400 and response.json() == {"detail": "Invalid Content-Length header"}
+
+
+@pytest.fixture
+def client(vector_db, tmp_path, monkeypatch):
+    """The API over the contract index, with a fake LLM and its own token budget."""
+    agent = build_graph(vector_db, llm=FakeChatModel(output_tokens=20))
+    monkeypatch.setattr(main, "_lazy_load_user_index", lambda user_id: (agent, vector_db, {}, None))
+    monkeypatch.setattr(usage, "_usage", TokenUsage(tmp_path / "usage.sqlite"))
+    return TestClient(main.app)
+
+
+def batch(client, queries):
+    response = client.post("/query/batch", json={"queries": queries, "user_id": "alice"})
+    assert response.status_code == 200 and response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_results_carry_their_question_index(client):
+    queries = [f"Can either party terminate on {i} days notice?" for i in range(6)]
+
+    results = batch(client, queries)
+
+    # In completion order; each line says which question it answers
+    assert sorted(result["index"] for result in results) == list(range(6))
+    for result in results:
+        assert result["query"] == queries[result["index"]]
+        assert len(result["retrieved_documents"]) == 5 and result["final_explanation"]
+
+
+def test_batch_question_failure_is_its_own_line(client, monkeypatch):
+    run = main._run_or_degrade
+
+    def run_or_fail(agent, db, query, *args, **kwargs):
+        if "royalties" in query:
+            raise RuntimeError("graph failed")
+        return run(agent, db, query, *args, **kwargs)
+
+    monkeypatch.setattr(main, "_run_or_degrade", run_or_fail)
+
+    results = {result["index"]: result for result in batch(client, ["Who may terminate?", "Are royalties due?"])}
+
+    assert results[1] == {"index": 1, "query": "Are royalties due?", "error": "graph failed"}
+    assert "error" not in results[0] and results[0]["query"] == "Who may terminate?"
+
+
+def test_batch_rejects_empty_and_oversized_requests(client, monkeypatch):
+    monkeypatch.setattr(main, "QUERY_BATCH_MAX", 3)
+
+    for queries in ([], ["Who may terminate?", "  "]):
+        response = client.post("/query/batch", json={"queries": queries})
+        assert response.status_code == 400 and response.json() == {"detail": "Queries cannot be empty"}
+    response = client.post("/query/batch", json={"queries": ["Who may terminate?"] * 4})
+    assert response.status_code == 400 and response.json() == {"detail": "At most 3 queries per batch"}
+
+
+def test_batch_search_failure_is_a_500_with_detail(client, monkeypatch):
+    def search_fails(*args):
+        raise OSError("index segment unreadable")
+
+    monkeypatch.setattr("agents.batch_search_documents", search_fails)
+
+    response = client.post("/query/batch", json={"queries": ["Who may terminate?"]})
+    assert response.status_code == 500 and response.json() == {"detail": "Error: index segment unreadable"}
@@ -0,0 +1,77 @@
+"""Structure-aware chunking: boundaries, token budget and overlap, long tokens, streaming."""
+
+from utils import chunking
+from utils.chunking import chunk_contract, chunk_spans, count_tokens, iter_contract_chunks, token_spans
+
+
+SECTIONS = [
+    "ARTICLE 1 DEFINITIONS\nCapitalized terms have the meanings given to them in this Article.",
+    "1. Term\nThis agreement starts on the effective date and lasts three years.",
+    "2. Termination\nEither party may terminate this agreement on thirty days written notice.",
+    "(a) Notices shall be given in writing to the addresses set out above.",
+    "GOVERNING LAW\nThis agreement is governed by the laws of the State of New York.",
+]
+
+
+def contract(sections: int) -> str:
+    """A contract of numbered sections, each a few sentences long."""
+    return "\n\n".join(
+        f"{i}. Section {i}\nThe supplier shall deliver the goods within {i} days. "
+        f"Payment is due {i * 10} days after delivery; late payments bear interest."
+        for i in range(1, sections + 1)
+    )
+
+
+def test_sections_start_chunks():
+    text = "\n\n".join(SECTIONS)
+
+    spans = chunk_spans(text, max_tokens=20, overlap_tokens=4)
+
+    # Every section is too big to share a chunk with the next
+    assert [heading for _, _, heading in spans] == [
+        "ARTICLE 1 DEFINITIONS", "1. Term", "2. Termination", SECTIONS[3][:chunking.HEADING_MAX_CHARS], "GOVERNING LAW"
+    ]
+    assert [text[start:end] for start, end, _ in spans] == SECTIONS
+    # With room for all of them, sections are packed into one chunk
+    assert chunk_contract(text, max_tokens=256) == [text]
+
+
+def test_token_budget_and_overlap():
+    text = " ".join(f"Clause {i} of the agreement binds both parties." for i in range(60))
+
+    spans = chunk_spans(text, max_tokens=50, overlap_tokens=10)
+
+    assert len(spans) > 1 and spans[0][0] == 0 and spans[-1][1] == len(text)
+    assert all(count_tokens(text[start:end]) <= 50 for start, end, _ in spans)
+    for (_, previous_end, _), (start, _, _) in zip(spans, spans[1:]):
+        # Pieces end at sentence ends, and the next repeats at most 10 of their tokens
+        assert text[previous_end - 1] == "." and start < previous_end
+        assert count_tokens(text[start:previous_end]) <= 10
+
+
+def test_text_without_spaces_is_cut():
+    for text in ["a" * 20000, "合同条款" * 6750]:
+        spans = chunk_spans(text)
+        assert len(spans) > 20 and spans[-1][1] == len(text)
+        assert all(count_tokens(text[start:end]) <= chunking.MAX_TOKENS for start, end, _ in spans)
+
+    # Ordinary words are one token each; longer runs one per WORD_PIECE_CHARS characters
+    starts, ends = token_spans("indemnification " + "x" * 18)
+    assert (ends - starts).tolist() == [15, 4, 4, 4, 4, 2]
+
+
+def test_empty_text():
+    assert chunk_spans("") == []
+    assert chunk_spans(" \n\t ") == []
+    assert list(iter_contract_chunks([])) == []
+    assert list(iter_contract_chunks(["", "  "])) == []
+
+
+def test_streaming_matches_whole_text(monkeypatch):
+    text = contract(80)
+    expected = [(text[start:end], heading) for start, end, heading in chunk_spans(text, 64, 8)]
+    assert len(expected) > 10
+
+    monkeypatch.setattr(chunking, "STREAM_WINDOW_CHARS", 1000)
+    pieces = [text[i:i + 300] for i in range(0, len(text), 300)]
+    assert list(iter_contract_chunks(pieces, 64, 8)) == expected
@@ -0,0 +1,30 @@
+"""Clause types: naming in queries and chunk classification."""
+
+import numpy as np
+import pytest
+
+from utils.clauses import classify_chunks, detect_clause_types
+
+
+def test_clause_types_named_in_queries():
+    assert detect_clause_types("Is there a non-compete, and which law governs?") == ["Non-Compete", "Governing Law"]
+    assert detect_clause_types("Does the licensee get MFN pricing?") == ["Most Favored Nation"]
+    assert detect_clause_types("What is the warranty period in the supply agreement?") == ["Warranty Duration"]
+    # Single words used in questions about anything else name no clause type
+    for query in ["Is there a warranty?", "Can we audit the supplier?", "What happens on a merger?",
+                  "Is the license perpetual?", "Who pays the royalty?", "Can the agreement be terminated?"]:
+        assert detect_clause_types(query) == []
+
+
+@pytest.mark.parametrize("vector, expected", [
+    ([1.0, 0.0, 0.0], [("A", 1.0)]),
+    # Within CLAUSE_MARGIN of the best type: both
+    ([1.0, 1.0, 0.0], [("A", 0.7071), ("B", 0.7071)]),
+    ([1.0, 0.9, 0.0], [("A", 0.7433)]),
+    # Below CLAUSE_MIN_SIMILARITY to every type: none
+    ([-1.0, 0.0, 0.2], []),
+])
+def test_chunks_classified_by_prototype_similarity(vector, expected):
+    prototypes = (["A", "B", "C"], np.eye(3, dtype=np.float32))
+    assert classify_chunks(np.array([vector]), prototypes) == [expected]
+    assert classify_chunks(np.zeros((0, 3)), prototypes) == []
@@ -0,0 +1,153 @@
+"""LLM dispatcher: priority classes, per-user round-robin, limits, the model wrapper and the circuit breaker."""
+
+import threading
+import time
+
+import pytest
+
+from agents import dispatcher as dispatcher_module
+from agents.dispatcher import (
+    BATCH, INTERACTIVE, PRIORITIES, CircuitBreaker, LLMDispatcher, LLMUnavailableError, dispatch_as, dispatched
+)
+from agents.llm import FakeChatModel
+from agents.reasoner import ReasoningOutput
+from utils import metrics
+
+
+def _queue(dispatcher, granted, priority, user_id):
+    """Start a thread waiting for a slot; returns once its ticket is queued."""
+    def waiting():
+        stats = dispatcher.stats()
+        return sum(stats[priority]["waiting"] for priority in PRIORITIES)
+
+    before = waiting()
+
+    def call():
+        ticket = dispatcher.acquire(10, priority, user_id)
+        granted.append(user_id)
+        dispatcher.release(ticket)
+
+    thread = threading.Thread(target=call)
+    thread.start()
+    while waiting() == before:
+        time.sleep(0.001)
+    return thread
+
+
+def test_interactive_first_then_users_in_turn():
+    dispatcher = LLMDispatcher(max_concurrency=1, batch_max_concurrency=1, rpm=0, tpm=0)
+    held = dispatcher.acquire(10, BATCH, "loader")
+    granted = []
+    threads = [
+        _queue(dispatcher, granted, BATCH, "alice"),
+        _queue(dispatcher, granted, BATCH, "alice"),
+        _queue(dispatcher, granted, BATCH, "bob"),
+        _queue(dispatcher, granted, INTERACTIVE, "carol"),
+    ]
+
+    dispatcher.release(held)
+    for thread in threads:
+        thread.join()
+
+    assert granted == ["carol", "alice", "bob", "alice"]
+
+
+def test_batch_leaves_slots_to_interactive():
+    dispatcher = LLMDispatcher(max_concurrency=2, batch_max_concurrency=1, rpm=0, tpm=0)
+    held = dispatcher.acquire(10, BATCH, "alice")
+    granted = []
+    thread = _queue(dispatcher, granted, BATCH, "alice")
+
+    # The batch call waits, an interactive one starts at once
+    ticket = dispatcher.acquire(10, INTERACTIVE, "bob")
+    assert dispatcher.stats()[BATCH] == {"running": 1, "waiting": 1}
+    dispatcher.release(ticket)
+    dispatcher.release(held)
+    thread.join()
+    assert granted == ["alice"]
+
+
+def test_token_limit_corrected_by_reported_usage():
+    # 6000 tokens a minute: 100 a second
+    dispatcher = LLMDispatcher(max_concurrency=4, batch_max_concurrency=4, rpm=0, tpm=6000)
+
+    # A call estimated at the whole minute's tokens that used few of them is refunded the rest
+    dispatcher.release(dispatcher.acquire(6000), 100)
+    start = time.monotonic()
+    dispatcher.release(dispatcher.acquire(5900), 5900)
+    assert time.monotonic() - start < 0.1
+
+    # The minute's tokens are spent: 100 more wait for a second of refill
+    start = time.monotonic()
+    dispatcher.release(dispatcher.acquire(100))
+    assert 0.5 < time.monotonic() - start < 2
+
+
+def test_wrapped_model_calls_are_dispatched():
+    dispatcher = LLMDispatcher(max_concurrency=1, batch_max_concurrency=1, rpm=0, tpm=0)
+    model = FakeChatModel(output_tokens=5)
+    llm = dispatched(model, dispatcher)
+    before = metrics.snapshot()["counters"].get("llm.calls.batch", 0)
+
+    with dispatch_as(BATCH, "alice"):
+        reply = llm.invoke("Can the agreement be terminated?")
+        structured = llm.with_structured_output(ReasoningOutput).invoke("Analyse the clause")
+
+    assert reply.content == model.invoke("Can the agreement be terminated?").content
+    assert isinstance(structured, ReasoningOutput)
+    assert metrics.snapshot()["counters"]["llm.calls.batch"] == before + 2
+    # Cache entries are keyed as the wrapped model's
+    assert llm._get_llm_string() == model._get_llm_string()  # pylint: disable=protected-access
+    assert dispatched(llm) is llm
+
+
+def test_breaker_opens_after_timeouts_and_closes_after_a_probe(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "LLM_TIMEOUT", 0.05)
+    breaker = CircuitBreaker(failures=2, cooldown=0.3)
+    dispatcher = LLMDispatcher(max_concurrency=4, batch_max_concurrency=4, rpm=0, tpm=0, breaker=breaker)
+    slow = dispatched(FakeChatModel(latency_ms=500, output_tokens=5), dispatcher)
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            slow.invoke("Can the agreement be terminated?")
+    assert breaker.state == "open"
+
+    # Open: calls fail at once, even to a model that would answer
+    fast = dispatched(FakeChatModel(output_tokens=5), dispatcher)
+    start = time.monotonic()
+    with pytest.raises(LLMUnavailableError):
+        fast.invoke("Can the agreement be terminated?")
+    assert time.monotonic() - start < 0.05
+
+    time.sleep(0.3)
+    assert breaker.state == "half-open"
+    fast.invoke("Can the agreement be terminated?")
+    assert breaker.state == "closed"
+
+
+class RejectingChatModel(FakeChatModel):
+    """A provider that answers every call with an error of the request's own."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise ValueError("Unparsable reply")
+
+
+def test_probe_failing_with_a_request_error_closes_the_breaker():
+    breaker = CircuitBreaker(failures=1, cooldown=0.1)
+    dispatcher = LLMDispatcher(max_concurrency=4, batch_max_concurrency=4, rpm=0, tpm=0, breaker=breaker)
+    breaker.failure()
+    time.sleep(0.1)
+    assert breaker.state == "half-open"
+
+    with pytest.raises(ValueError, match="Unparsable reply"):
+        dispatched(RejectingChatModel(), dispatcher).invoke("Can the agreement be terminated?")
+    # The provider answered: the probe ended and later calls go through
+    assert breaker.state == "closed" and not breaker.is_open()
+    dispatched(FakeChatModel(output_tokens=5), dispatcher).invoke("Can the agreement be terminated?")
+
+    # A probe that neither succeeds nor fails lets the next call probe
+    breaker.failure()
+    time.sleep(0.1)
+    assert breaker.allow() and breaker.is_open()
+    breaker.end_probe()
+    assert not breaker.is_open() and breaker.allow()
@@ -0,0 +1,52 @@
+"""PDF extraction on the shared process pool."""
+
+import threading
+
+import pytest
+
+from utils import extraction
+from utils.extraction import iter_pdf_pages
+
+
+def fake_page_count(path):
+    return 40
+
+
+def fake_extract(path, start, stop):
+    return [f"{path} page {i}" for i in range(start, stop)]
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    """Pools started while the test runs, extracting with a fake backend."""
+    started = []
+
+    class CountingPool(extraction.ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            started.append(self)
+
+    monkeypatch.setitem(extraction.PDF_BACKENDS, "fake", ("json", fake_page_count, fake_extract))
+    monkeypatch.setattr(extraction, "ProcessPoolExecutor", CountingPool)
+    monkeypatch.setattr(extraction, "PDF_WORKERS", 2)
+    extraction.shutdown_pool()
+    yield started
+    extraction.shutdown_pool()
+
+
+def test_concurrent_uploads_share_one_pool(pools):
+    results = {}
+
+    def upload(name, workers):
+        results[name] = list(iter_pdf_pages(name, backend="fake", workers=workers))
+
+    # Different worker counts no longer replace (and cancel) the pool another upload is using
+    threads = [threading.Thread(target=upload, args=(f"doc{i}.pdf", 2 + i % 3)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(pools) == 1
+    assert results == {f"doc{i}.pdf": fake_extract(f"doc{i}.pdf", 0, 40) for i in range(6)}
+    assert list(iter_pdf_pages("inline.pdf", backend="fake", workers=1)) == fake_extract("inline.pdf", 0, 40)
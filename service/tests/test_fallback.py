@@ -0,0 +1,38 @@
+"""Retrieval-only answers: passages with the question's words highlighted, UNVERIFIED."""
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agents.explainer import DISCLAIMER
+from agents.fallback import UNVERIFIED, highlight, highlight_spans, retrieval_only_result
+from utils import build_vectorstore
+
+
+def test_highlight_spans_match_word_forms():
+    text = "Either party may terminate. Termination notice is due in 30 days."
+    spans = highlight_spans(text, "Can the agreement be terminated with notice?")
+    assert [text[start:end] for start, end in spans] == ["terminate", "Termination notice"]
+
+
+def test_highlight_escapes_markdown_and_cuts_long_passages():
+    assert highlight("Fees *net* 30_days", "fees") == "**Fees** \\*net\\* 30\\_days"
+
+    text = "Recitals. " * 100 + "The licensee shall pay royalties quarterly. " + "Boilerplate. " * 100
+    excerpt = highlight(text, "When are royalties paid?")
+    assert excerpt.startswith("…") and excerpt.endswith("…")
+    assert "**royalties**" in excerpt and len(excerpt) < 700
+
+
+def test_retrieval_only_result():
+    vector_db = build_vectorstore(
+        ["Either party may terminate on 30 days notice.", "Licensee shall pay a fee."],
+        [{"source": "a.pdf"}, {"source": "a.pdf"}],
+        DeterministicFakeEmbedding(size=32)
+    )
+    result = retrieval_only_result(vector_db, "Can the agreement be terminated?", reason="timed out")
+
+    assert result["verification_status"] == UNVERIFIED
+    assert len(result["documents"]) == 2
+    assert "**Passage 1** (a.pdf)" in result["final_explanation"]
+    assert "**terminate**" in result["final_explanation"]
+    assert result["final_explanation"].endswith(DISCLAIMER)
+    assert result["reasoning_chain"] == ["Retrieval only: timed out."]
@@ -0,0 +1,50 @@
+"""Agent graph state: partial node updates, no duplicated messages."""
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from agents import build_graph, render_documents, run_query
+from agents.llm import FakeChatModel
+from agents.retriever import create_retriever_agent
+
+
+@pytest.fixture
+def llm():
+    return FakeChatModel(latency_ms=0, output_tokens=20)
+
+
+def test_messages_not_duplicated(vector_db, llm):
+    state = run_query(build_graph(vector_db, llm=llm), "Can the agreement be terminated?")
+
+    messages = state["messages"]
+    assert len(messages) == 4
+    assert isinstance(messages[0], HumanMessage)
+    assert [m.content.split("]")[0] for m in messages[1:]] == ["[Retriever", "[Reasoner", "[Explainer"]
+    assert all(isinstance(m, AIMessage) for m in messages[1:])
+
+
+def test_state_references_documents(vector_db, llm):
+    state = run_query(build_graph(vector_db, llm=llm), "termination notice")
+
+    assert len(state["documents"]) == 5
+    assert all(set(document) == {"id", "score"} for document in state["documents"])
+    texts = render_documents(vector_db, state["documents"])
+    assert texts[0].startswith("[Document 1] Clause ")
+
+
+def test_retriever_returns_only_its_keys(vector_db, llm):
+    retrieve = create_retriever_agent(vector_db, llm)
+    state = {
+        "user_query": "termination",
+        "conversation": "",
+        "documents": [],
+        "reasoning_chain": [],
+        "verification_status": "",
+        "final_explanation": "",
+        "messages": [HumanMessage(content="termination")],
+    }
+
+    update = retrieve(state)
+
+    assert set(update) == {"documents", "messages"}
+    assert len(update["messages"]) == 1
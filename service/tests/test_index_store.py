@@ -0,0 +1,226 @@
+"""On-disk index format: round trip, lazy chunks, snapshots, segments, legacy indexes."""
+
+import json
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from utils import batch_similarity_search, load_vectorstore, save_vectorstore
+from utils import index_store
+from utils.index_store import (
+    CHUNKS_FILE,
+    INDEX_FILE,
+    LEGACY_DOCSTORE_FILE,
+    MANIFEST_FILE,
+    ChunkStore,
+    current_manifest,
+    merge_index,
+    merge_segments,
+    plan_merge,
+    read_manifest,
+)
+
+
+def test_round_trip(tmp_path, embedder, vector_db):
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+
+    assert {path.name for path in (tmp_path / "index").iterdir()} == {"CURRENT", "LOCK", "snapshots", "segments"}
+    manifest = read_manifest(current_manifest(tmp_path / "index"))
+    assert (manifest["version"], manifest["dim"], manifest["count"]) == (2, 32, 20)
+    segment = tmp_path / "index" / "segments" / manifest["segments"][0]["name"]
+    assert {path.name for path in segment.iterdir()} == {INDEX_FILE, CHUNKS_FILE}
+
+    loaded = load_vectorstore(str(tmp_path / "index"), embedder)
+    assert isinstance(loaded.docstore, ChunkStore)
+    assert loaded.index_to_docstore_id == vector_db.index_to_docstore_id
+
+    query = "Clause 7: either party may terminate on 7 days notice."
+    expected = vector_db.similarity_search_with_score(query, k=3)
+    results = loaded.similarity_search_with_score(query, k=3)
+    assert [(d.id, d.page_content, d.metadata) for d, _ in results] == [
+        (d.id, d.page_content, d.metadata) for d, _ in expected
+    ]
+    assert [s for _, s in results] == pytest.approx([s for _, s in expected])
+
+
+def test_add_and_delete_after_load(tmp_path, embedder, vector_db):
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    loaded = load_vectorstore(str(tmp_path / "index"), embedder)
+
+    loaded.add_texts(["A new indemnification clause."], metadatas=[{"chunk": 20}], ids=["c20"])
+    loaded.delete(ids=["c3", "c4"])
+    with pytest.raises(ValueError, match="already exist"):
+        loaded.docstore.add({"c5": vector_db.docstore.search("c5")})
+    assert loaded.docstore.search("c3") == "ID c3 not found."
+
+    save_vectorstore(loaded, str(tmp_path / "index"))
+    reloaded = load_vectorstore(str(tmp_path / "index"), embedder)
+    ids = set(reloaded.index_to_docstore_id.values())
+    assert reloaded.index.ntotal == len(ids) == 19
+    assert "c20" in ids and not {"c3", "c4"} & ids
+    assert reloaded.docstore.search("c20").page_content == "A new indemnification clause."
+
+
+def test_legacy_index_converted(tmp_path, embedder, vector_db):
+    vector_db.save_local(str(tmp_path / "index"))
+
+    loaded = load_vectorstore(str(tmp_path / "index"), embedder)
+    assert loaded.index.ntotal == 20
+    assert not (tmp_path / "index" / LEGACY_DOCSTORE_FILE).exists()
+    assert not (tmp_path / "index" / INDEX_FILE).exists()
+
+    reloaded = load_vectorstore(str(tmp_path / "index"), embedder)
+    assert isinstance(reloaded.docstore, ChunkStore)
+    assert reloaded.docstore.search("c0").metadata == {"chunk": 0, "chunk_id": "c0", "source": "contract.txt"}
+
+
+def test_version_1_index_upgraded_on_append(tmp_path, embedder, vector_db, append):
+    save_vectorstore(vector_db, str(tmp_path / "new"))
+    manifest = read_manifest(current_manifest(tmp_path / "new"))
+    segment = tmp_path / "new" / "segments" / manifest["segments"][0]["name"]
+    shutil.copytree(segment, tmp_path / "index")
+    del manifest["segments"]
+    (tmp_path / "index" / MANIFEST_FILE).write_text(json.dumps({**manifest, "version": 1}))
+
+    assert load_vectorstore(str(tmp_path / "index"), embedder).index.ntotal == 20
+    append(tmp_path / "index", 0, 2)
+
+    manifest = read_manifest(current_manifest(tmp_path / "index"))
+    assert manifest["version"] == 2 and len(manifest["segments"]) == 2
+    assert not (tmp_path / "index" / MANIFEST_FILE).exists()
+    assert load_vectorstore(str(tmp_path / "index"), embedder).index.ntotal == 22
+
+
+def test_unknown_version_rejected(tmp_path, embedder, vector_db):
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    manifest_path = current_manifest(tmp_path / "index")
+    manifest = json.loads(manifest_path.read_text())
+    manifest_path.write_text(json.dumps({**manifest, "version": 99}))
+
+    with pytest.raises(ValueError, match="Unsupported index format"):
+        load_vectorstore(str(tmp_path / "index"), embedder)
+
+
+def test_old_snapshots_collected(tmp_path, embedder, vector_db, monkeypatch):
+    monkeypatch.setattr(index_store, "SNAPSHOT_KEEP", 1)
+    for _ in range(4):
+        save_vectorstore(vector_db, str(tmp_path / "index"))
+
+    snapshots = sorted((tmp_path / "index" / "snapshots").iterdir())
+    assert len(snapshots) == 2
+    assert snapshots[-1] == current_manifest(tmp_path / "index")
+    assert len(list((tmp_path / "index" / "segments").iterdir())) == 2
+
+
+def test_loaded_segments_kept_until_released(tmp_path, embedder, vector_db, monkeypatch):
+    monkeypatch.setattr(index_store, "SNAPSHOT_KEEP", 0)
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    reader = load_vectorstore(str(tmp_path / "index"), embedder)
+    held = reader.docstore.paths[0].parent
+
+    for _ in range(2):
+        save_vectorstore(vector_db, str(tmp_path / "index"))
+    assert held.exists()
+    assert reader.similarity_search("Clause 3", k=2)[0].page_content.startswith("Clause")
+
+    reader.docstore.close()
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    assert not held.exists()
+    assert len(list((tmp_path / "index" / "segments").iterdir())) == 1
+
+
+def test_failed_save_keeps_current(tmp_path, embedder, vector_db, monkeypatch):
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    before = current_manifest(tmp_path / "index")
+    segments = sorted((tmp_path / "index" / "segments").iterdir())
+
+    def crash(rows, path):
+        path.write_bytes(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(index_store, "_write_chunks", crash)
+    with pytest.raises(OSError):
+        save_vectorstore(vector_db, str(tmp_path / "index"))
+
+    assert current_manifest(tmp_path / "index") == before
+    assert sorted((tmp_path / "index" / "segments").iterdir()) == segments
+    assert load_vectorstore(str(tmp_path / "index"), embedder).index.ntotal == 20
+
+
+def test_append_writes_only_new_chunks(tmp_path, embedder, vector_db, append):
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    base = next((tmp_path / "index" / "segments").iterdir())
+    base_mtime = (base / INDEX_FILE).stat().st_mtime_ns
+
+    assert append(tmp_path / "index", 0, 3)["count"] == 23
+    manifest = read_manifest(current_manifest(tmp_path / "index"))
+    assert [segment["count"] for segment in manifest["segments"]] == [20, 3]
+    assert (base / INDEX_FILE).stat().st_mtime_ns == base_mtime
+
+    loaded = load_vectorstore(str(tmp_path / "index"), embedder)
+    assert loaded.index.ntotal == 23
+    query = "Appendix 1: the licensee shall pay royalties quarterly."
+    doc, score = loaded.similarity_search_with_score(query, k=1)[0]
+    assert (doc.id, score) == ("a1", pytest.approx(0.0, abs=1e-5))
+    assert batch_similarity_search(loaded, [query], k=1)[0][0][0].id == "a1"
+
+
+def test_plan_merge_size_tiers():
+    def manifest(*counts):
+        return {"segments": [{"name": f"s{i}", "count": count} for i, count in enumerate(counts)]}
+
+    assert plan_merge(manifest(1000, 10, 12, 9), factor=4) is None
+    assert plan_merge(manifest(1000, 10, 12, 9, 11), factor=4) == ["s1", "s2", "s3", "s4"]
+    assert plan_merge(manifest(1000, 40, 50, 60, 1, 2, 3, 2), factor=4) == ["s4", "s5", "s6", "s7"]
+
+
+def test_merge_keeps_results(tmp_path, embedder, vector_db, append, monkeypatch):
+    monkeypatch.setattr(index_store, "INDEX_MERGE_FACTOR", 4)
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    for start in range(0, 20, 5):
+        append(tmp_path / "index", start, 5)
+    query = "Appendix 7: the licensee shall pay royalties quarterly."
+    before = load_vectorstore(str(tmp_path / "index"), embedder).similarity_search(query, k=5)
+
+    assert merge_index(tmp_path / "index") == 1
+    manifest = read_manifest(current_manifest(tmp_path / "index"))
+    assert [segment["count"] for segment in manifest["segments"]] == [20, 20]
+    after = load_vectorstore(str(tmp_path / "index"), embedder).similarity_search(query, k=5)
+    assert [doc.id for doc in after] == [doc.id for doc in before]
+
+
+def test_merge_drops_deleted_chunks(tmp_path, embedder, vector_db, append):
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    append(tmp_path / "index", 0, 5)
+
+    assert merge_segments(tmp_path / "index", drop_ids={"c0", "a2", "missing"}) == 2
+    manifest = read_manifest(current_manifest(tmp_path / "index"))
+    assert [segment["count"] for segment in manifest["segments"]] == [23]
+    loaded = load_vectorstore(str(tmp_path / "index"), embedder)
+    assert not {"c0", "a2"} & set(loaded.index_to_docstore_id.values())
+    assert loaded.docstore.search("a3").page_content.startswith("Appendix 3")
+
+
+def test_mmap_load_is_read_only(tmp_path, embedder, vector_db, append):
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    append(tmp_path / "index", 0, 3)
+
+    loaded = load_vectorstore(str(tmp_path / "index"), embedder, mmap=True)
+    query = "Appendix 2: the licensee shall pay royalties quarterly."
+    assert loaded.similarity_search(query, k=1)[0].id == "a2"
+    with pytest.raises(RuntimeError):
+        loaded.index.add(np.zeros((1, 32), dtype=np.float32))
+
+
+def test_chunks_readable_after_fork(tmp_path, embedder, vector_db):
+    save_vectorstore(vector_db, str(tmp_path / "index"))
+    loaded = load_vectorstore(str(tmp_path / "index"), embedder, mmap=True)
+
+    pid = os.fork()
+    if pid == 0:
+        ok = loaded.similarity_search("Clause 3: either party may terminate on 3 days notice.", k=1)[0].id == "c3"
+        os._exit(0 if ok else 1)
+    assert os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]) == 0
+    assert loaded.docstore.search("c4").page_content.startswith("Clause 4")
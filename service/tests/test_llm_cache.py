@@ -0,0 +1,104 @@
+"""The SQLite LLM cache: size accounting, LRU eviction, and which models it caches."""
+
+import sqlite3
+
+import pytest
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, Generation
+
+from agents import llm_cache
+from agents.llm import FakeChatModel
+from agents.llm_cache import SQLiteLLMCache, StageCache, with_cache
+from agents.reasoner import ReasoningOutput
+
+
+def reply(text: str) -> list:
+    return [Generation(text=text)]
+
+
+def stored_size(cache: SQLiteLLMCache) -> int:
+    with sqlite3.connect(str(cache.path)) as conn:
+        return conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+
+
+def test_size_table_follows_inserts_upserts_and_deletes(tmp_path):
+    cache = SQLiteLLMCache(tmp_path / "cache.sqlite", max_bytes=1 << 20)
+
+    for i in range(5):
+        cache.update(f"prompt {i}", "fake", reply("short"))
+    # Replacing an entry with a longer reply counts only the new one
+    cache.update("prompt 0", "fake", reply("a much longer reply " * 20))
+    assert cache.stats()["entries"] == 5
+    assert cache.stats()["bytes"] == stored_size(cache)
+
+    cache.clear()
+    assert cache.stats() == {"entries": 0, "bytes": 0, "max_bytes": 1 << 20}
+
+    # A second process opening the file shares the total
+    cache.update("prompt 1", "fake", reply("short"))
+    assert SQLiteLLMCache(cache.path).stats()["bytes"] == stored_size(cache) > 0
+
+
+def test_least_recently_used_entries_evicted(tmp_path):
+    entry = SQLiteLLMCache(tmp_path / "probe.sqlite")
+    entry.update("p", "fake", reply("x" * 100))
+    size = entry.stats()["bytes"]
+    cache = SQLiteLLMCache(tmp_path / "cache.sqlite", max_bytes=size * 10)
+
+    for i in range(10):
+        cache.update(f"prompt {i}", "fake", reply("x" * 100))
+    assert cache.lookup("prompt 0", "fake") == reply("x" * 100)
+    cache.update("prompt 10", "fake", reply("x" * 100))
+
+    # Trimmed to 90% of the maximum: the two oldest untouched entries go
+    assert cache.stats()["bytes"] <= size * 9
+    assert cache.lookup("prompt 1", "fake") is None and cache.lookup("prompt 2", "fake") is None
+    assert cache.lookup("prompt 0", "fake") is not None and cache.lookup("prompt 10", "fake") is not None
+
+    # A reply bigger than the whole cache is not stored
+    cache.update("huge", "fake", reply("x" * size * 20))
+    assert cache.lookup("huge", "fake") is None
+
+
+@pytest.mark.parametrize("temperature, cached", [(0, True), (0.0, True), (None, False), (0.7, False)])
+def test_only_temperature_zero_cached(tmp_path, monkeypatch, temperature, cached):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_cache", SQLiteLLMCache(tmp_path / "cache.sqlite"))
+    llm = FakeChatModel(temperature=temperature)
+
+    wrapped = with_cache(llm, "reasoner")
+
+    assert isinstance(wrapped.cache, StageCache) == cached
+    if not cached:
+        assert wrapped is llm
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = SQLiteLLMCache(tmp_path / "cache.sqlite")
+    cache.update("prompt", "fake", reply("answer"))
+    with sqlite3.connect(str(cache.path)) as conn:
+        conn.execute("UPDATE llm_cache SET value = ?", ('{"lc": 1, "type": "not_implemented", "id": ["x"]}',))
+
+    assert cache.lookup("prompt", "fake") is None
+    # The entry is gone, so the call's reply can be stored again
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+    cache.update("prompt", "fake", reply("answer"))
+    assert cache.lookup("prompt", "fake") == reply("answer")
+
+
+def test_structured_reply_cached_as_plain_data(tmp_path):
+    cache = SQLiteLLMCache(tmp_path / "cache.sqlite")
+    output = ReasoningOutput(
+        concepts=["termination"], claims=[{"statement": "Either party may terminate.", "documents": [1]}],
+        gaps=[], status="VERIFIED"
+    )
+    # As ChatOpenAI replies in json_schema mode
+    message = AIMessage(content=output.model_dump_json(), additional_kwargs={"parsed": output})
+
+    cache.update("prompt", "openai", [ChatGeneration(message=message)])
+    cached = cache.lookup("prompt", "openai")
+
+    assert ReasoningOutput(**cached[0].message.additional_kwargs["parsed"]) == output
+    assert cached[0].message.content == output.model_dump_json()
+    # The caller's reply is left as it was
+    assert message.additional_kwargs["parsed"] is output
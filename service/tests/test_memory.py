@@ -0,0 +1,52 @@
+"""Session memory: the bounded conversation window and compaction into a summary."""
+
+import pytest
+
+from agents import memory
+from agents.llm import FakeChatModel
+from agents.memory import SessionMemory, render_window
+from utils.chunking import count_tokens
+
+
+def exchange(i: int, words: int = 40):
+    question = f"Question {i}: " + " ".join(["clause"] * words)
+    answer = f"Answer {i}: " + " ".join(["term"] * words)
+    return question, answer
+
+
+@pytest.mark.parametrize("max_tokens", [20, 60, 150, 400])
+def test_window_fits_its_budget(max_tokens):
+    summary = " ".join(["earlier"] * 500)
+    turns = [("user" if i % 2 == 0 else "assistant", " ".join([f"turn{i}end"] * 30)) for i in range(12)]
+
+    window = render_window(summary, turns, max_tokens)
+
+    assert window.startswith("Summary of earlier conversation: earlier")
+    assert count_tokens(window) <= max_tokens
+    # The most recent turns are kept, in order
+    kept = [i for i in range(12) if f"turn{i}end" in window]
+    assert kept == list(range(12 - len(kept), 12))
+
+
+def test_window_of_an_empty_session():
+    assert render_window("", []) == ""
+    assert render_window("", [("user", "Hello")]) == "Recent turns:\nUser: Hello"
+
+
+def test_compact_keeps_the_latest_exchange(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory, "HISTORY_MAX_TOKENS", 120)
+    monkeypatch.setattr(memory, "SUMMARY_MAX_TOKENS", 40)
+    store = SessionMemory(tmp_path / "sessions.sqlite")
+
+    assert not store.append_turn("alice", "s1", "Who are the parties?", "Acme and Globex.")
+    needs_compaction = [store.append_turn("alice", "s1", *exchange(i)) for i in range(3)]
+    assert needs_compaction[-1]
+
+    store.compact("alice", "s1", FakeChatModel(output_tokens=100))
+
+    summary, turns = store.load("alice", "s1")
+    assert summary and count_tokens(summary) <= 40
+    # Older exchanges are folded; the last one stays verbatim even though it alone exceeds the budget
+    assert turns == [("user", exchange(2)[0]), ("assistant", exchange(2)[1])]
+    # Another session is untouched
+    assert store.load("alice", "s2") == ("", [])
@@ -0,0 +1,57 @@
+"""Query micro-batching: concurrent embed_query calls share forward passes."""
+
+import threading
+import time
+
+import pytest
+
+from utils.embeddings import MicroBatchingEmbeddings
+
+
+def embed_concurrently(embedder, texts):
+    results, errors = {}, []
+
+    def call(text):
+        try:
+            results[text] = embedder.embed_query(text)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(text,)) for text in texts]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
+
+
+def test_concurrent_queries_embedded_together(counting_embedder):
+    model = counting_embedder(latency=0.02)
+    embedder = MicroBatchingEmbeddings(model, max_batch=8, max_wait_ms=50)
+    texts = [f"Can the agreement be terminated after {i} days?" for i in range(20)]
+
+    results, errors = embed_concurrently(embedder, texts)
+
+    assert not errors
+    # 20 queries in passes of at most 8 (the first alone, the model being idle), instead of 20 passes of one
+    assert sum(model.batches) == 20 and max(model.batches) <= 8 and len(model.batches) <= 5
+    assert all(results[text] == model.embed_query(text) for text in texts)
+
+
+def test_lone_query_does_not_wait(counting_embedder):
+    model = counting_embedder(latency=0.02)
+    embedder = MicroBatchingEmbeddings(model, max_batch=8, max_wait_ms=500)
+    start = time.monotonic()
+    assert embedder.embed_query("Who owns the IP?") == model.embed_query("Who owns the IP?")
+    # One 20 ms pass, none of the window: the model was idle
+    assert time.monotonic() - start < 0.2
+    assert model.batches == [1]
+    assert MicroBatchingEmbeddings(model, max_wait_ms=0).embed_query("Who owns the IP?")
+
+
+def test_batch_failure_raised_by_every_caller(counting_embedder):
+    embedder = MicroBatchingEmbeddings(counting_embedder(latency=0.02, fail=True), max_batch=4, max_wait_ms=50)
+    results, errors = embed_concurrently(embedder, [f"query {i}" for i in range(6)])
+    assert not results and len(errors) == 6
+    with pytest.raises(RuntimeError, match="model crashed"):
+        embedder.embed_query("query")
@@ -0,0 +1,63 @@
+"""Query expansion from the clause type table, and fused multi-phrasing search."""
+
+import pytest
+
+from utils import batch_fused_similarity_search, fused_similarity_search
+from utils.clauses import expand_query
+
+
+def test_named_clause_type_rephrased():
+    assert expand_query("Is there a non-compete?") == [
+        "Is there a non-compete?",
+        "Is there a covenant not to compete?",
+        "Is there a restriction on competition?",
+    ]
+    assert expand_query("Which law governs?", max_variants=3) == [
+        "Which law governs?", "Which governing law?", "Which choice of law?"
+    ]
+    assert expand_query("Which law governs?", max_variants=1) == ["Which law governs?"]
+
+
+def test_related_clause_types_appended():
+    assert expand_query("Can the agreement be terminated early?") == [
+        "Can the agreement be terminated early?",
+        "Can the agreement be terminated early? termination for convenience",
+        "Can the agreement be terminated early? post-termination services",
+        "Can the agreement be terminated early? notice period to terminate renewal",
+    ]
+    # Words of every contract relate it to no clause type
+    assert expand_query("What does the contract say?") == ["What does the contract say?"]
+
+
+@pytest.fixture
+def embedder(counting_embedder):
+    return counting_embedder()
+
+
+def test_fused_search_embeds_and_searches_once(vector_db, monkeypatch):
+    searches = []
+    search = vector_db.index.search
+    monkeypatch.setattr(vector_db.index, "search", lambda x, k, **kw: searches.append(len(x)) or search(x, k, **kw))
+    queries = ["Clause 3: either party may terminate", "Clause 7: either party may terminate", "unrelated words"]
+    vector_db.embeddings.batches.clear()
+
+    fused = fused_similarity_search(vector_db, queries, k=5)
+
+    assert vector_db.embeddings.batches == [3] and searches == [3]
+    single = {query: vector_db.similarity_search_with_score(query, k=5) for query in queries}
+    # Ranked by reciprocal rank fusion of the phrasings' own results, with their scores
+    ranks = {}
+    for query in queries:
+        for rank, (doc, score) in enumerate(single[query], 1):
+            ranks[doc.id] = ranks.get(doc.id, 0.0) + 1 / (60 + rank)
+    assert [doc.id for doc, _ in fused] == sorted(ranks, key=ranks.get, reverse=True)[:5]
+    best = {}
+    for query in queries:
+        for doc, score in single[query]:
+            best[doc.id] = min(score, best.get(doc.id, score))
+    assert [score for _, score in fused] == pytest.approx([best[doc.id] for doc, _ in fused])
+    assert len({doc.id for doc, _ in fused}) == 5
+
+    # Several questions share the pass; a single phrasing is a plain search
+    assert [len(r) for r in batch_fused_similarity_search(vector_db, [queries, queries[:1]], k=4)] == [4, 4]
+    assert fused_similarity_search(vector_db, queries[:1], k=5) == single[queries[0]]
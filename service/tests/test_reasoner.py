@@ -0,0 +1,43 @@
+"""Reasoner: structured output, citations and verification status."""
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agents.llm import FakeChatModel
+from agents.reasoner import ClaimOutput, ReasoningOutput, _verification_status, create_reasoner_agent
+from utils import build_vectorstore
+
+
+def _output(status, gaps=()):
+    return ReasoningOutput(
+        concepts=["termination"],
+        claims=[ClaimOutput(statement="Either party may terminate.", documents=[1])],
+        gaps=list(gaps),
+        status=status,
+    )
+
+
+def test_status_without_claims_is_insufficient():
+    assert _verification_status(_output("VERIFIED"), []) == "INSUFFICIENT_EVIDENCE"
+
+
+def test_status_with_gaps_is_at_most_partial():
+    claims = [{"statement": "Either party may terminate.", "documents": ["a"]}]
+    assert _verification_status(_output("VERIFIED", gaps=["Notice period"]), claims) == "PARTIALLY_VERIFIED"
+    assert _verification_status(_output("VERIFIED"), claims) == "VERIFIED"
+
+
+def test_claims_cite_retrieved_documents():
+    vector_db = build_vectorstore(
+        ["Either party may terminate on 30 days notice.", "Licensee shall pay a fee."],
+        [{}, {}],
+        DeterministicFakeEmbedding(size=32)
+    )
+    documents = [{"id": doc_id, "score": 0.0} for doc_id in vector_db.index_to_docstore_id.values()]
+    reason = create_reasoner_agent(FakeChatModel(), vector_db)
+
+    update = reason({"user_query": "Can the agreement be terminated?", "conversation": "", "documents": documents})
+
+    ids = {document["id"] for document in documents}
+    assert all(set(claim["documents"]) <= ids for claim in update["claims"])
+    assert update["verification_status"] in ("VERIFIED", "PARTIALLY_VERIFIED", "INSUFFICIENT_EVIDENCE")
+    assert len(update["reasoning_chain"]) < 10
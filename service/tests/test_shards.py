@@ -0,0 +1,118 @@
+"""Sharded indexes: routing, scatter-gather search, appends, splits, copies and compaction."""
+
+import pytest
+
+from utils import batch_similarity_search, load_vectorstore, save_vectorstore
+from utils import index_store
+from utils.index_store import (
+    copy_index,
+    index_exists,
+    index_version,
+    merge_index,
+    merge_segments,
+    read_shard_map,
+    shard_key,
+)
+from utils.vectorstore import ShardedVectorStore
+
+
+QUERIES = [
+    "Either party may terminate on 7 days notice.",
+    "The licensee shall pay royalties quarterly.",
+    "Upload 3: the supplier warrants the goods.",
+]
+
+
+@pytest.fixture
+def vector_db(vector_db):
+    """The contract's 20 clauses (CUAD) and 10 chunks uploaded by a user."""
+    texts = [f"Upload {i}: the supplier warrants the goods for {i} months." for i in range(10)]
+    metadatas = [{"chunk_id": f"u{i}", "user_id": "alice", "type": "user_upload"} for i in range(10)]
+    vector_db.add_texts(texts, metadatas, ids=[m["chunk_id"] for m in metadatas])
+    return vector_db
+
+
+def same_results(results, expected):
+    assert [doc.id for doc, _ in results] == [doc.id for doc, _ in expected]
+    assert [score for _, score in results] == pytest.approx([score for _, score in expected])
+
+
+def test_shard_keys():
+    assert shard_key({"title": "CUAD"}, "corpus") == "cuad"
+    assert shard_key({"type": "user_upload"}, "corpus") == "uploads"
+    assert shard_key({"user_id": "alice"}, "user") == shard_key({"user_id": "alice", "chunk": 2}, "user")
+    assert shard_key({}, "user") == "shared"
+    assert shard_key({"user_id": "alice"}, "size") == "all"
+    with pytest.raises(ValueError, match="Unknown shard policy"):
+        shard_key({}, "tenant")
+
+
+def test_sharded_search_matches_single_index(tmp_path, embedder, vector_db):
+    save_vectorstore(vector_db, str(tmp_path / "index"), shard_by="corpus")
+
+    shard_map = read_shard_map(tmp_path / "index")
+    assert [shard["key"] for shard in shard_map["shards"]] == ["cuad", "uploads"]
+    loaded = load_vectorstore(str(tmp_path / "index"), embedder)
+    assert isinstance(loaded, ShardedVectorStore) and loaded.ntotal == 30
+
+    for query in QUERIES:
+        same_results(loaded.similarity_search_with_score(query, k=5), vector_db.similarity_search_with_score(query, k=5))
+
+    def live(metadata):
+        return metadata["chunk_id"] not in {"c7", "u3"}
+
+    for results, expected in zip(
+        batch_similarity_search(loaded, QUERIES, k=5, filter=live),
+        batch_similarity_search(vector_db, QUERIES, k=5, filter=live),
+    ):
+        same_results(results, expected)
+    assert loaded.docstore.search("u3").metadata["user_id"] == "alice"
+
+
+def test_appends_routed_and_oversized_shards_split(tmp_path, embedder, vector_db, append, monkeypatch):
+    monkeypatch.setattr(index_store, "SHARD_MAX_VECTORS", 12)
+    root = tmp_path / "index"
+    save_vectorstore(vector_db, str(root), shard_by="corpus")
+    # 20 CUAD chunks are cut in two shards up front
+    assert [shard["key"] for shard in read_shard_map(root)["shards"]] == ["cuad", "cuad", "uploads"]
+
+    version = index_version(root)
+    appended = append(root, 0, 5, type="user_upload")
+    assert appended == {"count": 35, "needs_merge": True}
+    assert index_version(root) != version
+
+    # The uploads shard now holds 15 vectors: merge_index splits it
+    assert merge_index(root) == 1
+    shard_map = read_shard_map(root)
+    assert [shard["key"] for shard in shard_map["shards"]] == ["cuad", "cuad", "uploads", "uploads"]
+    assert not [path for path in (root / "shards").iterdir() if path.name not in {s["name"] for s in shard_map["shards"]}]
+
+    loaded = load_vectorstore(str(root), embedder)
+    assert loaded.ntotal == 35
+    assert loaded.similarity_search("Appendix 4: the licensee shall pay royalties quarterly.", k=1)[0].id == "a4"
+
+    # A key seen for the first time starts a shard
+    append(root, 5, 2, corpus="edgar")
+    assert read_shard_map(root)["shards"][-1]["key"] == "edgar"
+
+
+def test_copy_and_compact_sharded_index(tmp_path, embedder, vector_db):
+    save_vectorstore(vector_db, str(tmp_path / "base"), shard_by="corpus")
+    copy_index(tmp_path / "base", tmp_path / "copy")
+    assert index_exists(tmp_path / "copy")
+    cuad_shard = read_shard_map(tmp_path / "copy")["shards"][0]["name"]
+    cuad_version = index_version(tmp_path / "copy" / "shards" / cuad_shard)
+
+    # Only the shard holding dropped chunks is rewritten
+    assert merge_segments(tmp_path / "copy", drop_ids={"u1", "u2"}) == 2
+    assert index_version(tmp_path / "copy" / "shards" / cuad_shard) == cuad_version
+    loaded = load_vectorstore(str(tmp_path / "copy"), embedder)
+    assert loaded.ntotal == 28
+    assert isinstance(loaded.docstore.search("u1"), str)
+    assert load_vectorstore(str(tmp_path / "base"), embedder).ntotal == 30
+
+    # Saving unsharded replaces the shards (once no loaded store reads them)
+    del loaded
+    save_vectorstore(vector_db, str(tmp_path / "copy"), shard_by="")
+    assert read_shard_map(tmp_path / "copy") is None
+    assert not list((tmp_path / "copy" / "shards").iterdir())
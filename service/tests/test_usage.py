@@ -0,0 +1,46 @@
+"""Token budgets: usage counted from chain calls, cache hits free."""
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from agents import build_graph, llm_cache, run_query
+from agents.llm import FakeChatModel
+from agents.llm_cache import SQLiteLLMCache
+from agents.usage import TokenUsage, UsageCallback
+from utils import build_vectorstore
+
+
+def _graph():
+    vector_db = build_vectorstore(
+        ["Either party may terminate on 30 days notice.", "Licensee shall pay a fee."],
+        [{}, {}],
+        DeterministicFakeEmbedding(size=32)
+    )
+    return build_graph(vector_db=vector_db, llm=FakeChatModel(output_tokens=20))
+
+
+def test_usage_counts_every_call(tmp_path):
+    usage = TokenUsage(tmp_path / "usage.sqlite", budget=1000)
+    callback = UsageCallback("alice", usage)
+
+    run_query(_graph(), "Can the agreement be terminated?", callbacks=[callback])
+
+    # Retriever, reasoner and explainer
+    assert callback.tokens > 60
+    assert usage.used("alice") == callback.tokens
+    assert usage.remaining("alice") == 1000 - callback.tokens
+    assert usage.used("bob") == 0
+    assert TokenUsage(tmp_path / "usage.sqlite", budget=0).remaining("alice") is None
+
+
+def test_cached_answers_are_free(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_cache", SQLiteLLMCache(tmp_path / "cache.sqlite"))
+    usage = TokenUsage(tmp_path / "usage.sqlite", budget=10)
+    graph = _graph()
+
+    run_query(graph, "Can the agreement be terminated?", callbacks=[UsageCallback("alice", usage)])
+    spent = usage.used("alice")
+    run_query(graph, "Can the agreement be terminated?", callbacks=[UsageCallback("alice", usage)])
+
+    assert usage.used("alice") == spent > 0
+    assert usage.remaining("alice") == 0
@@ -0,0 +1,154 @@
+"""Per-user indexes: deduplicated uploads, tombstones, compaction and the clause index."""
+
+import hashlib
+
+import pytest
+
+from agents.retriever import search_documents
+from utils import fused_similarity_search, save_vectorstore, user_index
+from utils.clauses import expand_query, get_clause_prototypes
+from utils.user_index import (
+    DocumentRegistry,
+    clause_lookup,
+    compact_user_index,
+    index_user_document,
+    remove_user_documents,
+    user_registry_path,
+)
+
+
+CONTRACT = """1. Term
+This agreement starts on the effective date and lasts three years.
+
+2. Termination
+Either party may terminate this agreement on 30 days written notice.
+
+3. Governing Law
+This agreement is governed by the laws of the State of New York.
+"""
+
+
+@pytest.fixture(autouse=True)
+def user_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(user_index, "USER_INDEX_DIR", tmp_path / "users")
+
+
+@pytest.fixture
+def counting(counting_embedder):
+    """A CountingEmbeddings whose batches are the uploads' alone, not the clause prototypes'."""
+    embedder = counting_embedder()
+    get_clause_prototypes(embedder)
+    embedder.batches.clear()
+    return embedder
+
+
+def upload(tmp_path, embedder, text, name="contract.txt", session_id="s1", base_index_path=None):
+    path = tmp_path / name
+    path.write_text(text, encoding="utf-8")
+    content_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    return index_user_document("alice", session_id, name, str(path), content_hash, embedder, base_index_path)
+
+
+def sections(*edited):
+    """A contract of four sections too long to share a chunk; sections in `edited` reworded."""
+    return "\n\n".join(
+        f"{i}. Section {i}\n" + " ".join(
+            f"The {'buyer' if i in edited else 'supplier'} shall deliver lot {j} of section {i}." for j in range(20)
+        )
+        for i in range(1, 5)
+    )
+
+
+def test_duplicate_upload_is_not_indexed_again(tmp_path, counting):
+    first = upload(tmp_path, counting, sections(), session_id="s1")
+    assert not first["duplicate"] and first["chunks_created"] == first["chunks_embedded"] == 4
+
+    # Same bytes under another name, from another session
+    second = upload(tmp_path, counting, sections(), name="copy.txt", session_id="s2")
+
+    assert second["duplicate"] and second["chunks_embedded"] == 0
+    assert second["document_id"] == first["document_id"] and second["chunks_created"] == 4
+    assert counting.batches == [4]
+    registry = DocumentRegistry.load(user_registry_path("alice"))
+    assert registry.documents[first["document_id"]]["sessions"] == ["s1", "s2"]
+    assert set(registry.chunks.values()) == {1}
+
+
+def test_revised_upload_embeds_only_changed_chunks(tmp_path, counting):
+    original = upload(tmp_path, counting, sections())
+    revised = upload(tmp_path, counting, sections(3), name="contract-v2.txt")
+
+    assert not revised["duplicate"] and revised["chunks_created"] == 4 and revised["chunks_embedded"] == 1
+    assert counting.batches == [4, 1]
+    registry = DocumentRegistry.load(user_registry_path("alice"))
+    old_ids = registry.documents[original["document_id"]]["chunk_ids"]
+    new_ids = registry.documents[revised["document_id"]]["chunk_ids"]
+    # The untouched sections are shared by both versions
+    assert [registry.chunks[cid] for cid in old_ids] == [2, 2, 1, 2]
+    assert [registry.chunks[cid] for cid in new_ids] == [2, 2, 1, 2]
+    assert registry.index_size == 5
+
+    # Deleting the original kills only its own version of section 3
+    remove_user_documents("alice", document_id=original["document_id"])
+    registry = DocumentRegistry.load(user_registry_path("alice"))
+    assert registry.tombstones == {old_ids[2]}
+    assert registry.chunks == {cid: 1 for cid in new_ids}
+
+    # Uploading it again revives the tombstoned vector without embedding it
+    again = upload(tmp_path, counting, sections())
+    assert again["chunks_embedded"] == 0 and counting.batches == [4, 1]
+    registry = DocumentRegistry.load(user_registry_path("alice"))
+    assert not registry.tombstones and registry.chunks[old_ids[2]] == 1
+
+
+def test_deleting_the_only_upload_of_a_seeded_index_compacts_it(tmp_path, embedder, vector_db):
+    save_vectorstore(vector_db, str(tmp_path / "cuad"))
+    indexed = upload(tmp_path, embedder, CONTRACT, base_index_path=tmp_path / "cuad")
+    assert indexed["chunks_embedded"] > 0
+
+    # Few vectors next to the 20 seeded from CUAD, but all of the user's own
+    removed = remove_user_documents("alice", document_id=indexed["document_id"])
+    assert removed["removed_documents"] == [indexed["document_id"]]
+    assert removed["needs_compaction"]
+
+    assert compact_user_index("alice") == indexed["chunks_embedded"]
+    registry = DocumentRegistry.load(user_registry_path("alice"))
+    assert not registry.tombstones and registry.index_size == 20 and registry.tombstone_ratio == 0.0
+
+
+def test_clause_chunks_live_and_scoped_to_the_session():
+    registry = DocumentRegistry(user_registry_path("alice"))
+    registry.add_document("d1", "supply.txt", "s1", ["c1", "c2"])
+    registry.add_document("d2", "license.txt", "s2", ["c3", "c2"])
+    registry.add_clauses({
+        "c1": [("Warranty Duration", 0.6)],
+        "c2": [("Governing Law", 0.7), ("Warranty Duration", 0.5)],
+        "c3": [("Warranty Duration", 0.9)],
+    })
+
+    assert registry.clause_chunks(["Warranty Duration"]) == {"c1", "c2", "c3"}
+    assert registry.clause_chunks(["Warranty Duration"], session_id="s1") == {"c1", "c2"}
+    assert registry.clause_chunks(["Warranty Duration"], session_id="s3") == set()
+    assert registry.clause_chunks(["Cap On Liability"]) == set()
+
+    # c2 is still used by d2; c1 is dead
+    registry.remove_document("d1")
+    assert registry.clause_chunks(["Warranty Duration"]) == {"c2", "c3"}
+
+    registry.save()
+    lookup = clause_lookup("alice")
+    assert lookup("What is the warranty period of the license?", "s2") == {"c2", "c3"}
+    assert lookup("Is there a warranty?", "s2") == set()
+
+
+def test_clause_chunks_rank_first_among_search_results(vector_db):
+    query = "Either party may terminate on 12 days notice, warranty period"
+    plain = [doc.id for doc, _ in fused_similarity_search(vector_db, expand_query(query), k=20)]
+    boosted = {plain[4], plain[15]}
+
+    documents = search_documents(vector_db, query, clause_lookup=lambda query, session_id: boosted)
+
+    # The clause chunks first, then the best of the others, each in order of similarity to the query
+    assert [document["id"] for document in documents] == [plain[4], plain[15]] + plain[:3]
+    unboosted = search_documents(vector_db, query, clause_lookup=lambda query, session_id: set())
+    assert [document["id"] for document in unboosted] == plain[:5]
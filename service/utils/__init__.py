@@ -4,17 +4,44 @@ Utility modules for the Legal Assistant.
 - embeddings: Embedding models
 - vectorstore: Vector database operations
 - data_loader: Dataset loading and processing
+- chunking: Structure-aware contract chunking
+- extraction: Text extraction from uploaded documents
+- user_index: Per-user indexes and document registry
+- clauses: CUAD clause classification and query routing
+- metrics: In-process stage latency metrics
 """
 
-from .embeddings import get_embedder
-from .vectorstore import build_vectorstore, save_vectorstore, load_vectorstore
+from .embeddings import get_embedder, get_query_embedder
+from .vectorstore import (
+    build_vectorstore,
+    save_vectorstore,
+    load_vectorstore,
+    batch_similarity_search,
+    batch_fused_similarity_search,
+    fused_similarity_search,
+    index_exists,
+)
 from .data_loader import load_documents, chunk_text
+from .chunking import chunk_contract, iter_contract_chunks
+from .extraction import iter_document_text, SUPPORTED_EXTENSIONS
+from .user_index import index_user_document, user_index_path
 
 __all__ = [
     "get_embedder",
+    "get_query_embedder",
     "build_vectorstore",
     "save_vectorstore",
     "load_vectorstore",
+    "batch_similarity_search",
+    "batch_fused_similarity_search",
+    "fused_similarity_search",
+    "index_exists",
     "load_documents",
-    "chunk_text"
+    "chunk_text",
+    "chunk_contract",
+    "iter_contract_chunks",
+    "iter_document_text",
+    "SUPPORTED_EXTENSIONS",
+    "index_user_document",
+    "user_index_path"
 ]
@@ -0,0 +1,260 @@
+"""
+Structure-aware chunking for contracts.
+
+Contracts are split on their own structure (articles, sections, numbered
+clauses, lettered sub-clauses, all-caps headings) instead of fixed character
+windows. Small consecutive sections are packed together up to a token
+budget, sections longer than the budget are split at sentence boundaries
+with a token overlap.
+
+Tokens approximate the embedding model's word pieces: runs of word
+characters, single punctuation marks and single CJK ideographs, with runs
+longer than LONG_TOKEN_CHARS (identifiers, text without spaces) cut into
+pieces of WORD_PIECE_CHARS, so no text escapes the token budget.
+
+Tokens are found with a vectorized numpy scan over the text's code points,
+structural and sentence boundaries with precompiled regexes, and boundaries
+are mapped to token indices with numpy.searchsorted; the text is sliced
+exactly once per emitted chunk.
+"""
+
+import os
+import re
+import string
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+
+# all-MiniLM-L6-v2 truncates its input at 256 word pieces
+MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Longer runs of word characters are no dictionary word: the model splits
+# them into many word pieces, counted as one per WORD_PIECE_CHARS characters
+LONG_TOKEN_CHARS = 16
+WORD_PIECE_CHARS = 4
+
+# Word-piece-like pre-tokenization: runs of word characters, and single
+# punctuation marks. Code point classes: 0 space, 1 word, 2 punctuation;
+# non-ASCII code points are word characters unless listed below.
+_ASCII_CLASSES = np.full(128, 2, dtype=np.int8)
+_ASCII_CLASSES[[ord(c) for c in string.whitespace]] = 0
+_ASCII_CLASSES[[ord(c) for c in string.ascii_letters + string.digits + "_"]] = 1
+_UNICODE_SPACES = np.array([0xA0, 0x2002, 0x2003, 0x2009, 0x200B, 0x2028, 0x2029, 0x3000], dtype=np.uint32)
+_UNICODE_PUNCTUATION = np.array([ord(c) for c in "\u2018\u2019\u201c\u201d\u2013\u2014\u2022\u2026\u00a7\u00b6"], dtype=np.uint32)
+# CJK ideographs are one token each, as punctuation marks are
+_CJK_RANGES = ((0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF), (0x20000, 0x2FA1F))
+
+# Line starts that open a new unit of contract structure
+STRUCTURE_PATTERN = re.compile(
+    r"""^[ \t]*(?:
+        (?:ARTICLE|Article|SECTION|Section|SCHEDULE|Schedule|EXHIBIT|Exhibit|APPENDIX|Appendix)
+            [ \t]+[0-9IVXLC]+\b                 # Article IV, Section 3.2
+      | \d{1,2}(?:\.\d{1,3})*\.?[ \t]+(?=[A-Z(])  # 1. Definitions / 3.2 Term / 12.1.4 (a)
+      | \([a-z]{1,4}\)[ \t]+                    # (a) / (iv)
+      | [A-Z][A-Z0-9 ,;&'\-]{3,}[ \t]*$         # ALL CAPS HEADING
+    )""",
+    re.MULTILINE | re.VERBOSE,
+)
+
+# A long section may be split before a token that follows a blank line, or
+# that opens a sentence (capital, bracket or quote after . ; : ! ?)
+_SENTENCE_END = np.array([ord(c) for c in ".;:!?"], dtype=np.uint32)
+_SENTENCE_START = np.array([ord(c) for c in string.ascii_uppercase + "(\"'"], dtype=np.uint32)
+
+HEADING_MAX_CHARS = 100
+
+# Characters buffered before the streaming chunker cuts a window
+STREAM_WINDOW_CHARS = 64 * 1024
+
+
+def _scan(text: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Code points of a text and the (starts, ends) offsets of its tokens."""
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32)
+    classes = np.ones(len(codes), dtype=np.int8)
+    ascii_mask = codes < 128
+    classes[ascii_mask] = _ASCII_CLASSES[codes[ascii_mask]]
+    if not ascii_mask.all():
+        classes[np.isin(codes, _UNICODE_SPACES)] = 0
+        classes[np.isin(codes, _UNICODE_PUNCTUATION)] = 2
+        for low, high in _CJK_RANGES:
+            classes[(codes >= low) & (codes <= high)] = 2
+
+    is_word = classes == 1
+    is_punct = classes == 2
+    prev_word = np.concatenate(([False], is_word[:-1]))
+    next_word = np.concatenate((is_word[1:], [False]))
+
+    starts = np.flatnonzero((is_word & ~prev_word) | is_punct)
+    ends = np.flatnonzero((is_word & ~next_word) | is_punct) + 1
+
+    long = ends - starts > LONG_TOKEN_CHARS
+    if long.any():
+        pieces = -(-(ends[long] - starts[long]) // WORD_PIECE_CHARS)
+        offsets = np.arange(pieces.sum()) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+        piece_starts = np.repeat(starts[long], pieces) + offsets * WORD_PIECE_CHARS
+        piece_ends = np.minimum(piece_starts + WORD_PIECE_CHARS, np.repeat(ends[long], pieces))
+        # Tokens do not overlap, so sorted starts and ends stay paired
+        starts = np.sort(np.concatenate((starts[~long], piece_starts)))
+        ends = np.sort(np.concatenate((ends[~long], piece_ends)))
+    return codes, starts, ends
+
+
+def _sentence_breaks(codes: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Indices of the tokens a long section may be split before."""
+    if len(starts) < 2:
+        return np.empty(0, dtype=np.int64)
+
+    newlines = np.cumsum(codes == ord("\n"))
+    gap_start, gap_end = ends[:-1], starts[1:]
+    blank_line = newlines[gap_end - 1] - newlines[gap_start - 1] >= 2
+    sentence = (
+        (gap_end > gap_start)
+        & np.isin(codes[gap_start - 1], _SENTENCE_END)
+        & np.isin(codes[gap_end], _SENTENCE_START)
+    )
+    return np.flatnonzero(blank_line | sentence) + 1
+
+
+def token_spans(text: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Character offsets of the tokens in a text.
+
+    Returns:
+        (starts, ends) arrays; token i is text[starts[i]:ends[i]]
+    """
+    _, starts, ends = _scan(text)
+    return starts, ends
+
+
+def count_tokens(text: str) -> int:
+    """Approximate embedding-model token count of a text."""
+    return len(token_spans(text)[0])
+
+
+def _split_section(
+    start: int,
+    end: int,
+    breaks: np.ndarray,
+    max_tokens: int,
+    overlap_tokens: int
+) -> List[Tuple[int, int]]:
+    """Split token range [start, end) at sentence breaks into <= max_tokens pieces."""
+    pieces = []
+    while end - start > max_tokens:
+        limit = start + max_tokens
+        i = int(np.searchsorted(breaks, limit, side="right")) - 1
+        cut = int(breaks[i]) if i >= 0 and breaks[i] > start + max_tokens // 2 else limit
+        pieces.append((start, cut))
+        start = max(cut - overlap_tokens, start + 1)
+    pieces.append((start, end))
+    return pieces
+
+
+def chunk_spans(
+    text: str,
+    max_tokens: int = MAX_TOKENS,
+    overlap_tokens: int = OVERLAP_TOKENS
+) -> List[Tuple[int, int, str]]:
+    """
+    Compute structure-aware chunk boundaries.
+
+    Args:
+        text: Full contract text
+        max_tokens: Token budget per chunk
+        overlap_tokens: Overlap between pieces of a section that had to be split
+
+    Returns:
+        List of (char_start, char_end, section_heading) per chunk
+    """
+    codes, starts, ends = _scan(text)
+    n_tokens = len(starts)
+    if n_tokens == 0:
+        return []
+
+    heads = np.fromiter((m.start() for m in STRUCTURE_PATTERN.finditer(text)), dtype=np.int64)
+    section_starts = np.unique(np.concatenate(([0], np.searchsorted(starts, heads))))
+    section_starts = section_starts[section_starts < n_tokens]
+    section_ends = np.append(section_starts[1:], n_tokens)
+
+    breaks = _sentence_breaks(codes, starts, ends)
+
+    # Pack whole sections up to the budget; split the ones that are too long.
+    # A pack too small to stand alone (e.g. a bare "ARTICLE 4" heading) is
+    # carried into the next section rather than emitted as its own chunk.
+    min_pack = max_tokens // 8
+    ranges: List[Tuple[int, int, int]] = []  # (token_start, token_end, heading_section_start)
+    pack_start = pack_end = None
+    for s, e in zip(section_starts.tolist(), section_ends.tolist()):
+        if pack_start is not None and e - pack_start <= max_tokens:
+            pack_end = e
+            continue
+        range_start = s
+        if pack_start is not None:
+            if pack_end - pack_start < min_pack:
+                range_start = pack_start
+            else:
+                ranges.append((pack_start, pack_end, pack_start))
+            pack_start = None
+        if e - range_start > max_tokens:
+            ranges.extend(
+                (a, b, s) for a, b in _split_section(range_start, e, breaks, max_tokens, overlap_tokens)
+            )
+        else:
+            pack_start, pack_end = range_start, e
+    if pack_start is not None:
+        ranges.append((pack_start, pack_end, pack_start))
+
+    result = []
+    for token_start, token_end, section_start in ranges:
+        heading_start = int(starts[section_start])
+        heading_end = text.find("\n", heading_start, heading_start + HEADING_MAX_CHARS)
+        if heading_end == -1:
+            heading_end = heading_start + HEADING_MAX_CHARS
+        result.append((
+            int(starts[token_start]),
+            int(ends[token_end - 1]),
+            text[heading_start:heading_end].strip()
+        ))
+    return result
+
+
+def chunk_contract(
+    text: str,
+    max_tokens: int = MAX_TOKENS,
+    overlap_tokens: int = OVERLAP_TOKENS
+) -> List[str]:
+    """Split contract text into structure-aware chunks."""
+    return [text[start:end] for start, end, _ in chunk_spans(text, max_tokens, overlap_tokens)]
+
+
+def iter_contract_chunks(
+    pieces: Iterable[str],
+    max_tokens: int = MAX_TOKENS,
+    overlap_tokens: int = OVERLAP_TOKENS
+) -> Iterator[Tuple[str, str]]:
+    """
+    Structure-aware chunking over a stream of consecutive text pieces.
+
+    Only a window of about STREAM_WINDOW_CHARS is buffered: every chunk of
+    the window except the last is emitted, and the last one is carried over
+    since the next piece may continue it.
+
+    Yields:
+        (chunk_text, section_heading)
+    """
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        if len(buffer) < STREAM_WINDOW_CHARS:
+            continue
+
+        spans = chunk_spans(buffer, max_tokens, overlap_tokens)
+        if len(spans) < 2:
+            continue
+        for start, end, heading in spans[:-1]:
+            yield buffer[start:end], heading
+        buffer = buffer[spans[-1][0]:]
+
+    for start, end, heading in chunk_spans(buffer, max_tokens, overlap_tokens):
+        yield buffer[start:end], heading
@@ -0,0 +1,417 @@
+"""
+CUAD clause types: ingestion-time chunk classification and query routing.
+
+Every chunk of an uploaded document is compared (cosine similarity) against
+one prototype embedding per CUAD clause category, so no LLM is involved.
+Prototypes are the embedded category descriptions, refined with the mean
+embedding of CUAD's gold answer spans when `python main.py build` has
+written them to CLAUSE_PROTOTYPES_PATH.
+
+Queries are routed lexically: the chunks classified under the categories a
+query names (by name or by an unambiguous alias) are ranked first among its
+vector search results. The same table expands queries for vector search
+(expand_query): a clause type is rephrased with its other names.
+"""
+
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+CLAUSE_PROTOTYPES_PATH = Path(
+    os.getenv(
+        "CLAUSE_PROTOTYPES_PATH",
+        str(Path(__file__).parent.parent / "data" / "embeddings" / "clause_prototypes.npz")
+    )
+)
+
+# A chunk is tagged with every type scoring at least CLAUSE_MIN_SIMILARITY and
+# within CLAUSE_MARGIN of its best type, at most CLAUSE_MAX_TYPES of them
+CLAUSE_MIN_SIMILARITY = float(os.getenv("CLAUSE_MIN_SIMILARITY", "0.45"))
+CLAUSE_MARGIN = 0.05
+CLAUSE_MAX_TYPES = 3
+
+# Phrasings of a query searched together, the query included (1: no expansion)
+QUERY_EXPANSION_VARIANTS = int(os.getenv("QUERY_EXPANSION_VARIANTS", "4"))
+
+# The 41 CUAD categories: (description, aliases used to spot them in queries)
+CLAUSE_TYPES: Dict[str, Tuple[str, List[str]]] = {
+    "Document Name": (
+        "The name of the contract",
+        ["document name", "contract name", "name of the agreement", "title of the agreement"]),
+    "Parties": (
+        "The two or more parties who signed the contract",
+        ["party names", "who signed", "signatories"]),
+    "Agreement Date": (
+        "The date of the contract",
+        ["agreement date", "contract date", "date of the agreement", "signing date"]),
+    "Effective Date": (
+        "The date when the contract is effective",
+        ["effective date", "commencement date"]),
+    "Expiration Date": (
+        "On what date will the contract's initial term expire",
+        ["expiration date", "expiry date", "initial term", "when does the agreement expire"]),
+    "Renewal Term": (
+        "What is the renewal term after the initial term expires, including automatic extensions "
+        "and unilateral extensions with prior notice",
+        ["renewal term", "automatic renewal", "auto-renewal", "auto renewal", "renewal"]),
+    "Notice Period To Terminate Renewal": (
+        "What is the notice period required to terminate renewal",
+        ["notice period to terminate renewal", "non-renewal notice", "notice of non-renewal"]),
+    "Governing Law": (
+        "Which state or country's law governs the interpretation of the contract",
+        ["governing law", "choice of law", "applicable law", "law governs"]),
+    "Most Favored Nation": (
+        "If a third party gets better terms on the licensing or sale of technology, goods or services "
+        "described in the contract, the buyer is entitled to those better terms",
+        ["most favored nation", "most favoured nation", "mfn"]),
+    "Non-Compete": (
+        "A restriction on the ability of a party to compete with the counterparty or operate in a "
+        "certain geography or business or technology sector",
+        ["non-compete", "noncompete", "non compete", "covenant not to compete", "restriction on competition"]),
+    "Exclusivity": (
+        "An exclusive dealing commitment with the counterparty, such as procuring all requirements from "
+        "one party or a prohibition on selling to or working with third parties",
+        ["exclusivity", "exclusive dealing", "exclusive"]),
+    "No-Solicit Of Customers": (
+        "A party is restricted from contracting or soliciting customers or partners of the counterparty",
+        ["no-solicit of customers", "non-solicitation of customers", "solicit customers", "solicit clients"]),
+    "Competitive Restriction Exception": (
+        "Exceptions or carveouts to non-compete, exclusivity and no-solicit of customers clauses",
+        ["competitive restriction exception", "carve-out", "carveout", "exception to the non-compete"]),
+    "No-Solicit Of Employees": (
+        "A restriction on a party's soliciting or hiring employees or contractors from the counterparty",
+        ["no-solicit of employees", "non-solicitation of employees", "solicit employees", "no-hire", "no hire",
+         "hire employees"]),
+    "Non-Disparagement": (
+        "A requirement on a party not to disparage the counterparty",
+        ["non-disparagement", "disparagement", "disparage"]),
+    "Termination For Convenience": (
+        "A party can terminate the contract without cause, solely by giving notice and allowing a "
+        "waiting period to expire",
+        ["termination for convenience", "terminate for convenience", "terminate without cause",
+         "termination without cause", "terminate at will"]),
+    "Rofr/Rofo/Rofn": (
+        "A right of first refusal, right of first offer or right of first negotiation to purchase, "
+        "license, market or distribute equity, technology, assets, products or services",
+        ["right of first refusal", "right of first offer", "right of first negotiation", "rofr", "rofo", "rofn"]),
+    "Change Of Control": (
+        "A party may terminate, or consent or notice is required, if the counterparty undergoes a change "
+        "of control such as a merger, stock sale or transfer of substantially all of its assets",
+        ["change of control", "change in control", "merger"]),
+    "Anti-Assignment": (
+        "Consent or notice is required of a party if the contract is assigned to a third party",
+        ["anti-assignment", "assignment of the agreement", "assign the agreement", "assign this agreement",
+         "be assigned", "assignability"]),
+    "Revenue/Profit Sharing": (
+        "One party is required to share revenue or profit with the counterparty for any technology, "
+        "goods or services",
+        ["revenue sharing", "profit sharing", "revenue share", "profit share", "royalty", "royalties"]),
+    "Price Restrictions": (
+        "A restriction on the ability of a party to raise or reduce prices of technology, goods or services",
+        ["price restriction", "price restrictions", "price increase", "price increases", "raise prices"]),
+    "Minimum Commitment": (
+        "A minimum order size or minimum amount or units per time period that one party must buy "
+        "from the counterparty",
+        ["minimum commitment", "minimum purchase", "minimum order", "take or pay"]),
+    "Volume Restriction": (
+        "A fee increase or consent requirement if one party's use of the product or services exceeds "
+        "a certain threshold",
+        ["volume restriction", "volume limit", "usage limit", "usage threshold"]),
+    "Ip Ownership Assignment": (
+        "Intellectual property created by one party becomes the property of the counterparty",
+        ["ip ownership", "intellectual property ownership", "owns the intellectual property",
+         "ownership of intellectual property", "ip assignment", "work product"]),
+    "Joint Ip Ownership": (
+        "Joint or shared ownership of intellectual property between the parties to the contract",
+        ["joint ip ownership", "joint ownership", "jointly owned", "co-owned", "shared ownership"]),
+    "License Grant": (
+        "A license granted by one party to its counterparty",
+        ["license grant", "licence grant", "grant of license", "grant a license", "licensed rights"]),
+    "Non-Transferable License": (
+        "The contract limits the ability of a party to transfer the license being granted to a third party",
+        ["non-transferable license", "non-transferable", "nontransferable", "transfer the license"]),
+    "Affiliate License-Licensor": (
+        "A license grant by affiliates of the licensor, or that includes intellectual property of "
+        "affiliates of the licensor",
+        ["affiliate license-licensor", "licensor affiliates", "licensor's affiliates"]),
+    "Affiliate License-Licensee": (
+        "A license grant to a licensee or sublicensor and the affiliates of such licensee or sublicensor",
+        ["affiliate license-licensee", "licensee affiliates", "licensee's affiliates"]),
+    "Unlimited/All-You-Can-Eat-License": (
+        "An enterprise, all you can eat or unlimited usage license",
+        ["unlimited license", "unlimited usage", "all-you-can-eat", "all you can eat", "enterprise license"]),
+    "Irrevocable Or Perpetual License": (
+        "A license grant that is irrevocable or perpetual",
+        ["irrevocable or perpetual license", "perpetual license", "irrevocable license", "perpetual",
+         "irrevocable"]),
+    "Source Code Escrow": (
+        "One party must deposit its source code into escrow with a third party, released to the "
+        "counterparty upon events such as bankruptcy or insolvency",
+        ["source code escrow", "escrow"]),
+    "Post-Termination Services": (
+        "Obligations after the termination or expiration of the contract, including transition, payment, "
+        "transfer of IP, wind-down or last-buy commitments",
+        ["post-termination", "post termination", "after termination", "transition services", "wind-down",
+         "wind down", "survive termination"]),
+    "Audit Rights": (
+        "The right to audit the books, records or physical locations of the counterparty to ensure "
+        "compliance with the contract",
+        ["audit rights", "right to audit", "audit", "inspect the books", "inspect records"]),
+    "Uncapped Liability": (
+        "A party's liability is uncapped upon the breach of its obligations, including for a particular "
+        "type of breach such as IP infringement or breach of confidentiality",
+        ["uncapped liability", "unlimited liability", "uncapped"]),
+    "Cap On Liability": (
+        "A cap on liability upon the breach of a party's obligations, including a time limit to bring "
+        "claims or a maximum amount for recovery",
+        ["cap on liability", "liability cap", "limitation of liability", "limit of liability",
+         "limitation on liability", "maximum liability"]),
+    "Liquidated Damages": (
+        "Liquidated damages for breach, or a fee upon the termination of the contract (termination fee)",
+        ["liquidated damages", "termination fee", "break fee", "break-up fee"]),
+    "Warranty Duration": (
+        "The duration of any warranty against defects or errors in technology, products or services",
+        ["warranty duration", "warranty period", "warranty"]),
+    "Insurance": (
+        "A requirement for insurance that must be maintained by one party for the benefit of the counterparty",
+        ["insurance", "insured"]),
+    "Covenant Not To Sue": (
+        "A party is restricted from contesting the validity of the counterparty's intellectual property or "
+        "bringing claims against the counterparty for matters unrelated to the contract",
+        ["covenant not to sue", "not to sue", "no-challenge", "contest the validity"]),
+    "Third Party Beneficiary": (
+        "A non-contracting party who is a beneficiary of some or all of the clauses and can enforce "
+        "its rights against a contracting party",
+        ["third party beneficiary", "third-party beneficiary", "third party beneficiaries",
+         "third-party beneficiaries"]),
+}
+
+_ALIAS_TO_TYPE = {
+    alias: clause_type
+    for clause_type, (_, aliases) in CLAUSE_TYPES.items()
+    for alias in aliases
+}
+# Single words that only ever name their clause type; other single words
+# ("warranty", "audit", "renewal") also appear in questions about other things
+_TERMS_OF_ART = frozenset({"mfn", "rofr", "rofo", "rofn", "noncompete", "nontransferable", "carveout"})
+
+
+def _alias_pattern(aliases) -> re.Pattern:
+    # Longest alias first, so "uncapped liability" wins over "uncapped"
+    return re.compile(
+        r"\b(?:" + "|".join(re.escape(a) for a in sorted(aliases, key=len, reverse=True)) + r")\b",
+        re.IGNORECASE,
+    )
+
+
+_ALIAS_PATTERN = _alias_pattern(_ALIAS_TO_TYPE)
+# The aliases that name a clause type beyond doubt: several words, or a term of art
+_NAMING_PATTERN = _alias_pattern(
+    alias for alias in _ALIAS_TO_TYPE if len(re.split(r"[\s-]+", alias)) > 1 or alias in _TERMS_OF_ART
+)
+
+# Every way of naming a clause type: its name, then its aliases
+_PHRASINGS = {
+    clause_type: list(dict.fromkeys([clause_type.lower()] + aliases))
+    for clause_type, (_, aliases) in CLAUSE_TYPES.items()
+}
+# Words too common in questions to relate them to a clause type
+_EXPANSION_STOPWORDS = frozenset("""
+about agreement clause contract could does from have into parties party provision section shall should than
+that their them then there these they this those under what when where which whom will with would your
+""".split())
+_WORD = re.compile(r"[a-z]+")
+
+_prototypes: Dict[str, Tuple[List[str], np.ndarray]] = {}
+
+
+def detect_clause_types(query: str) -> List[str]:
+    """
+    Clause types a query names, in order of appearance. Single-word aliases
+    other than terms of art ("audit", "warranty") are not enough.
+    """
+    found = [_ALIAS_TO_TYPE[match.group(0).lower()] for match in _NAMING_PATTERN.finditer(query)]
+    return list(dict.fromkeys(found))
+
+
+def _letters(text: str) -> str:
+    return "".join(_WORD.findall(text))
+
+
+def _stem(word: str) -> str:
+    # A prefix, so "terminated" also matches "termination"
+    return word[:max(5, len(word) - 3)]
+
+
+def _related_clause_types(query: str) -> List[str]:
+    """
+    Clause types whose names share words with a query that names none of
+    them, best first: most query words shared, then most phrasings using them.
+    """
+    stems = {_stem(word) for word in _WORD.findall(query.lower()) if len(word) > 3 and word not in _EXPANSION_STOPWORDS}
+    if not stems:
+        return []
+    scored = []
+    for order, (clause_type, phrasings) in enumerate(_PHRASINGS.items()):
+        matched, uses = set(), 0
+        for phrasing in phrasings:
+            hits = {stem for stem in stems for word in _WORD.findall(phrasing) if word.startswith(stem)}
+            matched |= hits
+            uses += bool(hits)
+        if matched:
+            scored.append((-len(matched), -uses, order, clause_type))
+    return [clause_type for *_, clause_type in sorted(scored)]
+
+
+def expand_query(query: str, max_variants: Optional[int] = None) -> List[str]:
+    """
+    The query, then up to max_variants - 1 (default QUERY_EXPANSION_VARIANTS)
+    rephrasings of it for a fused vector search, from the clause type table.
+
+    A clause type the query names is swapped for its other names ("Is there
+    a non-compete?" -> "Is there a covenant not to compete?"), taking turns
+    between the types it names. A query naming none is extended with the
+    names of the clause types sharing its words ("Can it be terminated
+    early?" -> "Can it be terminated early? termination for convenience").
+    """
+    max_variants = QUERY_EXPANSION_VARIANTS if max_variants is None else max_variants
+    variants = [query]
+    if max_variants <= 1:
+        return variants
+
+    matches = list(_ALIAS_PATTERN.finditer(query))
+    if matches:
+        swaps = []
+        for match in matches:
+            alias = match.group(0).lower()
+            # Spellings of the alias itself ("noncompete" for "non-compete") add nothing
+            swaps.append([
+                query[:match.start()] + phrasing + query[match.end():]
+                for phrasing in _PHRASINGS[_ALIAS_TO_TYPE[alias]]
+                if _letters(phrasing) != _letters(alias)
+            ])
+        candidates = [swap[i] for i in range(max(map(len, swaps))) for swap in swaps if i < len(swap)]
+    else:
+        candidates = [f"{query} {clause_type.lower()}" for clause_type in _related_clause_types(query)]
+
+    for candidate in candidates:
+        if len(variants) == max_variants:
+            break
+        if candidate not in variants:
+            variants.append(candidate)
+    return variants
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _model_name(embedder) -> str:
+    return getattr(embedder, "model_name", type(embedder).__name__)
+
+
+def _description_vectors(embedder) -> np.ndarray:
+    return _normalize(embedder.embed_documents(
+        [f"{name}. {description}" for name, (description, _) in CLAUSE_TYPES.items()]
+    ))
+
+
+def get_clause_prototypes(embedder) -> Tuple[List[str], np.ndarray]:
+    """
+    Clause type names and their unit-norm prototype vectors for an embedder.
+
+    Uses the prototypes saved by build_clause_prototypes when they were made
+    with the same model; otherwise embeds the category descriptions.
+    """
+    model = _model_name(embedder)
+    if model in _prototypes:
+        return _prototypes[model]
+
+    names = list(CLAUSE_TYPES)
+    vectors = None
+    if CLAUSE_PROTOTYPES_PATH.exists():
+        saved = np.load(CLAUSE_PROTOTYPES_PATH)
+        if str(saved["model"]) == model and list(saved["names"]) == names:
+            vectors = saved["vectors"]
+    if vectors is None:
+        print("Clause prototypes: using category descriptions")
+        vectors = _description_vectors(embedder)
+
+    _prototypes[model] = (names, vectors)
+    return _prototypes[model]
+
+
+def build_clause_prototypes(
+    embedder,
+    data_dir: Optional[str] = None,
+    max_contracts: Optional[int] = None,
+    examples_per_type: int = 32
+) -> Path:
+    """
+    Build prototypes from CUAD gold answer spans and save them.
+
+    Each prototype is the mean of the category description's embedding and
+    the mean embedding of up to examples_per_type gold spans.
+
+    Returns:
+        CLAUSE_PROTOTYPES_PATH
+    """
+    from .data_loader import load_cuad_qas
+
+    contracts, qas = load_cuad_qas(data_dir, max_contracts)
+    examples: Dict[str, List[str]] = {name: [] for name in CLAUSE_TYPES}
+    for qa in qas:
+        spans = examples.get(qa["clause_type"])
+        if spans is None or len(spans) >= examples_per_type:
+            continue
+        text = contracts[qa["contract"]][0]
+        start, end = qa["answers"][0]
+        spans.append(text[start:end][:2000])
+
+    vectors = _description_vectors(embedder)
+    for i, name in enumerate(CLAUSE_TYPES):
+        if examples[name]:
+            span_mean = _normalize(embedder.embed_documents(examples[name])).mean(axis=0)
+            vectors[i] = _normalize([vectors[i] + span_mean / max(np.linalg.norm(span_mean), 1e-12)])[0]
+
+    CLAUSE_PROTOTYPES_PATH.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(CLAUSE_PROTOTYPES_PATH, names=np.array(list(CLAUSE_TYPES)), vectors=vectors, model=_model_name(embedder))
+    _prototypes.pop(_model_name(embedder), None)
+
+    covered = sum(1 for spans in examples.values() if spans)
+    print(f"Saved clause prototypes ({covered}/{len(CLAUSE_TYPES)} types with CUAD examples) to {CLAUSE_PROTOTYPES_PATH}")
+    return CLAUSE_PROTOTYPES_PATH
+
+
+def classify_chunks(vectors, prototypes: Tuple[List[str], np.ndarray]) -> List[List[Tuple[str, float]]]:
+    """
+    Clause types of each chunk by cosine similarity to the prototypes.
+
+    Args:
+        vectors: Chunk embeddings, one row per chunk
+        prototypes: (names, unit-norm vectors) from get_clause_prototypes
+
+    Returns:
+        Per chunk, (clause_type, similarity) pairs, best first; empty if no
+        prototype is similar enough
+    """
+    names, prototype_vectors = prototypes
+    if len(vectors) == 0:
+        return []
+
+    similarities = _normalize(vectors) @ prototype_vectors.T
+    best = similarities.max(axis=1, keepdims=True)
+    eligible = (similarities >= CLAUSE_MIN_SIMILARITY) & (similarities >= best - CLAUSE_MARGIN)
+
+    result = []
+    for row, mask in zip(similarities, eligible):
+        candidates = np.flatnonzero(mask)
+        candidates = candidates[np.argsort(-row[candidates])][:CLAUSE_MAX_TYPES]
+        result.append([(names[i], round(float(row[i]), 4)) for i in candidates])
+    return result
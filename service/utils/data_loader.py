@@ -4,7 +4,32 @@ Data loading utilities for CUAD dataset.
 
 import json
 import os
-from typing import List, Dict, Tuple
+from typing import Dict, List, Tuple
+
+from .chunking import MAX_TOKENS, chunk_spans
+
+
+def _load_cuad_entries(data_dir: str = None, max_contracts: int = None) -> List[Dict]:
+    """Raw CUAD entries (SQuAD format) from a local CUADv1.json or Hugging Face."""
+    # Try local file first if data_dir is provided
+    if data_dir:
+        cuad_path = os.path.join(data_dir, "CUADv1.json")
+        if os.path.exists(cuad_path):
+            print(f"Loading CUAD from local file: {cuad_path}")
+            with open(cuad_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data["data"][:max_contracts] if max_contracts else data["data"]
+        print(f"Local file not found at {cuad_path}, falling back to Hugging Face...")
+    else:
+        print("Loading CUAD from Hugging Face...")
+    return _load_from_huggingface(max_contracts)
+
+
+def _clause_type(question: str) -> str:
+    """Clause type named in a CUAD question ('... related to "Governing Law" ...')."""
+    if "related to" in question and '"' in question:
+        return question.split('"')[1]
+    return ""
 
 
 def load_cuad_contracts(data_dir: str = None, max_contracts: int = None) -> List[Tuple[str, Dict]]:
@@ -18,45 +43,61 @@ def load_cuad_contracts(data_dir: str = None, max_contracts: int = None) -> List
     Returns:
         List of (contract_text, metadata) tuples
     """
-    # Try local file first if data_dir is provided
-    if data_dir:
-        cuad_path = os.path.join(data_dir, "CUADv1.json")
-        if os.path.exists(cuad_path):
-            print(f"Loading CUAD from local file: {cuad_path}")
-            with open(cuad_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            entries = data["data"][:max_contracts] if max_contracts else data["data"]
-        else:
-            print(f"Local file not found at {cuad_path}, falling back to Hugging Face...")
-            entries = _load_from_huggingface(max_contracts)
-    else:
-        print("Loading CUAD from Hugging Face...")
-        entries = _load_from_huggingface(max_contracts)
+    return load_cuad_qas(data_dir, max_contracts)[0]
 
-    # Process entries
-    contracts = []
-    for entry in entries:
-        title = entry["title"]
 
+def load_cuad_qas(data_dir: str = None, max_contracts: int = None) -> Tuple[List[Tuple[str, Dict]], List[Dict]]:
+    """
+    Load CUAD contracts together with their gold question/answer spans.
+
+    Args:
+        data_dir: Optional path to local CUADv1.json file. If None, downloads from Hugging Face.
+        max_contracts: Maximum number of contracts to load
+
+    Returns:
+        (contracts, qas): contracts as (contract_text, metadata) tuples, and
+        one dict per answerable question with keys contract (index into
+        contracts), clause_type, question, details (the question's
+        plain-language description) and answers (list of (char_start,
+        char_end) spans in the contract text)
+    """
+    entries = _load_cuad_entries(data_dir, max_contracts)
+
+    contracts, qas = [], []
+    for entry in entries:
         for paragraph in entry["paragraphs"]:
             context = paragraph["context"]
-            qas = paragraph.get("qas", [])
-
             clause_types = set()
-            for qa in qas:
+
+            for qa in paragraph.get("qas", []):
                 question = qa.get("question", "")
-                if "related to" in question and '"' in question:
-                    clause_type = question.split('"')[1]
+                clause_type = _clause_type(question)
+                if clause_type:
                     clause_types.add(clause_type)
 
-            metadata = {
-                "title": title,
+                answers = [
+                    (answer["answer_start"], answer["answer_start"] + len(answer["text"]))
+                    for answer in qa.get("answers", [])
+                    if answer.get("text")
+                ]
+                if qa.get("is_impossible") or not answers:
+                    continue
+
+                qas.append({
+                    "contract": len(contracts),
+                    "clause_type": clause_type,
+                    "question": question,
+                    "details": question.split("Details:", 1)[1].strip() if "Details:" in question else "",
+                    "answers": answers,
+                })
+
+            contracts.append((context, {
+                "title": entry["title"],
                 "clause_types": list(clause_types),
                 "length": len(context)
-            }
-            contracts.append((context, metadata))
+            }))
 
-    return contracts
+    return contracts, qas
 
 
 def _load_from_huggingface(max_contracts: int | None = None) -> List[Dict]:
@@ -121,7 +162,12 @@ def _load_from_huggingface(max_contracts: int | None = None) -> List[Dict]:
 
 
 def chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[str]:
-    """Split text into overlapping chunks."""
+    """
+    Split text into overlapping fixed-size character chunks.
+
+    Superseded by the structure-aware chunker in chunking.py; kept for the
+    old import paths and as the baseline in benchmarks/chunking.py.
+    """
     if len(text) <= chunk_size:
         return [text]
 
@@ -145,7 +191,7 @@ def chunk_text(text: str, chunk_size: int = 2000, overlap: int = 200) -> List[st
 def load_documents(
     data_dir: str,
     max_contracts: int = 20,
-    chunk_size: int = 2000
+    max_tokens: int = MAX_TOKENS
 ) -> Tuple[List[str], List[Dict]]:
     """
     Load and process CUAD contracts for indexing.
@@ -160,15 +206,17 @@ def load_documents(
     metadatas = []
 
     for contract_text, metadata in contracts:
-        chunks = chunk_text(contract_text, chunk_size)
+        spans = chunk_spans(contract_text, max_tokens)
+        clause_types = ", ".join(metadata["clause_types"][:5])
 
-        for i, chunk in enumerate(chunks):
-            texts.append(chunk)
+        for i, (start, end, heading) in enumerate(spans):
+            texts.append(contract_text[start:end])
             metadatas.append({
                 "title": metadata["title"],
-                "clause_types": ", ".join(metadata["clause_types"][:5]),
+                "clause_types": clause_types,
+                "section": heading,
                 "chunk_index": i,
-                "total_chunks": len(chunks)
+                "total_chunks": len(spans)
             })
 
     print(f"Created {len(texts)} chunks from {len(contracts)} contracts.")
@@ -1,10 +1,331 @@
 """
 Embedding models for vector search.
+
+EMBEDDING_BACKEND selects how the model runs:
+- "torch" (default): sentence-transformers on PyTorch, via HuggingFaceEmbeddings
+- "onnx": ONNX Runtime on an export of the same model in EMBEDDING_ONNX_DIR
+- "onnx-int8": the same export with dynamically quantized int8 weights
+
+The ONNX backends never import torch. Create the export once with
+`python main.py export-onnx` (needs torch, transformers and onnxruntime).
+Embedders are created once per process and shared, and survive a fork
+(the pre-fork server, api/server.py, loads them before forking workers).
+
+Searches embed their query through get_query_embedder, which batches the
+queries of concurrent requests into one forward pass
+(MicroBatchingEmbeddings).
 """
 
-from langchain_huggingface import HuggingFaceEmbeddings
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from . import metrics
+
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+EMBEDDING_ONNX_DIR = Path(
+    os.getenv("EMBEDDING_ONNX_DIR", str(Path(__file__).parent.parent / "data" / "onnx" / "all-MiniLM-L6-v2"))
+)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# Queries of concurrent searches embedded together: a batch waits at most
+# this long for more queries (0 turns batching off), up to this many
+EMBEDDING_MICROBATCH_WAIT_MS = float(os.getenv("EMBEDDING_MICROBATCH_WAIT_MS", "2"))
+EMBEDDING_MICROBATCH_SIZE = int(os.getenv("EMBEDDING_MICROBATCH_SIZE", "32"))
+# Threads one embedding call uses (0: the runtime's default, all cores); the
+# pre-fork server splits the cores between its workers
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+# all-MiniLM-L6-v2's sentence-transformers max_seq_length
+MAX_SEQUENCE_TOKENS = 256
+
+ONNX_MODEL_FILES = {"onnx": "model.onnx", "onnx-int8": "model_int8.onnx"}
+
+# Sessions inherited from the parent process by a forked child: their thread
+# pools did not survive the fork, so they are never used nor freed there
+_forked_sessions: list = []
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Sentence embeddings from an ONNX export of a BERT-style encoder.
+
+    Reproduces the sentence-transformers pipeline of all-MiniLM-L6-v2: mean
+    pooling of the token states over the attention mask, then L2
+    normalization. Texts are batched by length to keep padding small.
+    """
+
+    def __init__(
+        self,
+        model_dir: Path = EMBEDDING_ONNX_DIR,
+        model_file: str = "model.onnx",
+        model_name: str = EMBEDDING_MODEL,
+        batch_size: int = EMBEDDING_BATCH_SIZE
+    ):
+        from tokenizers import Tokenizer
+
+        model_dir = Path(model_dir)
+        if not (model_dir / model_file).exists():
+            raise FileNotFoundError(
+                f"No ONNX model at {model_dir / model_file}. Run 'python main.py export-onnx' first."
+            )
+
+        self.model_path = model_dir / model_file
+        self._open_session()
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(MAX_SEQUENCE_TOKENS)
+        self.tokenizer.enable_padding()
+
+        # Same name as the torch model: both produce the same vector space
+        self.model_name = model_name
+        self.batch_size = batch_size
+
+    def _open_session(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = EMBEDDING_THREADS
+        self.session = ort.InferenceSession(str(self.model_path), options, providers=["CPUExecutionProvider"])
+        self._pid = os.getpid()
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        if self._pid != os.getpid():
+            _forked_sessions.append(self.session)
+            self._open_session()
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_states = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_states * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        order = np.argsort([len(text) for text in texts], kind="stable")
+        vectors = np.empty((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(texts), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            embedded = self._embed_batch([texts[i] for i in batch])
+            if vectors.shape[1] == 0:
+                vectors = np.empty((len(texts), embedded.shape[1]), dtype=np.float32)
+            vectors[batch] = embedded
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed_batch([text])[0].tolist()
+
+
+class _QueryRequest:
+    """A query waiting in a micro-batch; lead is set on the one that runs the batch."""
+
+    __slots__ = ("text", "arrived", "event", "lead", "vector", "error")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.arrived = time.monotonic()
+        self.event = threading.Event()
+        self.lead = False
+        self.vector: Optional[List[float]] = None
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatchingEmbeddings(Embeddings):
+    """
+    Embeds the queries of concurrent callers together.
+
+    A search embeds one query, a forward pass of batch size one; under
+    concurrency those passes compete for the CPU. Here the first caller of
+    embed_query leads a batch: while another pass is running it waits up to
+    max_wait_ms for other callers (or until max_batch queries are waiting),
+    then embeds them all in one embed_documents call of the wrapped model
+    and hands each caller its vector. Queries arriving meanwhile form the
+    next batch. When the model is idle a lone query goes at once, so only
+    concurrent queries wait. For the models here a query embeds like a
+    document. embed_documents is passed through.
+    """
+
+    def __init__(
+        self,
+        embedder: Embeddings,
+        max_batch: int = EMBEDDING_MICROBATCH_SIZE,
+        max_wait_ms: float = EMBEDDING_MICROBATCH_WAIT_MS
+    ):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._reset()
+
+    def _reset(self):
+        # Also after a fork: a batch in flight in the parent never completes here
+        self._cond = threading.Condition()
+        self._pending: List[_QueryRequest] = []
+        self._running = 0
+        self._pid = os.getpid()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedder.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.max_wait <= 0 or self.max_batch <= 1:
+            return self.embedder.embed_query(text)
+        if self._pid != os.getpid():
+            self._reset()
+
+        request = _QueryRequest(text)
+        with self._cond:
+            self._pending.append(request)
+            request.lead = len(self._pending) == 1
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify_all()
+        if not request.lead:
+            # Woken with a vector, or to lead the queries left over from a full batch
+            request.event.wait()
+        if request.lead:
+            self._run_batch(request)
+        metrics.record("embed.query", time.monotonic() - request.arrived)
+        if request.error is not None:
+            raise request.error
+        return request.vector
+
+    def _run_batch(self, leader: _QueryRequest):
+        with self._cond:
+            deadline = leader.arrived + self.max_wait
+            # Notified when the batch fills or a running pass ends
+            while len(self._pending) < self.max_batch and self._running:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if self._pending:
+                self._pending[0].lead = True
+                self._pending[0].event.set()
+            self._running += 1
+
+        try:
+            with metrics.timed("embed.batch"):
+                vectors = self.embedder.embed_documents([request.text for request in batch])
+            for request, vector in zip(batch, vectors):
+                request.vector = vector
+        except BaseException as e:
+            # Every caller of the batch raises it, none is left waiting
+            for request in batch:
+                request.error = e
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+        metrics.increment("embed.batches")
+        metrics.increment("embed.batched_queries", len(batch))
+        for request in batch:
+            if request is not leader:
+                request.event.set()
+
+
+def export_onnx(model_name: str = EMBEDDING_MODEL, out_dir: Path = EMBEDDING_ONNX_DIR, quantize: bool = True) -> Path:
+    """
+    Export a Hugging Face encoder to ONNX, with an int8 copy, for the onnx backends.
+
+    Writes model.onnx, model_int8.onnx (when quantize) and tokenizer.json
+    to out_dir.
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name).eval()
+    sample = tokenizer(["An export sample sentence."], return_tensors="pt")
+
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names + ["last_hidden_state"]}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            str(out_dir / ONNX_MODEL_FILES["onnx"]),
+            input_names=input_names,
+            output_names=["last_hidden_state", "pooler_output"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+            dynamo=False
+        )
+    tokenizer.backend_tokenizer.save(str(out_dir / "tokenizer.json"))
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(
+            str(out_dir / ONNX_MODEL_FILES["onnx"]),
+            str(out_dir / ONNX_MODEL_FILES["onnx-int8"]),
+            weight_type=QuantType.QInt8
+        )
+    return out_dir
+
+
+_embedders: Dict[Tuple[str, str], Embeddings] = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(model_name: str = EMBEDDING_MODEL, backend: Optional[str] = None) -> Embeddings:
+    """
+    Get the embedding model (defaults to a lightweight model for speed).
+
+    backend overrides EMBEDDING_BACKEND. The model is loaded on first use
+    and shared by every later caller in the process.
+    """
+    backend = (backend or EMBEDDING_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{backend}'. Options: {', '.join(BACKENDS)}")
+
+    with _embedders_lock:
+        if (backend, model_name) not in _embedders:
+            if backend == "torch":
+                from langchain_huggingface import HuggingFaceEmbeddings
+
+                if EMBEDDING_THREADS:
+                    import torch
+
+                    torch.set_num_threads(EMBEDDING_THREADS)
+                embedder = HuggingFaceEmbeddings(model_name=model_name)
+            else:
+                embedder = OnnxEmbeddings(model_file=ONNX_MODEL_FILES[backend], model_name=model_name)
+            _embedders[(backend, model_name)] = embedder
+        return _embedders[(backend, model_name)]
+
+
+_query_embedders: Dict[Tuple[str, str], Embeddings] = {}
 
 
-def get_embedder(model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
-    """Get embedding model (defaults to a lightweight model for speed)."""
-    return HuggingFaceEmbeddings(model_name=model_name)
+def get_query_embedder(model_name: str = EMBEDDING_MODEL, backend: Optional[str] = None) -> Embeddings:
+    """
+    The embedding model as searches should use it: get_embedder's, with the
+    queries of concurrent callers micro-batched (MicroBatchingEmbeddings),
+    unless EMBEDDING_MICROBATCH_WAIT_MS is 0.
+    """
+    embedder = get_embedder(model_name, backend)
+    if EMBEDDING_MICROBATCH_WAIT_MS <= 0:
+        return embedder
+    key = ((backend or EMBEDDING_BACKEND).lower(), model_name)
+    with _embedders_lock:
+        if key not in _query_embedders:
+            _query_embedders[key] = MicroBatchingEmbeddings(embedder)
+        return _query_embedders[key]
@@ -0,0 +1,239 @@
+"""
+Text extraction for uploaded documents.
+
+PDFs are parsed page by page through a pluggable backend. PyMuPDF (C-backed)
+is used when it is installed, PyPDF2 is always available as the fallback.
+Large PDFs are split into page ranges that are extracted in parallel on a
+shared process pool, and pages are yielded in order so callers can stream
+them straight into chunking.
+"""
+
+import codecs
+import mmap
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional
+
+
+PDF_BACKEND = os.getenv("PDF_BACKEND", "auto")
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+
+# PDFs shorter than this are extracted inline; the pool is not worth it
+PARALLEL_MIN_PAGES = 16
+PAGES_PER_TASK = 8
+
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md", ".doc", ".docx")
+
+# PDF_WORKERS processes shared by all uploads; never resized, so no upload's tasks are cancelled
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+# ---------------------------------------------------------------------------
+# PDF backends
+# ---------------------------------------------------------------------------
+
+def _pymupdf_page_count(path: str) -> int:
+    import pymupdf
+
+    with pymupdf.open(path) as pdf:
+        return pdf.page_count
+
+
+def _pymupdf_extract(path: str, start: int, stop: int) -> List[str]:
+    import pymupdf
+
+    with pymupdf.open(path) as pdf:
+        return [pdf[i].get_text() for i in range(start, stop)]
+
+
+def _pypdf2_page_count(path: str) -> int:
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _pypdf2_extract(path: str, start: int, stop: int) -> List[str]:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+# Ordered by preference: the first installed backend wins under "auto"
+PDF_BACKENDS: Dict[str, tuple[str, Callable[[str], int], Callable[[str, int, int], List[str]]]] = {
+    "pymupdf": ("pymupdf", _pymupdf_page_count, _pymupdf_extract),
+    "pypdf2": ("PyPDF2", _pypdf2_page_count, _pypdf2_extract),
+}
+
+
+def available_pdf_backends() -> List[str]:
+    """Names of the PDF backends whose libraries are importable."""
+    import importlib.util
+
+    return [
+        name for name, (module, _, _) in PDF_BACKENDS.items()
+        if importlib.util.find_spec(module) is not None
+    ]
+
+
+def resolve_pdf_backend(name: Optional[str] = None) -> str:
+    """Pick a PDF backend by name, or the fastest installed one for "auto"."""
+    name = (name or PDF_BACKEND).lower()
+    available = available_pdf_backends()
+
+    if name == "auto":
+        if not available:
+            raise ImportError(
+                "No PDF backend installed. Install one with: pip install pymupdf (or pypdf2)"
+            )
+        return available[0]
+
+    if name not in PDF_BACKENDS:
+        raise ValueError(f"Unknown PDF backend '{name}'. Options: auto, {', '.join(PDF_BACKENDS)}")
+    if name not in available:
+        raise ImportError(f"PDF backend '{name}' is not installed")
+    return name
+
+
+def _extract_range(backend: str, path: str, start: int, stop: int) -> List[str]:
+    """Process pool task: extract pages [start, stop) of a PDF."""
+    _, _, extract = PDF_BACKENDS[backend]
+    return extract(path, start, stop)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Shared extraction pool of PDF_WORKERS processes, started on first use and reused across uploads."""
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+        return _pool
+
+
+def shutdown_pool():
+    """Stop the extraction worker processes (at shutdown: pending extractions are cancelled)."""
+    global _pool
+
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+def iter_pdf_pages(
+    path: str,
+    backend: Optional[str] = None,
+    workers: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Yield the text of each page of a PDF, in page order.
+
+    Args:
+        path: Path to the PDF file
+        backend: Backend name ("auto", "pymupdf", "pypdf2"); defaults to PDF_BACKEND
+        workers: Page ranges of a large PDF extracted at once on the shared
+            pool (at most PDF_WORKERS in parallel); 1 disables the pool
+
+    Yields:
+        Page text (pages without extractable text are skipped)
+    """
+    backend = resolve_pdf_backend(backend)
+    workers = workers or PDF_WORKERS
+    _, page_count, extract = PDF_BACKENDS[backend]
+    total = page_count(path)
+
+    if workers <= 1 or total < PARALLEL_MIN_PAGES:
+        batches = (extract(path, 0, total),)
+    else:
+        batches = _extract_parallel(backend, path, total, workers)
+
+    for batch in batches:
+        for text in batch:
+            if text and text.strip():
+                yield text
+
+
+def _extract_parallel(backend: str, path: str, total: int, workers: int) -> Iterator[List[str]]:
+    """Page ranges of a PDF extracted on the shared pool, at most `workers` at a time, in order."""
+    pool = _get_pool()
+    pending = deque()
+    try:
+        for start in range(0, total, PAGES_PER_TASK):
+            pending.append(pool.submit(_extract_range, backend, path, start, min(start + PAGES_PER_TASK, total)))
+            if len(pending) >= workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # A caller that stops reading leaves no tasks behind
+        for future in pending:
+            future.cancel()
+
+
+TEXT_BLOCK_SIZE = 1024 * 1024
+
+
+def _iter_text_file(path: str) -> Iterator[str]:
+    """
+    Decode a text file from an mmap in blocks (UTF-8, falling back to latin-1).
+
+    The file is validated as UTF-8 in a first pass so the fallback never has
+    to retract blocks that were already yielded.
+    """
+    if os.path.getsize(path) == 0:
+        return
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        encoding = "utf-8"
+        validator = codecs.getincrementaldecoder("utf-8")()
+        try:
+            for start in range(0, len(data), TEXT_BLOCK_SIZE):
+                validator.decode(data[start:start + TEXT_BLOCK_SIZE])
+            validator.decode(b"", final=True)
+        except UnicodeDecodeError:
+            encoding = "latin-1"
+
+        decoder = codecs.getincrementaldecoder(encoding)()
+        for start in range(0, len(data), TEXT_BLOCK_SIZE):
+            text = decoder.decode(data[start:start + TEXT_BLOCK_SIZE])
+            if text:
+                yield text
+
+
+def iter_document_text(path: str, filename: str) -> Iterator[str]:
+    """
+    Yield the text of a document in reading order, as consecutive pieces.
+
+    Concatenating the pieces gives the full text; PDF pages are separated by
+    a blank line.
+
+    Args:
+        path: Path to the document on disk
+        filename: Original filename, used to pick the parser
+
+    Raises:
+        ValueError: If the file type is not supported
+    """
+    filename = filename.lower()
+
+    if filename.endswith(".pdf"):
+        for page_number, text in enumerate(iter_pdf_pages(path)):
+            yield text if page_number == 0 else f"\n\n{text}"
+
+    elif filename.endswith((".txt", ".md")):
+        yield from _iter_text_file(path)
+
+    elif filename.endswith((".doc", ".docx")):
+        import docx
+
+        doc = docx.Document(path)
+        yield "\n\n".join(para.text for para in doc.paragraphs if para.text.strip())
+
+    else:
+        raise ValueError(
+            f"Unsupported file type. Supported: {', '.join(SUPPORTED_EXTENSIONS)}"
+        )
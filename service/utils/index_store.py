@@ -0,0 +1,1181 @@
+"""
+On-disk format of the FAISS indexes.
+
+An index is a set of immutable segments, a series of snapshots listing the
+segments that make up the index, and a pointer to the current snapshot:
+
+    <index>/CURRENT                     name of the current snapshot
+    <index>/snapshots/<name>.json       manifest: format name and version,
+                                        vector dimension, chunk count, the
+                                        FAISS wrapper settings and the segments
+    <index>/segments/<name>/            one segment:
+        index.faiss     its vectors (faiss.write_index)
+        chunks.sqlite   one row per vector, by position in the segment:
+                        docstore id, text and JSON metadata
+
+Nothing is pickled. Loading reads the FAISS index of every segment and the
+position -> id map only; several segments are searched together as one
+index (faiss.IndexShards). Read-only loads map the vectors from the segment
+files instead (read_index(mmap=True)), so processes serving the same index
+share one copy of it in the page cache. Chunk texts stay on disk and are read by id when
+a search returns them (ChunkStore), with a small LRU cache for hot chunks.
+
+Indexes grow like an LSM tree: append_segment writes only the new chunks as
+a new segment, so adding a document costs its own size, not the index's.
+merge_index then merges segments of similar size once INDEX_MERGE_FACTOR of
+them accumulate (size-tiered), which keeps the segment count logarithmic in
+the index size; merge_segments also drops deleted chunks.
+
+Nothing is modified in place: segments and manifests are written to
+temporary files, fsynced and renamed, then CURRENT is switched atomically
+(write, fsync, rename). A crash at any point leaves the previous snapshot
+current. Writers of an index serialize on a file lock while they switch
+CURRENT. Old snapshots are garbage collected after each change, except the
+SNAPSHOT_KEEP most recent ones (for other processes that have not reloaded
+yet); segments are deleted once no kept snapshot lists them and no loaded
+index in this process reads from them.
+
+Indexes written by earlier versions, a single directory with either
+MANIFEST.json (format version 1) or LangChain's index.pkl, are still
+loaded; the next save turns them into segments.
+
+A sharded index is a set of such indexes, its shards, and a shard map
+saying which chunks go where:
+
+    <index>/SHARDS.json                 shard map: format name and version,
+                                        the routing policy, the FAISS
+                                        wrapper settings and the shards,
+                                        each with its routing key
+    <index>/shards/<name>/              one shard, an index as above
+
+Chunks are routed by a key derived from their metadata (shard_key): their
+corpus (CUAD or uploads), a hash of their owner (USER_SHARDS buckets), or
+a single key when shards are only cut by size. New chunks are appended to
+the last shard of their key. Shards grown past SHARD_MAX_VECTORS are split
+into contiguous parts (rebalance_shards, run by merge_index). The shard map
+is switched like CURRENT; shards it no longer lists are deleted once no
+loaded index in this process reads from them. read_shards loads every
+shard; vectorstore.ShardedVectorStore searches them in parallel.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+
+FORMAT_NAME = "faiss-chunks"
+FORMAT_VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+
+MANIFEST_FILE = "MANIFEST.json"
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.sqlite"
+LEGACY_DOCSTORE_FILE = "index.pkl"
+CURRENT_FILE = "CURRENT"
+LOCK_FILE = "LOCK"
+SNAPSHOTS_DIR = "snapshots"
+SEGMENTS_DIR = "segments"
+_TMP_PREFIX = ".tmp-"
+
+SHARDS_FORMAT = "faiss-shards"
+SHARDS_FILE = "SHARDS.json"
+SHARDS_DIR = "shards"
+SHARD_POLICIES = ("corpus", "user", "size")
+
+# Old snapshots kept besides the current one
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "1"))
+# Segments of similar size merged together once this many accumulate
+INDEX_MERGE_FACTOR = int(os.getenv("INDEX_MERGE_FACTOR", "4"))
+# Temporary files older than this are left over from a crash
+STALE_TMP_SECONDS = 3600
+
+# Shards holding more vectors than this are split (rebalance_shards)
+SHARD_MAX_VECTORS = int(os.getenv("SHARD_MAX_VECTORS", "250000"))
+# Buckets of the "user" shard policy
+USER_SHARDS = int(os.getenv("USER_SHARDS", "16"))
+
+# Chunks kept in memory per loaded index after being read
+CHUNK_CACHE_SIZE = int(os.getenv("CHUNK_CACHE_SIZE", "2048"))
+
+_INSERT_BATCH = 1000
+
+# Segment directory -> number of open ChunkStores reading from it
+_segment_refs: Dict[str, int] = {}
+_segment_refs_lock = threading.Lock()
+
+# Open ChunkStores, whose connections a forked child reopens
+_open_stores: "weakref.WeakSet[ChunkStore]" = weakref.WeakSet()
+
+# A chunk row as stored: (docstore id, text, JSON metadata)
+Row = Tuple[str, str, str]
+
+
+def _acquire_segments(segments: List[Path]) -> None:
+    with _segment_refs_lock:
+        for segment in segments:
+            _segment_refs[str(segment)] = _segment_refs.get(str(segment), 0) + 1
+
+
+def _release_segments(segments: List[Path]) -> None:
+    with _segment_refs_lock:
+        for segment in segments:
+            _segment_refs[str(segment)] -= 1
+            if not _segment_refs[str(segment)]:
+                del _segment_refs[str(segment)]
+
+
+class ChunkStore(Docstore, AddableMixin):
+    """
+    Docstore over the chunks.sqlite files of an index's segments, read
+    lazily by id.
+
+    The files are never modified in place: chunks added or deleted after
+    loading are kept in memory until the index is saved again. The store
+    holds a reference on its segments, so garbage collection leaves them
+    alone until close() or until the store itself is garbage collected.
+    """
+
+    def __init__(self, paths: Union[str, Path, Sequence[Union[str, Path]]], cache_size: int = CHUNK_CACHE_SIZE):
+        self.paths = [Path(paths)] if isinstance(paths, (str, Path)) else [Path(path) for path in paths]
+        self.cache_size = cache_size
+        segments = [path.parent for path in self.paths]
+        _acquire_segments(segments)
+        self._release = weakref.finalize(self, _release_segments, segments)
+        self._connect()
+        self._cache: "OrderedDict[str, Document]" = OrderedDict()
+        self._added: Dict[str, Document] = {}
+        self._deleted: set = set()
+        _open_stores.add(self)
+
+    def _connect(self) -> None:
+        self._conns = [
+            sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+            for path in self.paths
+        ]
+        self._lock = threading.Lock()
+
+    def positions(self) -> Dict[int, str]:
+        """The index position -> docstore id map, segments one after another."""
+        positions = {}
+        with self._lock:
+            for conn in self._conns:
+                offset = len(positions)
+                positions.update(
+                    (offset + position, doc_id)
+                    for position, doc_id in conn.execute("SELECT position, id FROM chunks ORDER BY position")
+                )
+        return positions
+
+    def _stored(self, ids: Iterable[str]) -> set:
+        ids = list(ids)
+        found = set()
+        with self._lock:
+            for conn in self._conns:
+                for start in range(0, len(ids), _INSERT_BATCH):
+                    batch = ids[start:start + _INSERT_BATCH]
+                    placeholders = ",".join("?" * len(batch))
+                    found.update(
+                        row[0] for row in conn.execute(f"SELECT id FROM chunks WHERE id IN ({placeholders})", batch)
+                    )
+        return found - self._deleted
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._added:
+            return self._added[search]
+        if search in self._deleted:
+            return f"ID {search} not found."
+
+        with self._lock:
+            doc = self._cache.get(search)
+            if doc is not None:
+                self._cache.move_to_end(search)
+                return doc
+
+            for conn in self._conns:
+                row = conn.execute("SELECT text, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+                if row is not None:
+                    break
+            else:
+                return f"ID {search} not found."
+            doc = Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+            self._cache[search] = doc
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return doc
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = (set(texts) & set(self._added)) | self._stored(texts)
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        for doc_id, doc in texts.items():
+            self._deleted.discard(doc_id)
+            self._added[doc_id] = doc
+
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            for doc_id in ids:
+                self._cache.pop(doc_id, None)
+        for doc_id in ids:
+            if self._added.pop(doc_id, None) is None:
+                self._deleted.add(doc_id)
+
+    def close(self) -> None:
+        for conn in self._conns:
+            conn.close()
+        _open_stores.discard(self)
+        self._release()
+
+
+def _reopen_after_fork() -> None:
+    # SQLite connections must not be shared with a forked child (the
+    # pre-fork server loads indexes before forking its workers)
+    global _segment_refs_lock
+    _segment_refs_lock = threading.Lock()
+    for store in list(_open_stores):
+        store._connect()
+
+
+os.register_at_fork(after_in_child=_reopen_after_fork)
+
+
+def _fsync(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _new_name() -> str:
+    # Names sort by creation time; the suffix keeps concurrent writers apart
+    return f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+
+
+@contextmanager
+def _writer_lock(root: Path) -> Iterator[None]:
+    """Exclusive lock of an index's writers, across threads and processes."""
+    with open(root / LOCK_FILE, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_chunks(rows: Iterable[Row], path: Path) -> int:
+    """Write chunk rows, in index position order, to a new sqlite file."""
+    conn = sqlite3.connect(path)
+    count = 0
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute(
+            "CREATE TABLE chunks (position INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, "
+            "text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        batch = []
+        for row in rows:
+            batch.append((count, *row))
+            count += 1
+            if len(batch) == _INSERT_BATCH:
+                conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", batch)
+                batch = []
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?, ?)", batch)
+        conn.commit()
+    finally:
+        conn.close()
+    return count
+
+
+def _store_rows(vector_db) -> Iterator[Row]:
+    """Chunk rows of a LangChain FAISS store, in index position order."""
+    for position, doc_id in sorted(vector_db.index_to_docstore_id.items()):
+        doc = vector_db.docstore.search(doc_id)
+        if not isinstance(doc, Document):
+            raise ValueError(f"Index position {position} has no chunk in the docstore: {doc}")
+        yield doc_id, doc.page_content, json.dumps(doc.metadata, default=str)
+
+
+def _segment_rows(segment: Path) -> Iterator[Row]:
+    conn = sqlite3.connect(f"file:{segment / CHUNKS_FILE}?mode=ro&immutable=1", uri=True)
+    try:
+        yield from conn.execute("SELECT id, text, metadata FROM chunks ORDER BY position")
+    finally:
+        conn.close()
+
+
+def _write_segment(root: Path, index, rows: Iterable[Row]) -> Path:
+    """
+    Write a segment to a temporary directory under the index, durably.
+
+    Returns:
+        The temporary directory; _commit renames it into place
+    """
+    import faiss
+
+    segments = root / SEGMENTS_DIR
+    segments.mkdir(parents=True, exist_ok=True)
+    tmp = segments / f"{_TMP_PREFIX}{_new_name()}"
+    tmp.mkdir()
+    try:
+        count = _write_chunks(rows, tmp / CHUNKS_FILE)
+        if count != index.ntotal:
+            raise ValueError(f"Segment has {index.ntotal} vectors but {count} chunks")
+        faiss.write_index(index, str(tmp / INDEX_FILE))
+        for name in (INDEX_FILE, CHUNKS_FILE):
+            _fsync(tmp / name)
+        _fsync(tmp)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return tmp
+
+
+def _commit(root: Path, settings: dict, segments: List[dict], new_segments: Sequence[Path] = ()) -> dict:
+    """
+    Make a new snapshot current: rename the new segments into place, write
+    its manifest and switch CURRENT. Call with the writer lock held.
+
+    Returns:
+        The new manifest
+    """
+    for tmp in new_segments:
+        os.rename(tmp, root / SEGMENTS_DIR / tmp.name[len(_TMP_PREFIX):])
+    if new_segments:
+        _fsync(root / SEGMENTS_DIR)
+
+    manifest = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "dim": settings["dim"],
+        "count": sum(segment["count"] for segment in segments),
+        "normalize_L2": settings["normalize_L2"],
+        "distance_strategy": settings["distance_strategy"],
+        "segments": segments,
+    }
+    snapshots = root / SNAPSHOTS_DIR
+    snapshots.mkdir(exist_ok=True)
+    name = f"{_new_name()}.json"
+    tmp = snapshots / f"{_TMP_PREFIX}{name}"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, snapshots / name)
+    _fsync(snapshots)
+
+    tmp = root / f"{CURRENT_FILE}.tmp"
+    with open(tmp, "w") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, root / CURRENT_FILE)
+    _fsync(root)
+    return manifest
+
+
+def current_manifest(root: Union[str, Path]) -> Optional[Path]:
+    """Path of the manifest of an index's current snapshot, or None if it has none."""
+    root = Path(root)
+    try:
+        path = root / SNAPSHOTS_DIR / (root / CURRENT_FILE).read_text().strip()
+    except FileNotFoundError:
+        # A single-directory index from before snapshots
+        return root / MANIFEST_FILE if (root / MANIFEST_FILE).exists() else None
+    # A snapshot directory of format version 1
+    return path / MANIFEST_FILE if path.is_dir() else path
+
+
+def read_manifest(path: Union[str, Path]) -> dict:
+    """A snapshot manifest, checked for a supported format."""
+    manifest = json.loads(Path(path).read_text())
+    if manifest.get("format") != FORMAT_NAME or manifest.get("version") not in SUPPORTED_VERSIONS:
+        raise ValueError(
+            f"Unsupported index format {manifest.get('format')} v{manifest.get('version')} at {path} "
+            f"(expected {FORMAT_NAME} v{FORMAT_VERSION})"
+        )
+    return manifest
+
+
+def segment_dirs(root: Union[str, Path], manifest_path: Path, manifest: dict) -> List[Path]:
+    """Directories of the segments of a snapshot, in index position order."""
+    if manifest["version"] == 1:
+        # Version 1 snapshots are a single segment, next to the manifest
+        return [manifest_path.parent]
+    return [Path(root) / SEGMENTS_DIR / segment["name"] for segment in manifest["segments"]]
+
+
+def _current(root: Path) -> Tuple[dict, List[dict], List[Path]]:
+    """Manifest, segment entries and segment directories of the current snapshot."""
+    manifest_path = current_manifest(root)
+    if manifest_path is None:
+        raise FileNotFoundError(f"No index at {root}")
+    manifest = read_manifest(manifest_path)
+    dirs = segment_dirs(root, manifest_path, manifest)
+    segments = manifest.get("segments") or [{"name": dirs[0].name, "count": manifest["count"]}]
+    return manifest, segments, dirs
+
+
+def index_exists(root: Union[str, Path]) -> bool:
+    """Whether a directory holds a loadable index (in any format, sharded or not)."""
+    return (Path(root) / SHARDS_FILE).exists() or current_manifest(root) is not None or is_legacy_index(root)
+
+
+def is_legacy_index(path: Union[str, Path]) -> bool:
+    """Whether a directory was written by LangChain's save_local."""
+    path = Path(path)
+    return (
+        current_manifest(path) is None
+        and not (path / SHARDS_FILE).exists()
+        and (path / LEGACY_DOCSTORE_FILE).exists()
+    )
+
+
+def index_version(root: Union[str, Path]) -> Optional[str]:
+    """Changes whenever an index does: its current snapshot, or its shard map and each shard's snapshot."""
+    shard_map = read_shard_map(root)
+    if shard_map is None:
+        manifest = current_manifest(root)
+        return str(manifest) if manifest else None
+    return ";".join(str(current_manifest(shard)) for shard in shard_dirs(root, shard_map))
+
+
+def _settings(vector_db) -> dict:
+    return {
+        "dim": vector_db.index.d,
+        "normalize_L2": vector_db._normalize_L2,
+        "distance_strategy": str(vector_db.distance_strategy.value),
+    }
+
+
+def write_index(vector_db, root: Union[str, Path]) -> dict:
+    """
+    Save a LangChain FAISS store as an index made of one segment, replacing
+    whatever the index held.
+
+    Returns:
+        The new manifest
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = _write_segment(root, vector_db.index, _store_rows(vector_db))
+    segments = [{"name": tmp.name[len(_TMP_PREFIX):], "count": vector_db.index.ntotal}]
+    with _writer_lock(root):
+        manifest = _commit(root, _settings(vector_db), segments, [tmp])
+        collect_snapshots(root)
+        if (root / SHARDS_FILE).exists():
+            # This replaces a sharded index
+            (root / SHARDS_FILE).unlink()
+            _fsync(root)
+            collect_shards(root)
+    return manifest
+
+
+def _flat_index(settings: dict, vectors: np.ndarray):
+    """The index type LangChain's FAISS.from_embeddings builds, holding vectors (already normalized)."""
+    import faiss
+
+    metric = faiss.METRIC_INNER_PRODUCT if settings["distance_strategy"] == "MAX_INNER_PRODUCT" else faiss.METRIC_L2
+    index = faiss.IndexFlat(settings["dim"], metric)
+    index.add(vectors)
+    return index
+
+
+def append_segment(
+    root: Union[str, Path],
+    texts: List[str],
+    vectors: List[List[float]],
+    metadatas: List[dict],
+    ids: List[str]
+) -> dict:
+    """
+    Add chunks to an existing index as a new segment, without reading or
+    rewriting the rest of the index.
+
+    Returns:
+        The new manifest
+    """
+    import faiss
+
+    root = Path(root)
+    manifest = _current(root)[0]
+    if manifest["version"] == 1:
+        # Rewrite an index from before segments as a first segment
+        merge_segments(root)
+        manifest = _current(root)[0]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if manifest["normalize_L2"]:
+        faiss.normalize_L2(vectors)
+    index = _flat_index(manifest, vectors)
+
+    rows = ((doc_id, text, json.dumps(metadata, default=str)) for doc_id, text, metadata in zip(ids, texts, metadatas))
+    tmp = _write_segment(root, index, rows)
+    with _writer_lock(root):
+        manifest, segments, _ = _current(root)
+        segments = segments + [{"name": tmp.name[len(_TMP_PREFIX):], "count": len(ids)}]
+        manifest = _commit(root, manifest, segments, [tmp])
+        collect_snapshots(root)
+    return manifest
+
+
+def copy_index(src: Union[str, Path], root: Union[str, Path]) -> dict:
+    """
+    Start a new index as a copy of another one, sharded or not. Segment
+    files are immutable, so they are hard linked when both are on the same
+    filesystem.
+
+    Returns:
+        The new manifest (the new shard map for a sharded index)
+    """
+    src, root = Path(src), Path(root)
+    shard_map = read_shard_map(src)
+    if shard_map is not None:
+        return _copy_shards(src, root, shard_map)
+    manifest, segments, dirs = _current(src)
+    (root / SEGMENTS_DIR).mkdir(parents=True, exist_ok=True)
+
+    copied, tmps = [], []
+    try:
+        for segment, segment_dir in zip(segments, dirs):
+            tmp = root / SEGMENTS_DIR / f"{_TMP_PREFIX}{_new_name()}"
+            tmp.mkdir()
+            tmps.append(tmp)
+            for name in (INDEX_FILE, CHUNKS_FILE):
+                try:
+                    os.link(segment_dir / name, tmp / name)
+                except OSError:
+                    shutil.copy2(segment_dir / name, tmp / name)
+                    _fsync(tmp / name)
+            _fsync(tmp)
+            copied.append({"name": tmp.name[len(_TMP_PREFIX):], "count": segment["count"]})
+    except BaseException:
+        for tmp in tmps:
+            shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    with _writer_lock(root):
+        manifest = _commit(root, manifest, copied, tmps)
+        collect_snapshots(root)
+    return manifest
+
+
+def plan_merge(manifest: dict, factor: Optional[int] = None) -> Optional[List[str]]:
+    """
+    Names of the segments to merge next, or None when the index is balanced.
+
+    Segments are grouped into size tiers (powers of factor); the first
+    tier, smallest first, holding factor segments is merged.
+    """
+    factor = factor or INDEX_MERGE_FACTOR
+    tiers = defaultdict(list)
+    for segment in manifest.get("segments", []):
+        count, tier = segment["count"], 0
+        while count >= factor:
+            count //= factor
+            tier += 1
+        tiers[tier].append(segment["name"])
+    for tier in sorted(tiers):
+        if len(tiers[tier]) >= factor:
+            return tiers[tier]
+    return None
+
+
+def _merge_once(root: Path, names: Optional[List[str]], drop_ids: set) -> Optional[int]:
+    """One attempt of merge_segments; None if the segments changed meanwhile."""
+    import faiss
+
+    manifest, segments, dirs = _current(root)
+    names = [segment["name"] for segment in segments] if names is None else names
+    by_name = dict(zip((segment["name"] for segment in segments), dirs))
+    if not set(names) <= set(by_name):
+        return None
+
+    vectors, rows, dropped, metric = [], [], 0, faiss.METRIC_L2
+    for name in names:
+        index = faiss.read_index(str(by_name[name] / INDEX_FILE))
+        metric = index.metric_type
+        keep = []
+        for position, row in enumerate(_segment_rows(by_name[name])):
+            if row[0] in drop_ids:
+                dropped += 1
+            else:
+                keep.append(position)
+                rows.append(row)
+        vectors.append(index.reconstruct_n(0, index.ntotal)[keep])
+
+    merged = faiss.IndexFlat(manifest["dim"], metric)
+    merged.add(np.concatenate(vectors))
+    tmp = _write_segment(root, merged, rows)
+
+    with _writer_lock(root):
+        manifest, segments, _ = _current(root)
+        current = [segment["name"] for segment in segments]
+        if not set(names) <= set(current):
+            shutil.rmtree(tmp, ignore_errors=True)
+            return None
+        entry = {"name": tmp.name[len(_TMP_PREFIX):], "count": merged.ntotal}
+        # The merged segment takes the place of the first one it replaces
+        first = sum(1 for name in current[:current.index(names[0])] if name not in names)
+        kept = [segment for segment in segments if segment["name"] not in names]
+        _commit(root, manifest, kept[:first] + [entry] + kept[first:], [tmp])
+        collect_snapshots(root)
+    return dropped
+
+
+def merge_segments(root: Union[str, Path], names: Optional[List[str]] = None, drop_ids: Iterable[str] = ()) -> int:
+    """
+    Rewrite some segments of an index (default: all) as one, without the
+    chunks in drop_ids. Segments appended meanwhile are kept. If another
+    merge replaced some of the named segments first, this one is abandoned;
+    a merge of all segments is retried instead.
+
+    Of a sharded index, every shard holding chunks in drop_ids is rewritten
+    (or every shard, when there are none), with the shard map locked so no
+    shard is split meanwhile.
+
+    Returns:
+        Number of chunks dropped
+    """
+    root, drop_ids = Path(root), set(drop_ids)
+    if names is None and (root / SHARDS_FILE).exists():
+        with _writer_lock(root):
+            return sum(
+                merge_segments(shard, drop_ids=drop_ids)
+                for shard in shard_dirs(root)
+                if not drop_ids or _holds_any(shard, drop_ids)
+            )
+    while True:
+        dropped = _merge_once(root, names, drop_ids)
+        if dropped is not None:
+            return dropped
+        if names is not None:
+            print(f"Merge of {len(names)} segments of {root} abandoned: the index changed")
+            return 0
+
+
+def merge_index(root: Union[str, Path]) -> int:
+    """
+    Apply the merge policy (plan_merge) to an index until it is balanced;
+    of a sharded index, to each shard, then split the shards grown too
+    large (rebalance_shards).
+
+    Returns:
+        Number of merges (and shard splits) done
+    """
+    if read_shard_map(root) is not None:
+        return sum(merge_index(shard) for shard in shard_dirs(root)) + rebalance_shards(root)
+    merges = 0
+    while True:
+        manifest_path = current_manifest(root)
+        names = plan_merge(read_manifest(manifest_path)) if manifest_path else None
+        if not names:
+            return merges
+        merge_segments(root, names)
+        merges += 1
+
+
+def collect_snapshots(root: Union[str, Path], keep: Optional[int] = None) -> List[str]:
+    """
+    Delete what an index no longer needs: snapshots other than the current
+    one and the `keep` (default SNAPSHOT_KEEP) most recent others, then the
+    segments none of the remaining snapshots list, unless a loaded index in
+    this process still reads from them. Temporary files left by a crashed
+    write and the files of a single-directory index from before snapshots
+    are deleted too. Call with the writer lock held.
+
+    Returns:
+        Names of the deleted snapshots, segments and temporary files
+    """
+    root = Path(root)
+    keep = SNAPSHOT_KEEP if keep is None else keep
+    current = current_manifest(root)
+    snapshots, segments = root / SNAPSHOTS_DIR, root / SEGMENTS_DIR
+    if current is None or not snapshots.is_dir():
+        return []
+
+    def remove(path: Path):
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+        removed.append(path.name)
+
+    removed = []
+    names = [path for path in snapshots.iterdir() if not path.name.startswith(_TMP_PREFIX)]
+    current_entry = current.parent if current.name == MANIFEST_FILE else current
+    older = sorted((path for path in names if path != current_entry), reverse=True)
+    with _segment_refs_lock:
+        for path in older[keep:]:
+            if str(path) not in _segment_refs:
+                remove(path)
+
+        live = set()
+        for path in snapshots.iterdir():
+            if path.suffix == ".json" and not path.name.startswith(_TMP_PREFIX):
+                live.update(segment["name"] for segment in read_manifest(path)["segments"])
+        if segments.is_dir():
+            for path in segments.iterdir():
+                if not path.name.startswith(_TMP_PREFIX) and path.name not in live and str(path) not in _segment_refs:
+                    remove(path)
+
+        if str(root) not in _segment_refs:
+            for name in (MANIFEST_FILE, INDEX_FILE, CHUNKS_FILE, LEGACY_DOCSTORE_FILE):
+                if (root / name).exists():
+                    remove(root / name)
+
+    for parent in (snapshots, segments):
+        for path in parent.glob(f"{_TMP_PREFIX}*") if parent.is_dir() else []:
+            if time.time() - path.stat().st_mtime > STALE_TMP_SECONDS:
+                remove(path)
+    return removed
+
+
+def shard_key(metadata: dict, shard_by: str) -> str:
+    """
+    Routing key of a chunk under a shard policy:
+
+    - corpus: the corpus it comes from ("uploads" for user uploads, "cuad"
+      otherwise, unless its metadata names one)
+    - user: one of USER_SHARDS buckets by a hash of its owner ("shared" for
+      chunks nobody owns)
+    - size: the same for every chunk; shards are only cut by size
+    """
+    if shard_by == "corpus":
+        return metadata.get("corpus") or ("uploads" if metadata.get("type") == "user_upload" else "cuad")
+    if shard_by == "user":
+        if not metadata.get("user_id"):
+            return "shared"
+        digest = hashlib.sha256(str(metadata["user_id"]).encode("utf-8")).hexdigest()
+        return f"user-{int(digest[:8], 16) % USER_SHARDS:02d}"
+    if shard_by == "size":
+        return "all"
+    raise ValueError(f"Unknown shard policy {shard_by!r} (expected one of {', '.join(SHARD_POLICIES)})")
+
+
+def read_shard_map(root: Union[str, Path]) -> Optional[dict]:
+    """The shard map of a sharded index, or None if the index is not sharded."""
+    path = Path(root) / SHARDS_FILE
+    try:
+        shard_map = json.loads(path.read_text())
+    except FileNotFoundError:
+        return None
+    if shard_map.get("format") != SHARDS_FORMAT or shard_map.get("version") != 1:
+        raise ValueError(
+            f"Unsupported shard map {shard_map.get('format')} v{shard_map.get('version')} at {path} "
+            f"(expected {SHARDS_FORMAT} v1)"
+        )
+    return shard_map
+
+
+def shard_dirs(root: Union[str, Path], shard_map: Optional[dict] = None) -> List[Path]:
+    """Directories of the shards of a sharded index, in shard map order."""
+    shard_map = shard_map or read_shard_map(root)
+    return [Path(root) / SHARDS_DIR / shard["name"] for shard in shard_map["shards"]]
+
+
+def _parts(count: int, max_vectors: int) -> List[Tuple[int, int]]:
+    """[start, end) ranges cutting count positions into even parts of at most max_vectors."""
+    parts = max(1, -(-count // max_vectors))
+    bounds = [count * i // parts for i in range(parts + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def _write_shard(root: Path, settings: dict, rows: Sequence[Row], vectors: np.ndarray) -> Path:
+    """
+    Write a shard of one segment to a temporary directory under the index.
+
+    Returns:
+        The temporary directory; _switch_shards renames it into place
+    """
+    shards = root / SHARDS_DIR
+    shards.mkdir(parents=True, exist_ok=True)
+    tmp = shards / f"{_TMP_PREFIX}{_new_name()}"
+    tmp.mkdir()
+    try:
+        segment = _write_segment(tmp, _flat_index(settings, vectors), rows)
+        _commit(tmp, settings, [{"name": segment.name[len(_TMP_PREFIX):], "count": len(rows)}], [segment])
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return tmp
+
+
+def _switch_shards(root: Path, shard_by: str, settings: dict, shards: List[dict], new_shards: Sequence[Path] = ()):
+    """
+    Make a new shard map current: rename the new shards into place and
+    replace SHARDS.json. Call with the writer lock held.
+    """
+    for tmp in new_shards:
+        os.rename(tmp, root / SHARDS_DIR / tmp.name[len(_TMP_PREFIX):])
+    if new_shards:
+        _fsync(root / SHARDS_DIR)
+
+    shard_map = {
+        "format": SHARDS_FORMAT,
+        "version": 1,
+        "shard_by": shard_by,
+        "settings": {key: settings[key] for key in ("dim", "normalize_L2", "distance_strategy")},
+        "shards": shards,
+    }
+    tmp = root / f"{SHARDS_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(shard_map, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, root / SHARDS_FILE)
+    _fsync(root)
+    return shard_map
+
+
+def _shard_entry(tmp: Path, key: str) -> dict:
+    return {"name": tmp.name[len(_TMP_PREFIX):], "key": key}
+
+
+def write_shards(vector_db, root: Union[str, Path], shard_by: str, max_vectors: Optional[int] = None) -> dict:
+    """
+    Save a LangChain FAISS store as a sharded index, replacing whatever the
+    index held: chunks are grouped by shard_key, and each group cut into
+    shards of at most max_vectors (default SHARD_MAX_VECTORS).
+
+    Returns:
+        The new shard map
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    max_vectors = max_vectors or SHARD_MAX_VECTORS
+    settings = _settings(vector_db)
+    vectors = vector_db.index.reconstruct_n(0, vector_db.index.ntotal)
+
+    rows, groups = [], defaultdict(list)
+    for position, row in enumerate(_store_rows(vector_db)):
+        rows.append(row)
+        groups[shard_key(json.loads(row[2]), shard_by)].append(position)
+
+    entries, tmps = [], []
+    try:
+        for key, positions in groups.items():
+            for start, end in _parts(len(positions), max_vectors):
+                part = positions[start:end]
+                tmps.append(_write_shard(root, settings, [rows[i] for i in part], vectors[part]))
+                entries.append(_shard_entry(tmps[-1], key))
+    except BaseException:
+        for tmp in tmps:
+            shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    with _writer_lock(root):
+        shard_map = _switch_shards(root, shard_by, settings, entries, tmps)
+        collect_shards(root)
+    return shard_map
+
+
+def append_chunks(
+    root: Union[str, Path],
+    texts: List[str],
+    vectors: List[List[float]],
+    metadatas: List[dict],
+    ids: List[str]
+) -> dict:
+    """
+    Add chunks to an index, sharded or not, as new segments (append_segment).
+    Of a sharded index, each chunk goes to the last shard of its key; a
+    shard is started for a key seen for the first time.
+
+    Returns:
+        count: vectors in the index; needs_merge: whether merge_index has
+        work to do (segments to merge or shards to split)
+    """
+    import faiss
+
+    root = Path(root)
+    if not (root / SHARDS_FILE).exists():
+        manifest = append_segment(root, texts, vectors, metadatas, ids)
+        return {"count": manifest["count"], "needs_merge": plan_merge(manifest) is not None}
+
+    # Appends hold the shard map lock, so a shard being split cannot take chunks meanwhile
+    needs_merge = False
+    with _writer_lock(root):
+        shard_map = read_shard_map(root)
+        settings = shard_map["settings"]
+        last = {shard["key"]: shard["name"] for shard in shard_map["shards"]}
+        groups = defaultdict(list)
+        for i, metadata in enumerate(metadatas):
+            groups[shard_key(metadata, shard_map["shard_by"])].append(i)
+
+        entries, tmps = [], []
+        try:
+            for key, members in groups.items():
+                if key in last:
+                    manifest = append_segment(
+                        root / SHARDS_DIR / last[key],
+                        [texts[i] for i in members],
+                        [vectors[i] for i in members],
+                        [metadatas[i] for i in members],
+                        [ids[i] for i in members],
+                    )
+                    needs_merge |= plan_merge(manifest) is not None or manifest["count"] > SHARD_MAX_VECTORS
+                else:
+                    part = np.asarray([vectors[i] for i in members], dtype=np.float32)
+                    if settings["normalize_L2"]:
+                        faiss.normalize_L2(part)
+                    rows = [(ids[i], texts[i], json.dumps(metadatas[i], default=str)) for i in members]
+                    tmps.append(_write_shard(root, settings, rows, part))
+                    entries.append(_shard_entry(tmps[-1], key))
+        except BaseException:
+            for tmp in tmps:
+                shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        if tmps:
+            shard_map = _switch_shards(root, shard_map["shard_by"], settings, shard_map["shards"] + entries, tmps)
+        count = sum(read_manifest(current_manifest(shard))["count"] for shard in shard_dirs(root, shard_map))
+    return {"count": count, "needs_merge": needs_merge}
+
+
+def _copy_shards(src: Path, root: Path, shard_map: dict) -> dict:
+    """copy_index of a sharded index: every shard is copied, the shard map is written last."""
+    entries, tmps = [], []
+    (root / SHARDS_DIR).mkdir(parents=True, exist_ok=True)
+    try:
+        for shard, shard_dir in zip(shard_map["shards"], shard_dirs(src, shard_map)):
+            tmp = root / SHARDS_DIR / f"{_TMP_PREFIX}{_new_name()}"
+            tmps.append(tmp)
+            copy_index(shard_dir, tmp)
+            entries.append(_shard_entry(tmp, shard["key"]))
+    except BaseException:
+        for tmp in tmps:
+            shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    with _writer_lock(root):
+        shard_map = _switch_shards(root, shard_map["shard_by"], shard_map["settings"], entries, tmps)
+        collect_shards(root)
+    return shard_map
+
+
+def _holds_any(root: Path, ids: set) -> bool:
+    """Whether an index holds any of the given chunk ids."""
+    store = ChunkStore([segment / CHUNKS_FILE for segment in _current(root)[2]])
+    try:
+        return bool(store._stored(ids))
+    finally:
+        store.close()
+
+
+def _split_once(root: Path, name: str, max_vectors: int) -> Optional[bool]:
+    """One attempt of split_shard; None if the shard changed meanwhile."""
+    import faiss
+
+    shard_dir = root / SHARDS_DIR / name
+    manifest_path = current_manifest(shard_dir)
+    if manifest_path is None:
+        return False
+    try:
+        manifest, _, dirs = _current(shard_dir)
+        rows = [row for segment in dirs for row in _segment_rows(segment)]
+        vectors = np.concatenate([
+            index.reconstruct_n(0, index.ntotal)
+            for index in (faiss.read_index(str(segment / INDEX_FILE)) for segment in dirs)
+        ])
+    except (FileNotFoundError, sqlite3.OperationalError, RuntimeError):
+        # A merge of the shard collected its segments
+        return None
+    if len(rows) <= max_vectors:
+        return False
+
+    tmps = []
+    try:
+        for start, end in _parts(len(rows), max_vectors):
+            tmps.append(_write_shard(root, manifest, rows[start:end], vectors[start:end]))
+    except BaseException:
+        for tmp in tmps:
+            shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    with _writer_lock(root):
+        shard_map = read_shard_map(root)
+        names = [shard["name"] for shard in shard_map["shards"]]
+        if name not in names or current_manifest(shard_dir) != manifest_path:
+            for tmp in tmps:
+                shutil.rmtree(tmp, ignore_errors=True)
+            return None if name in names else False
+        # The parts take the place of the shard, so the last one still takes its key's new chunks
+        i = names.index(name)
+        key = shard_map["shards"][i]["key"]
+        shards = shard_map["shards"][:i] + [_shard_entry(tmp, key) for tmp in tmps] + shard_map["shards"][i + 1:]
+        _switch_shards(root, shard_map["shard_by"], shard_map["settings"], shards, tmps)
+        collect_shards(root)
+    return True
+
+
+def split_shard(root: Union[str, Path], name: str, max_vectors: Optional[int] = None) -> bool:
+    """
+    Replace a shard holding more than max_vectors (default
+    SHARD_MAX_VECTORS) vectors by contiguous parts of at most max_vectors.
+    If chunks were appended to the shard, or it was merged, meanwhile, the
+    split is retried.
+
+    Returns:
+        Whether the shard was split
+    """
+    root, max_vectors = Path(root), max_vectors or SHARD_MAX_VECTORS
+    while True:
+        split = _split_once(root, name, max_vectors)
+        if split is not None:
+            return split
+
+
+def rebalance_shards(root: Union[str, Path], max_vectors: Optional[int] = None) -> int:
+    """
+    Split the shards of a sharded index holding more than max_vectors
+    (default SHARD_MAX_VECTORS) vectors.
+
+    Returns:
+        Number of shards split
+    """
+    root, max_vectors = Path(root), max_vectors or SHARD_MAX_VECTORS
+    shard_map = read_shard_map(root)
+    if shard_map is None:
+        return 0
+    splits = 0
+    for shard, shard_dir in zip(shard_map["shards"], shard_dirs(root, shard_map)):
+        manifest_path = current_manifest(shard_dir)
+        if manifest_path and read_manifest(manifest_path)["count"] > max_vectors:
+            splits += split_shard(root, shard["name"], max_vectors)
+    if splits:
+        print(f"Split {splits} shards of {root} past {max_vectors} vectors")
+    return splits
+
+
+def collect_shards(root: Union[str, Path]) -> List[str]:
+    """
+    Delete the shards a sharded index's map no longer lists (all of them
+    once the index is no longer sharded), and the snapshots and segments of
+    the unsharded index a shard map replaced, unless a loaded index in this
+    process reads from them. Call with the writer lock held.
+
+    Returns:
+        Names of the deleted shards and directories
+    """
+    root = Path(root)
+    shard_map = read_shard_map(root)
+    listed = {shard["name"] for shard in shard_map["shards"]} if shard_map else set()
+    shards = root / SHARDS_DIR
+    removed = []
+
+    with _segment_refs_lock:
+        def in_use(path: Path) -> bool:
+            return any(ref.startswith(f"{path}{os.sep}") for ref in _segment_refs)
+
+        for path in shards.iterdir() if shards.is_dir() else []:
+            stale = path.name.startswith(_TMP_PREFIX) and time.time() - path.stat().st_mtime > STALE_TMP_SECONDS
+            if (stale or not path.name.startswith(_TMP_PREFIX)) and path.name not in listed and not in_use(path):
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path.name)
+
+        if shard_map is not None and not in_use(root / SEGMENTS_DIR):
+            (root / CURRENT_FILE).unlink(missing_ok=True)
+            for path in (root / SNAPSHOTS_DIR, root / SEGMENTS_DIR):
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+                    removed.append(path.name)
+    return removed
+
+
+def read_index(root: Union[str, Path], embedder, mmap: bool = False):
+    """
+    Load the current snapshot of an index as a LangChain FAISS store.
+
+    mmap maps the vectors from the segment files instead of reading them into
+    memory; the index can then only be searched (and written through
+    append_segment and merge_segments).
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    # Another process may collect the snapshot between reading CURRENT and
+    # opening it; CURRENT then points at a newer one
+    for _ in range(3):
+        manifest_path = current_manifest(root)
+        if manifest_path is None:
+            raise FileNotFoundError(f"No index snapshot at {root}")
+        docstore = None
+        try:
+            manifest = read_manifest(manifest_path)
+            dirs = segment_dirs(root, manifest_path, manifest)
+            docstore = ChunkStore([segment / CHUNKS_FILE for segment in dirs])
+            index_to_docstore_id = docstore.positions()
+            flags = faiss.IO_FLAG_MMAP_IFC if mmap else 0
+            indexes = [faiss.read_index(str(segment / INDEX_FILE), flags) for segment in dirs]
+            break
+        except (FileNotFoundError, sqlite3.OperationalError, RuntimeError):
+            if docstore is not None:
+                docstore.close()
+            if manifest_path == current_manifest(root):
+                raise
+    else:
+        raise FileNotFoundError(f"Index at {root} kept changing while loading")
+
+    if len(indexes) == 1:
+        index = indexes[0]
+    else:
+        # Searched together, ids numbered across segments like the positions;
+        # add and remove_ids are not supported: write through append_segment
+        # and merge_segments instead
+        index = faiss.IndexShards(manifest["dim"], False, True)
+        for shard in indexes:
+            index.add_shard(shard)
+
+    if index.ntotal != len(index_to_docstore_id):
+        docstore.close()
+        raise ValueError(f"Index at {root} has {index.ntotal} vectors but {len(index_to_docstore_id)} chunks")
+
+    return FAISS(
+        embedding_function=embedder,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=index_to_docstore_id,
+        normalize_L2=manifest["normalize_L2"],
+        distance_strategy=DistanceStrategy(manifest["distance_strategy"]),
+    )
+
+
+def read_shards(root: Union[str, Path], embedder, mmap: bool = False) -> Tuple[dict, list]:
+    """
+    Load every shard of a sharded index (read_index).
+
+    Returns:
+        (shard map, one LangChain FAISS store per shard, in shard map order)
+    """
+    # A split may replace shards between reading the map and opening them;
+    # the map then lists their parts
+    for _ in range(3):
+        shard_map = read_shard_map(root)
+        if shard_map is None:
+            raise FileNotFoundError(f"No shard map at {root}")
+        stores = []
+        try:
+            for shard in shard_dirs(root, shard_map):
+                stores.append(read_index(shard, embedder, mmap=mmap))
+            return shard_map, stores
+        except FileNotFoundError:
+            for store in stores:
+                store.docstore.close()
+            if read_shard_map(root) == shard_map:
+                raise
+    raise FileNotFoundError(f"Shards of {root} kept changing while loading")
@@ -0,0 +1,95 @@
+"""
+In-process latency metrics.
+
+Stages record their durations here (bounded to the most recent samples) and
+the API serves a snapshot with percentiles at /metrics, which the load test
+in benchmarks/ reads for its per-stage breakdown.
+"""
+
+import os
+import resource
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+MAX_SAMPLES = 10000
+
+_lock = threading.Lock()
+_samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_counters: Dict[str, float] = defaultdict(float)
+
+
+def record(stage: str, seconds: float):
+    """Record one duration for a stage."""
+    with _lock:
+        _samples[stage].append(seconds)
+
+
+def increment(name: str, value: float = 1):
+    """Add to a counter."""
+    with _lock:
+        _counters[name] += value
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the wrapped block as one sample of `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+def summarize(values: List[float]) -> dict:
+    """Count, mean and p50/p95/p99 (nearest rank) of durations, in ms."""
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": pct(50),
+        "p95_ms": pct(95),
+        "p99_ms": pct(99),
+    }
+
+
+def rss_mb() -> float:
+    """Current resident set size of this process, in MB."""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process, in MB (Linux reports KiB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 / 1e6
+
+
+def snapshot(reset: bool = False) -> dict:
+    """Summaries of every stage and counter, plus memory usage."""
+    with _lock:
+        stages = {stage: summarize(list(values)) for stage, values in _samples.items()}
+        counters = dict(_counters)
+        if reset:
+            _samples.clear()
+            _counters.clear()
+
+    return {
+        "pid": os.getpid(),
+        "stages": stages,
+        "counters": counters,
+        "rss_mb": rss_mb(),
+        "peak_rss_mb": peak_rss_mb(),
+    }
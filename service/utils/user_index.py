@@ -0,0 +1,491 @@
+"""
+Per-user document indexes.
+
+Every user gets a FAISS index (seeded from the CUAD index when one exists)
+plus a JSON document registry next to it. The registry maps the SHA-256 of
+each uploaded file to its document and the ids of its chunks, so:
+
+- re-uploading an identical file is short-circuited to the existing document
+- a revised file only embeds the chunks whose text changed; unchanged chunks
+  reuse the vectors already in the index (chunks are reference counted)
+
+Each newly embedded chunk is classified into CUAD clause types (see
+clauses.py) and the registry keeps a clause type -> chunk ids index, so the
+chunks of the clause types a query names rank first among its search results.
+
+Newly embedded chunks are appended to the index as a segment (see
+index_store.py), to the shard of their key when indexes are sharded
+(INDEX_SHARD_BY); segments are merged, and oversized shards split, in the
+background.
+
+Removing a document or session only tombstones the chunks nobody references
+any more; searches filter tombstones out, and the index is compacted (dead
+vectors physically removed) once the tombstone ratio crosses a threshold.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from . import metrics
+from .chunking import iter_contract_chunks
+from .clauses import classify_chunks, detect_clause_types, get_clause_prototypes
+from .extraction import iter_document_text
+from .index_store import append_chunks, copy_index, index_version, merge_index, merge_segments
+from .vectorstore import build_vectorstore, index_exists, save_vectorstore
+
+
+USER_INDEX_DIR = Path(
+    os.getenv("USER_INDEX_DIR", str(Path(__file__).parent.parent / "data" / "embeddings" / "users"))
+)
+
+# Compact a user index once this fraction of the user's own vectors is dead
+COMPACTION_TOMBSTONE_RATIO = float(os.getenv("COMPACTION_TOMBSTONE_RATIO", "0.2"))
+
+# One writer per user index at a time, in this process (see _user_lock)
+_user_locks: Dict[str, threading.Lock] = defaultdict(threading.Lock)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def user_index_path(user_id: str) -> Path:
+    """Directory of a user's FAISS index."""
+    return USER_INDEX_DIR / f"user_{user_id}_faiss"
+
+
+def user_registry_path(user_id: str) -> Path:
+    """Path of a user's document registry."""
+    return USER_INDEX_DIR / f"user_{user_id}_documents.json"
+
+
+@contextmanager
+def _user_lock(user_id: str) -> Iterator[None]:
+    """Exclusive lock of a user's index and registry, across threads and worker processes."""
+    with _user_locks[user_id]:
+        USER_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        with open(USER_INDEX_DIR / f"user_{user_id}.lock", "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def user_index_version(user_id: str) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Changes whenever a user's index or registry does, in any process:
+    agents loaded over an older version are stale.
+    """
+    try:
+        registry_mtime = user_registry_path(user_id).stat().st_mtime_ns
+    except FileNotFoundError:
+        registry_mtime = None
+    return (index_version(user_index_path(user_id)), registry_mtime)
+
+
+def chunk_id(text: str) -> str:
+    """Stable id for a chunk: hash of its whitespace-normalized text."""
+    normalized = _WHITESPACE.sub(" ", text).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+class DocumentRegistry:
+    """
+    JSON registry of a user's indexed documents.
+
+    Layout:
+        documents: {document_id: {content_hash, filename, sessions, chunk_ids, created}}
+        chunks: {chunk_id: number of documents referencing the chunk's vector}
+        tombstones: chunk ids whose vectors are dead but still in the index
+        index_size: number of vectors in the index when it was last written
+        clauses: {clause_type: [[chunk_id, similarity], ...]}, best first;
+            may list tombstoned chunks until the index is compacted
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        documents: Optional[Dict] = None,
+        chunks: Optional[Dict] = None,
+        tombstones: Optional[List[str]] = None,
+        index_size: int = 0,
+        clauses: Optional[Dict] = None
+    ):
+        self.path = Path(path)
+        self.documents: Dict[str, Dict] = documents or {}
+        self.chunks: Dict[str, int] = chunks or {}
+        self.tombstones: Set[str] = set(tombstones or [])
+        self.index_size = index_size
+        self.clauses: Dict[str, List[List]] = clauses or {}
+
+    @classmethod
+    def load(cls, path: Path) -> "DocumentRegistry":
+        """Load a registry, or start an empty one if the file does not exist."""
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(
+            path,
+            data.get("documents"),
+            data.get("chunks"),
+            data.get("tombstones"),
+            data.get("index_size", 0),
+            data.get("clauses")
+        )
+
+    def save(self):
+        """Write the registry atomically (temp file + rename)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "documents": self.documents,
+                "chunks": self.chunks,
+                "tombstones": sorted(self.tombstones),
+                "index_size": self.index_size,
+                "clauses": self.clauses,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def find_by_hash(self, content_hash: str) -> Optional[str]:
+        """Document id of an already indexed file with this content hash."""
+        return content_hash if content_hash in self.documents else None
+
+    def add_session(self, document_id: str, session_id: str):
+        """Record that another chat session uses an existing document."""
+        sessions = self.documents[document_id]["sessions"]
+        if session_id and session_id not in sessions:
+            sessions.append(session_id)
+
+    def add_document(self, document_id: str, filename: str, session_id: str, chunk_ids: List[str]):
+        """Register a document and take a reference on each of its chunks."""
+        self.documents[document_id] = {
+            "content_hash": document_id,
+            "filename": filename,
+            "sessions": [session_id] if session_id else [],
+            "chunk_ids": chunk_ids,
+            "created": datetime.now().isoformat(timespec="seconds"),
+        }
+        for cid in chunk_ids:
+            self.chunks[cid] = self.chunks.get(cid, 0) + 1
+            self.tombstones.discard(cid)
+
+    def remove_document(self, document_id: str) -> List[str]:
+        """
+        Drop a document and release its chunks.
+
+        Returns:
+            Chunk ids that are no longer referenced (now tombstoned)
+        """
+        document = self.documents.pop(document_id, None)
+        if document is None:
+            return []
+
+        dead = []
+        for cid in document["chunk_ids"]:
+            refs = self.chunks.get(cid, 0) - 1
+            if refs > 0:
+                self.chunks[cid] = refs
+            else:
+                self.chunks.pop(cid, None)
+                self.tombstones.add(cid)
+                dead.append(cid)
+        return dead
+
+    def remove_session(self, session_id: str) -> List[str]:
+        """
+        Detach a session from its documents, removing documents left unused.
+
+        Returns:
+            Ids of the documents that were removed
+        """
+        removed = []
+        for document_id, document in list(self.documents.items()):
+            if session_id not in document["sessions"]:
+                continue
+            document["sessions"].remove(session_id)
+            if not document["sessions"]:
+                self.remove_document(document_id)
+                removed.append(document_id)
+        return removed
+
+    def add_clauses(self, chunk_clauses: Dict[str, List]):
+        """Index chunks under their clause types ({chunk_id: [(clause_type, similarity)]})."""
+        touched = set()
+        for cid, hits in chunk_clauses.items():
+            for clause_type, similarity in hits:
+                self.clauses.setdefault(clause_type, []).append([cid, similarity])
+                touched.add(clause_type)
+        for clause_type in touched:
+            self.clauses[clause_type].sort(key=lambda entry: -entry[1])
+
+    def drop_clauses(self, chunk_ids: Set[str]):
+        """Remove chunks from the clause index."""
+        for clause_type in list(self.clauses):
+            entries = [entry for entry in self.clauses[clause_type] if entry[0] not in chunk_ids]
+            if entries:
+                self.clauses[clause_type] = entries
+            else:
+                del self.clauses[clause_type]
+
+    def session_chunks(self, session_id: str) -> Set[str]:
+        """Chunk ids of the documents a chat session uses."""
+        return {
+            cid
+            for document in self.documents.values() if session_id in document["sessions"]
+            for cid in document["chunk_ids"]
+        }
+
+    def clause_chunks(self, clause_types: List[str], session_id: Optional[str] = None) -> Set[str]:
+        """
+        Live chunks classified under any of the given clause types; only
+        those of the session's documents when a session is given.
+        """
+        chunks = {
+            cid
+            for clause_type in clause_types
+            for cid, _ in self.clauses.get(clause_type, [])
+            if cid not in self.tombstones
+        }
+        return chunks & self.session_chunks(session_id) if session_id else chunks
+
+    @property
+    def tombstone_ratio(self) -> float:
+        """
+        Fraction of the user's own vectors that are dead. The CUAD vectors a
+        user index is seeded with do not count: they would hide a user whose
+        uploads are all deleted.
+        """
+        uploaded = len(self.chunks) + len(self.tombstones)
+        return len(self.tombstones) / uploaded if uploaded else 0.0
+
+
+def index_user_document(
+    user_id: str,
+    session_id: Optional[str],
+    filename: str,
+    path: str,
+    content_hash: str,
+    embedder,
+    base_index_path: Optional[Path] = None
+) -> dict:
+    """
+    Add an uploaded document to a user's index, skipping work already done.
+
+    Args:
+        user_id: Owner of the index
+        session_id: Chat session the upload belongs to
+        filename: Original filename (used to pick the parser)
+        path: Path of the uploaded file on disk
+        content_hash: SHA-256 of the file contents
+        embedder: Embedding model
+        base_index_path: Index to seed a new user index from (the CUAD index)
+
+    Returns:
+        Summary of what was indexed
+
+    Raises:
+        ValueError: If no text could be extracted from the file
+    """
+    index_path = user_index_path(user_id)
+
+    with _user_lock(user_id):
+        if index_exists(index_path):
+            registry = DocumentRegistry.load(user_registry_path(user_id))
+        else:
+            # No index (or it was removed): any old registry is stale
+            registry = DocumentRegistry(user_registry_path(user_id))
+
+        existing = registry.find_by_hash(content_hash)
+        if existing:
+            registry.add_session(existing, session_id)
+            registry.save()
+            return {
+                "document_id": existing,
+                "duplicate": True,
+                "chunks_created": len(registry.documents[existing]["chunk_ids"]),
+                "chunks_embedded": 0,
+                "index_path": str(index_path),
+            }
+
+        with metrics.timed("index.extract_chunk"):
+            chunks = list(iter_contract_chunks(iter_document_text(path, filename)))
+        if not chunks:
+            raise ValueError("No text could be extracted from file")
+
+        # Unique chunk ids in document order; repeated boilerplate is stored once.
+        # Structural boundaries keep ids stable when a revision edits one clause.
+        chunk_ids = list(dict.fromkeys(chunk_id(chunk) for chunk, _ in chunks))
+        texts, metadatas, ids = [], [], []
+        seen = set()
+        for i, (chunk, heading) in enumerate(chunks):
+            cid = chunk_id(chunk)
+            # Known chunks (live, or dead but not compacted yet) keep their vector
+            if cid in seen or cid in registry.chunks or cid in registry.tombstones:
+                continue
+            seen.add(cid)
+            texts.append(chunk)
+            ids.append(cid)
+            metadatas.append({
+                "source": filename,
+                "user_id": user_id,
+                "session_id": session_id or "",
+                "document_id": content_hash,
+                "chunk_id": cid,
+                "section": heading,
+                "chunk_index": i,
+                "total_chunks": len(chunks),
+                "type": "user_upload"
+            })
+
+        # Only the chunks the index has not seen yet are embedded and classified
+        needs_merge = False
+        if texts:
+            with metrics.timed("index.embed"):
+                vectors = embedder.embed_documents(texts)
+
+            with metrics.timed("index.classify"):
+                chunk_clauses = dict(zip(ids, classify_chunks(vectors, get_clause_prototypes(embedder))))
+            for metadata in metadatas:
+                metadata["clause_types"] = ", ".join(t for t, _ in chunk_clauses[metadata["chunk_id"]])
+            registry.add_clauses(chunk_clauses)
+
+            with metrics.timed("index.write"):
+                if not index_exists(index_path) and base_index_path is not None and index_exists(base_index_path):
+                    # Start from a copy of the CUAD index
+                    copy_index(base_index_path, index_path)
+                if index_exists(index_path):
+                    # Only the new chunks are written, as a new segment
+                    appended = append_chunks(index_path, texts, vectors, metadatas, ids)
+                    needs_merge = appended["needs_merge"]
+                    registry.index_size = appended["count"]
+                else:
+                    vector_db = build_vectorstore(texts, metadatas, embedder, ids=ids, vectors=vectors)
+                    save_vectorstore(vector_db, str(index_path))
+                    registry.index_size = vector_db.index.ntotal
+
+        registry.add_document(content_hash, filename, session_id, chunk_ids)
+        registry.save()
+
+        return {
+            "document_id": content_hash,
+            "duplicate": False,
+            "chunks_created": len(chunks),
+            "chunks_embedded": len(texts),
+            "index_path": str(index_path),
+            "needs_merge": needs_merge,
+        }
+
+
+def remove_user_documents(
+    user_id: str,
+    session_id: Optional[str] = None,
+    document_id: Optional[str] = None
+) -> dict:
+    """
+    Remove a session's documents or a single document from a user's index.
+
+    Vectors are only tombstoned here; compact_user_index removes them.
+
+    Returns:
+        Removed document ids, tombstone count and whether compaction is due
+    """
+    with _user_lock(user_id):
+        registry = DocumentRegistry.load(user_registry_path(user_id))
+
+        removed = []
+        if session_id:
+            removed.extend(registry.remove_session(session_id))
+        if document_id and document_id in registry.documents:
+            registry.remove_document(document_id)
+            removed.append(document_id)
+
+        registry.save()
+
+        return {
+            "removed_documents": removed,
+            "tombstones": len(registry.tombstones),
+            "needs_compaction": registry.tombstone_ratio >= COMPACTION_TOMBSTONE_RATIO,
+        }
+
+
+def compact_user_index(user_id: str) -> int:
+    """
+    Physically remove tombstoned vectors from a user's index by merging all
+    of its segments into one.
+
+    Returns:
+        Number of vectors removed
+    """
+    index_path = user_index_path(user_id)
+
+    with _user_lock(user_id):
+        registry = DocumentRegistry.load(user_registry_path(user_id))
+        if not registry.tombstones or not index_exists(index_path):
+            return 0
+
+        with metrics.timed("index.compact"):
+            removed = merge_segments(index_path, drop_ids=registry.tombstones)
+
+        registry.drop_clauses(registry.tombstones)
+        registry.index_size -= removed
+        registry.tombstones.clear()
+        registry.save()
+
+        print(f"Compacted index for user {user_id}: removed {removed} vectors")
+        return removed
+
+
+def merge_user_index(user_id: str) -> int:
+    """
+    Merge the segments appended to a user's index by uploads, following the
+    size-tiered policy of index_store.plan_merge, and split its shards grown
+    past SHARD_MAX_VECTORS. Uploads can go on meanwhile.
+
+    Returns:
+        Number of merges (and shard splits) done
+    """
+    index_path = user_index_path(user_id)
+    if not index_exists(index_path):
+        return 0
+    with metrics.timed("index.merge"):
+        merges = merge_index(index_path)
+    if merges:
+        print(f"Merged segments of user {user_id}'s index ({merges} merges)")
+    return merges
+
+
+def tombstone_filter(user_id: str) -> Callable[[dict], bool]:
+    """Search-time metadata filter that hides a user's tombstoned chunks."""
+    tombstones = DocumentRegistry.load(user_registry_path(user_id)).tombstones
+    return lambda metadata: metadata.get("chunk_id") not in tombstones
+
+
+def clause_lookup(user_id: str) -> Callable[..., Set[str]]:
+    """
+    Chunks to rank first for queries that name clause types (see
+    agents.retriever.search_documents).
+
+    Returns:
+        A function mapping a query (and optionally the chat session it comes
+        from) to the ids of the user's chunks classified under the clause
+        types it names, of the session's documents only when a session is
+        given; empty when it names none
+    """
+    registry = DocumentRegistry.load(user_registry_path(user_id))
+
+    def lookup(query: str, session_id: Optional[str] = None) -> Set[str]:
+        clause_types = detect_clause_types(query)
+        return registry.clause_chunks(clause_types, session_id) if clause_types else set()
+
+    return lookup
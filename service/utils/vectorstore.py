@@ -1,24 +1,291 @@
 """
 Vector database operations.
+
+Indexes are single FAISS stores, or sharded (see index_store.py): saved
+with shard_by (default INDEX_SHARD_BY) set, they load as a
+ShardedVectorStore, which searches every shard in parallel threads and
+merges their top k.
 """
 
 import os
-from langchain_community.vectorstores import FAISS
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+from . import metrics
+from .index_store import (
+    index_exists,
+    is_legacy_index,
+    read_index,
+    read_shard_map,
+    read_shards,
+    write_index,
+    write_shards,
+)
+
+
+# How new indexes are sharded: "" (not at all), "corpus", "user" or "size" (see index_store.shard_key)
+INDEX_SHARD_BY = os.getenv("INDEX_SHARD_BY", "")
+# Reciprocal rank fusion constant of fused searches: larger flattens the rank weights
+RRF_K = 60
+# Threads searching shards in parallel, shared by all sharded stores of the process
+SHARD_SEARCH_THREADS = int(os.getenv("SHARD_SEARCH_THREADS", str(min(8, os.cpu_count() or 1))))
+
+_search_pool: Optional[ThreadPoolExecutor] = None
+_search_pool_lock = threading.Lock()
+
+
+def _get_search_pool() -> ThreadPoolExecutor:
+    global _search_pool
+    with _search_pool_lock:
+        if _search_pool is None:
+            _search_pool = ThreadPoolExecutor(SHARD_SEARCH_THREADS, thread_name_prefix="shard-search")
+    return _search_pool
+
+
+def _reset_after_fork() -> None:
+    # The pool's threads do not survive a fork (the pre-fork server loads
+    # indexes before forking its workers)
+    global _search_pool, _search_pool_lock
+    _search_pool = None
+    _search_pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class ShardedDocstore(Docstore):
+    """Docstore over the docstores of several shards: an id is looked up in each in turn."""
+
+    def __init__(self, docstores: list):
+        self.docstores = docstores
+
+    def search(self, search: str):
+        for docstore in self.docstores:
+            doc = docstore.search(search)
+            if not isinstance(doc, str):
+                return doc
+        return f"ID {search} not found."
+
+
+class ShardedVectorStore:
+    """
+    Several LangChain FAISS stores searched as one index.
+
+    A query is embedded once, then searched in every shard in parallel (FAISS
+    releases the GIL while it searches) and the shards' results are merged
+    into the overall top k. A flat index's top k is always among the union
+    of its shards' top k, so results match those of a single index. Each
+    shard applies filters to its own fetch_k candidates.
+    """
+
+    def __init__(self, shards: list, shard_by: str = ""):
+        if not shards:
+            raise ValueError("A sharded store needs at least one shard")
+        self.shards = shards
+        self.shard_by = shard_by
+        self.docstore = ShardedDocstore([shard.docstore for shard in shards])
+
+    @property
+    def embeddings(self):
+        return self.shards[0].embeddings
+
+    @property
+    def _normalize_L2(self) -> bool:
+        return self.shards[0]._normalize_L2
+
+    @property
+    def distance_strategy(self):
+        return self.shards[0].distance_strategy
+
+    @property
+    def ntotal(self) -> int:
+        """Number of vectors over all shards."""
+        return sum(shard.index.ntotal for shard in self.shards)
+
+    def map_shards(self, func: Callable) -> list:
+        """func(shard) for every shard, in parallel threads; results in shard order."""
+        if len(self.shards) == 1:
+            return [func(self.shards[0])]
+        return list(_get_search_pool().map(func, self.shards))
+
+    def merge_results(self, results: List[List[Tuple[Document, float]]], k: int) -> List[Tuple[Document, float]]:
+        """The best k of the shards' (Document, score) lists: highest inner products, or smallest distances."""
+        from langchain_community.vectorstores.utils import DistanceStrategy
+
+        merged = [pair for shard_results in results for pair in shard_results]
+        merged.sort(key=lambda pair: pair[1], reverse=self.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT)
+        return merged[:k]
 
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, filter=None, fetch_k: int = 20, **kwargs
+    ) -> List[Tuple[Document, float]]:
+        results = self.map_shards(
+            lambda shard: shard.similarity_search_with_score_by_vector(
+                embedding, k, filter=filter, fetch_k=fetch_k, **kwargs
+            )
+        )
+        return self.merge_results(results, k)
 
-def build_vectorstore(texts: list, metadatas: list, embedder):
-    """Build FAISS vector store from texts."""
-    return FAISS.from_texts(texts=texts, embedding=embedder, metadatas=metadatas)
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter=None, fetch_k: int = 20, **kwargs
+    ) -> List[Tuple[Document, float]]:
+        embedding = self.shards[0]._embed_query(query)
+        return self.similarity_search_with_score_by_vector(embedding, k, filter=filter, fetch_k=fetch_k, **kwargs)
 
+    def similarity_search(self, query: str, k: int = 4, filter=None, fetch_k: int = 20, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter=filter, fetch_k=fetch_k, **kwargs)]
 
-def save_vectorstore(vector_db, path: str = "data/embeddings/faiss_index"):
-    """Save vector store to disk."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    vector_db.save_local(path)
 
+def build_vectorstore(texts: list, metadatas: list, embedder, ids: list = None, vectors: list = None):
+    """Build FAISS vector store from texts (vectors: their embeddings, if already computed)."""
+    from langchain_community.vectorstores import FAISS
 
-def load_vectorstore(path: str, embedder):
-    """Load vector store from disk."""
-    if not os.path.exists(path):
+    if vectors is not None:
+        return FAISS.from_embeddings(
+            text_embeddings=list(zip(texts, vectors)), embedding=embedder, metadatas=metadatas, ids=ids
+        )
+    return FAISS.from_texts(texts=texts, embedding=embedder, metadatas=metadatas, ids=ids)
+
+
+def save_vectorstore(vector_db, path: str = "data/embeddings/faiss_index", shard_by: Optional[str] = None):
+    """
+    Save vector store to disk as a new snapshot (see index_store.py for the format).
+
+    shard_by: shard policy of the saved index (default INDEX_SHARD_BY; ""
+    saves a single index)
+    """
+    shard_by = INDEX_SHARD_BY if shard_by is None else shard_by
+    if shard_by:
+        write_shards(vector_db, path, shard_by)
+    else:
+        write_index(vector_db, path)
+
+
+def load_vectorstore(path: str, embedder, mmap: bool = False):
+    """
+    Load vector store from disk; chunk texts are read lazily. A sharded
+    index loads as a ShardedVectorStore.
+
+    mmap: map the vectors from disk, read-only (see index_store.read_index).
+    """
+    if not index_exists(path):
         raise FileNotFoundError(f"Vector store not found at {path}")
-    return FAISS.load_local(path, embedder, allow_dangerous_deserialization=True)
+
+    if read_shard_map(path) is not None:
+        shard_map, shards = read_shards(path, embedder, mmap=mmap)
+        return ShardedVectorStore(shards, shard_map["shard_by"])
+
+    if is_legacy_index(path):
+        from langchain_community.vectorstores import FAISS
+
+        # Indexes saved before the current format: convert them once
+        vector_db = FAISS.load_local(path, embedder, allow_dangerous_deserialization=True)
+        try:
+            write_index(vector_db, path)
+            print(f"Converted the pickled index at {path} to the current format")
+        except OSError as e:
+            print(f"Could not convert the pickled index at {path}: {e}")
+        return vector_db
+    return read_index(path, embedder, mmap=mmap)
+
+
+def _search_vectors(vector_db, vectors: np.ndarray, k: int, filter, fetch_k: int) -> List[List[Tuple[Document, float]]]:
+    """One FAISS search of a single store for many (normalized) query vectors."""
+    scores, indices = vector_db.index.search(vectors, k if filter is None else fetch_k)
+
+    filter_func = vector_db._create_filter_func(filter) if filter is not None else None
+    results = []
+    for row_scores, row in zip(scores, indices):
+        docs = []
+        for score, i in zip(row_scores, row):
+            if i == -1:
+                continue
+            doc = vector_db.docstore.search(vector_db.index_to_docstore_id[i])
+            if filter_func is None or filter_func(doc.metadata):
+                docs.append((doc, float(score)))
+                if len(docs) == k:
+                    break
+        results.append(docs)
+    return results
+
+
+def batch_similarity_search(
+    vector_db, queries: List[str], k: int = 5, filter=None, fetch_k: int = 20
+) -> List[List[Tuple[Document, float]]]:
+    """
+    Search many queries at once: one embedding pass and one FAISS search
+    (per shard, in parallel, for a ShardedVectorStore).
+
+    Returns the same results as calling vector_db.similarity_search_with_score(
+    query, k=k, filter=filter, fetch_k=fetch_k) for each query.
+
+    Returns:
+        One list of (Document, score) pairs per query
+    """
+    import faiss
+
+    with metrics.timed("batch.embed"):
+        vectors = np.asarray(vector_db.embeddings.embed_documents(queries), dtype=np.float32)
+    if vector_db._normalize_L2:
+        faiss.normalize_L2(vectors)
+
+    with metrics.timed("batch.search"):
+        if not isinstance(vector_db, ShardedVectorStore):
+            return _search_vectors(vector_db, vectors, k, filter, fetch_k)
+        per_shard = vector_db.map_shards(lambda shard: _search_vectors(shard, vectors, k, filter, fetch_k))
+        return [vector_db.merge_results(results, k) for results in zip(*per_shard)]
+
+
+def _fuse(vector_db, results: List[List[Tuple[Document, float]]], k: int) -> List[Tuple[Document, float]]:
+    """
+    Reciprocal rank fusion of several result lists: the best k documents by
+    the sum of 1 / (RRF_K + rank) over the lists, each with its best score.
+    """
+    from langchain_community.vectorstores.utils import DistanceStrategy
+
+    higher_is_better = vector_db.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+    fused, best = {}, {}
+    for docs in results:
+        for rank, (doc, score) in enumerate(docs, 1):
+            fused[doc.id] = fused.get(doc.id, 0.0) + 1 / (RRF_K + rank)
+            if doc.id not in best or (score > best[doc.id][1]) == higher_is_better:
+                best[doc.id] = (doc, score)
+    return [best[doc_id] for doc_id in sorted(fused, key=fused.get, reverse=True)[:k]]
+
+
+def batch_fused_similarity_search(
+    vector_db, query_sets: List[List[str]], k: int = 5, filter=None, fetch_k: int = 20
+) -> List[List[Tuple[Document, float]]]:
+    """
+    Search several phrasings of each of several questions (clauses.expand_query)
+    and fuse each question's results: every phrasing is embedded in one pass and
+    searched with one FAISS call (batch_similarity_search), then ranked by
+    reciprocal rank fusion.
+
+    Returns:
+        One list of (Document, score) pairs per question
+    """
+    flat = [query for queries in query_sets for query in queries]
+    results = batch_similarity_search(vector_db, flat, k, filter=filter, fetch_k=fetch_k)
+    fused, start = [], 0
+    for queries in query_sets:
+        fused.append(_fuse(vector_db, results[start:start + len(queries)], k))
+        start += len(queries)
+    return fused
+
+
+def fused_similarity_search(
+    vector_db, queries: List[str], k: int = 5, filter=None, fetch_k: int = 20
+) -> List[Tuple[Document, float]]:
+    """
+    batch_fused_similarity_search for one question; a single phrasing is a
+    plain similarity_search_with_score.
+    """
+    if len(queries) == 1:
+        return vector_db.similarity_search_with_score(queries[0], k=k, filter=filter, fetch_k=fetch_k)
+    return batch_fused_similarity_search(vector_db, [queries], k, filter=filter, fetch_k=fetch_k)[0]
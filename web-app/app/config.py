@@ -17,6 +17,17 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int = 60
     ml_service_url: str = "http://localhost:8000"
+    # Seconds to wait for the ML service's answer to a chat message and for
+    # an upload to be indexed; the service answers slow LLM calls itself,
+    # from retrieval only, well within the first
+    ml_service_query_timeout: float = 120
+    ml_service_upload_timeout: float = 600
+    # Chat messages per user: sustained rate (0 disables) and burst size
+    rate_limit_per_minute: float = 10
+    rate_limit_burst: int = 5
+    # Redis-compatible server to share the limits between app processes
+    # (needs the redis package); empty keeps them in memory
+    rate_limit_redis_url: str = ""
 
     class ConfigDict:
         """Config file"""
@@ -0,0 +1,113 @@
+"""Per-user token-bucket rate limiting"""
+
+import math
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import Depends, HTTPException, status
+
+from app import models
+from app.config import get_settings
+from app.deps import logged_in
+
+# Atomic take from a bucket stored as a hash: returns the seconds to wait
+# (as a string, Redis truncates Lua numbers to integers), "0" if admitted
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+class MemoryBuckets:
+    """Token buckets in this process's memory"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str) -> float:
+        """Take a token; returns 0 if one was available, else the seconds until one is"""
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.capacity, now))
+            tokens = min(self.capacity, tokens + (now - updated) * self.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+
+            # Full buckets carry no state; drop them now and then
+            if len(self._buckets) > 10000:
+                full = now - self.capacity / self.rate
+                self._buckets = {k: v for k, v in self._buckets.items() if v[1] > full}
+        return wait
+
+
+class RedisBuckets:
+    """Token buckets in a Redis-compatible server, shared by all app processes"""
+
+    def __init__(self, rate: float, capacity: float, url: str):
+        import redis  # pylint: disable=import-outside-toplevel
+
+        self.rate = rate
+        self.capacity = capacity
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key: str) -> float:
+        """Take a token; returns 0 if one was available, else the seconds until one is"""
+
+        return float(self._take(keys=[f"ratelimit:{key}"], args=[self.rate, self.capacity, time.time()]))
+
+
+_buckets = None  # pylint: disable=invalid-name
+
+
+def get_buckets():
+    """The message rate limiter, built from the settings on first use"""
+
+    global _buckets  # pylint: disable=global-statement
+    if _buckets is None:
+        settings = get_settings()
+        rate = settings.rate_limit_per_minute / 60
+        if settings.rate_limit_redis_url:
+            _buckets = RedisBuckets(rate, settings.rate_limit_burst, settings.rate_limit_redis_url)
+        else:
+            _buckets = MemoryBuckets(rate, settings.rate_limit_burst)
+    return _buckets
+
+
+def rate_limited(current_user=Depends(logged_in)) -> Optional[models.User]:
+    """Dependency: 429 with Retry-After once the user sends messages faster than allowed"""
+
+    if current_user is None or get_settings().rate_limit_per_minute <= 0:
+        return current_user
+
+    wait = get_buckets().take(str(current_user.id))
+    if wait > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many messages, please slow down",
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+    return current_user
@@ -16,6 +16,8 @@ from app.db import (
 )
 from app.deps import logged_in
 from app.config import get_settings
+from app.ratelimit import rate_limited
+from app.uploads import stream_upload_request
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 _settings = get_settings()
@@ -28,7 +30,7 @@ CLIENT_URL = _settings.ml_service_url
 
 @router.post("/{session_id}/message")
 def add_message(
-    session_id: str, message: str = Form(...), current_user=Depends(logged_in)
+    session_id: str, message: str = Form(...), current_user=Depends(rate_limited)
 ):
     """Add a message to the current chat"""
 
@@ -40,10 +42,34 @@ def add_message(
 
     add_message_to_session(session_id, "user", message)
 
-    resp = requests.post(
-        url=f"{CLIENT_URL}/query",
-        json={"query": message}
-    )
+    try:
+        resp = requests.post(
+            url=f"{CLIENT_URL}/query",
+            json={"query": message, "user_id": current_user.id, "session_id": session_id},
+            timeout=_settings.ml_service_query_timeout
+        )
+    except requests.Timeout:
+        return JSONResponse(
+            {"detail": "The assistant is taking too long to answer, please try again later"},
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        )
+    except requests.RequestException:
+        return JSONResponse(
+            {"detail": "The assistant is unavailable, please try again later"},
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+    if resp.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+        # The ML service's daily token budget for this user is spent
+        return JSONResponse(
+            {"detail": "Daily usage limit reached, please try again later"},
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": resp.headers.get("Retry-After", "3600")},
+        )
+    if resp.status_code != status.HTTP_200_OK:
+        return JSONResponse(
+            {"detail": "The assistant could not answer, please try again"},
+            status_code=status.HTTP_502_BAD_GATEWAY,
+        )
     json = resp.json()
 
     response = json["final_explanation"]
@@ -63,13 +89,22 @@ def send_file(request: Request, file: UploadFile, current_user=Depends(logged_in
     session_id = create_session(current_user.id, file.filename)
     add_message_to_session(session_id, "user", f"You sent a file: {file.filename}")
 
-    files = {"file": (file.filename, file.file, file.content_type)}
-    resp = requests.post(
-        url=f"{CLIENT_URL}/index-document",
-        files=files,
-        data={"user_id": current_user.id, "session_id": session_id}
+    # Stream the spooled upload through instead of building the body in memory
+    body, headers = stream_upload_request(
+        {"user_id": current_user.id, "session_id": str(session_id)}, "file", file
     )
+    try:
+        resp = requests.post(
+            url=f"{CLIENT_URL}/index-document",
+            data=body,
+            headers=headers,
+            timeout=_settings.ml_service_upload_timeout
+        )
+    except requests.RequestException:
+        return templates.TemplateResponse(request, "upload.html", {"error": "Please try again"})
 
+    if resp.status_code == status.HTTP_413_CONTENT_TOO_LARGE:
+        return templates.TemplateResponse(request, "upload.html", {"error": "File is too large"})
     if resp.status_code != status.HTTP_200_OK:
         return templates.TemplateResponse(request, "upload.html", {"error": "Please try again"})
 
@@ -103,4 +138,13 @@ def remove_session(session_id: str, current_user=Depends(logged_in)):
     if not deleted:
         return RedirectResponse("/", status_code=status.HTTP_302_FOUND)
 
+    # Drop the session's document vectors; the chat is gone even if this fails
+    try:
+        requests.delete(
+            url=f"{CLIENT_URL}/users/{current_user.id}/sessions/{session_id}",
+            timeout=10
+        )
+    except requests.RequestException:
+        pass
+
     return RedirectResponse("/", status_code=status.HTTP_303_SEE_OTHER)
@@ -0,0 +1,62 @@
+"""Rate limiting tests"""
+
+from unittest.mock import Mock, patch
+
+import pytest
+
+from app import ratelimit
+
+
+@pytest.fixture
+def buckets(monkeypatch):
+    """Fresh in-memory buckets: 2 messages of burst, then one per second"""
+
+    buckets = ratelimit.MemoryBuckets(rate=1.0, capacity=2)
+    monkeypatch.setattr(ratelimit, "_buckets", buckets)
+    yield buckets
+
+
+def test_bucket_refills():
+    """Test that a bucket admits its burst, then waits for refills"""
+
+    buckets = ratelimit.MemoryBuckets(rate=10.0, capacity=2)
+    with patch("app.ratelimit.time.monotonic", side_effect=[0.0, 0.0, 0.0, 0.05, 0.1]):
+        assert buckets.take("user") == 0
+        assert buckets.take("user") == 0
+        assert buckets.take("user") == pytest.approx(0.1)
+        assert buckets.take("user") == pytest.approx(0.05)
+        assert buckets.take("user") == 0
+
+
+def test_chat_rate_limited(test_client, mock_logged_in, buckets):
+    """Test that messages past the burst get a 429 with Retry-After"""
+
+    with patch("app.routers.chat_routes.add_message_to_session") as mock_add_message, patch(
+        "app.routers.chat_routes.get_session_info"
+    ), patch("app.routers.chat_routes.requests.post") as mock_post:
+        mock_post.return_value = Mock(status_code=200, json=Mock(return_value={"final_explanation": "Hi"}))
+        statuses = [
+            test_client.post("/chat/session_id/message", data={"message": "Hello"}).status_code
+            for _ in range(3)
+        ]
+        resp = test_client.post("/chat/session_id/message", data={"message": "Hello"})
+
+    assert statuses == [200, 200, 429]
+    assert resp.status_code == 429
+    assert int(resp.headers["retry-after"]) >= 1
+    assert mock_post.call_count == 2
+    assert mock_add_message.call_count == 4
+
+
+def test_chat_budget_exhausted(test_client, mock_logged_in, buckets):
+    """Test that the ML service's token budget 429 is passed on"""
+
+    with patch("app.routers.chat_routes.add_message_to_session"), patch(
+        "app.routers.chat_routes.get_session_info"
+    ), patch("app.routers.chat_routes.requests.post") as mock_post:
+        mock_post.return_value = Mock(status_code=429, headers={"Retry-After": "120"})
+        resp = test_client.post("/chat/session_id/message", data={"message": "Hello"})
+
+    assert resp.status_code == 429
+    assert resp.headers["retry-after"] == "120"
+    assert "limit" in resp.json()["detail"]
@@ -2,6 +2,8 @@
 
 from unittest.mock import Mock, patch
 
+import requests
+
 
 def test_dashboard_unauthorized(test_client):
     """Test that viewing dashboard without auth fails"""
@@ -27,6 +29,21 @@ def test_chat(test_client, mock_logged_in):
             "/chat/session_id/message", data={"message": "Hello"}, follow_redirects=False
         )
         assert resp.status_code == 200
+        assert mock_post.call_args.kwargs["json"]["session_id"] == "session_id"
+        assert mock_post.call_args.kwargs["timeout"] > 0
+
+
+def test_chat_service_timeout(test_client, mock_logged_in):
+    """Test that a slow ML service gets a 504 with a message instead of hanging"""
+
+    with patch("app.routers.chat_routes.add_message_to_session") as mock_add_message, patch(
+        "app.routers.chat_routes.get_session_info"
+    ), patch("app.routers.chat_routes.requests.post", side_effect=requests.Timeout()):
+        resp = test_client.post("/chat/session_id/message", data={"message": "Hello"})
+        assert resp.status_code == 504
+        assert "too long" in resp.json()["detail"]
+        # Only the user's message is stored
+        mock_add_message.assert_called_once()
 
 
 def test_chat_msg_unauthorized(test_client):
@@ -65,3 +82,26 @@ def test_chat_unknown_session(test_client, mock_logged_in):
         assert resp.status_code == 302
         resp.headers["location"] == "/"
         mock_add_message.assert_not_called()
+
+
+def test_remove_session_deletes_vectors(test_client, mock_logged_in):
+    """Test that deleting a chat also removes its documents from the ML service"""
+
+    with patch("app.routers.chat_routes.delete_session", return_value=True), patch(
+        "app.routers.chat_routes.requests.delete"
+    ) as mock_delete:
+        resp = test_client.post("/chat/session_id/delete", follow_redirects=False)
+        assert resp.status_code == 303
+        mock_delete.assert_called_once()
+        assert mock_delete.call_args.kwargs["url"].endswith("/sessions/session_id")
+
+
+def test_remove_session_service_down(test_client, mock_logged_in):
+    """Test that a chat is still deleted when the ML service is unreachable"""
+
+    with patch("app.routers.chat_routes.delete_session", return_value=True), patch(
+        "app.routers.chat_routes.requests.delete",
+        side_effect=requests.ConnectionError(),
+    ):
+        resp = test_client.post("/chat/session_id/delete", follow_redirects=False)
+        assert resp.status_code == 303
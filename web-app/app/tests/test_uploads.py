@@ -0,0 +1,52 @@
+"""Streaming upload tests"""
+
+import io
+from unittest.mock import Mock, patch
+
+from app.uploads import iter_multipart
+
+
+def test_iter_multipart_body():
+    """Test that the multipart body carries the fields and the file contents"""
+
+    chunks = list(
+        iter_multipart(
+            {"user_id": "id"}, "file", "contract.pdf", io.BytesIO(b"%PDF-1.4 data"),
+            "application/pdf", "boundary123",
+        )
+    )
+    body = b"".join(chunks)
+
+    assert body.startswith(b"--boundary123\r\n")
+    assert b'name="user_id"\r\n\r\nid\r\n' in body
+    assert b'filename="contract.pdf"\r\nContent-Type: application/pdf\r\n\r\n%PDF-1.4 data' in body
+    assert body.endswith(b"\r\n--boundary123--\r\n")
+
+
+def test_send_file_streams_upload(test_client, mock_logged_in):
+    """Test that uploads are streamed to the ML service instead of buffered"""
+
+    with patch("app.routers.chat_routes.create_session", return_value="session_id"), patch(
+        "app.routers.chat_routes.add_message_to_session"
+    ), patch("app.routers.chat_routes.requests.post") as mock_post:
+        sent = {}
+
+        def fake_post(url, data, headers, timeout):
+            sent["body"] = b"".join(data)
+            sent["headers"] = headers
+            sent["timeout"] = timeout
+            return Mock(status_code=200)
+
+        mock_post.side_effect = fake_post
+        resp = test_client.post(
+            "/chat/file",
+            files={"file": ("contract.txt", b"contract text", "text/plain")},
+            follow_redirects=False,
+        )
+
+        assert resp.status_code == 303
+        assert resp.headers["location"] == "/chat/get/session_id"
+        assert sent["headers"]["Content-Type"].startswith("multipart/form-data; boundary=")
+        assert b"contract text" in sent["body"]
+        assert sent["timeout"] > 0
+        assert b'name="session_id"\r\n\r\nsession_id\r\n' in sent["body"]
@@ -0,0 +1,53 @@
+"""Streaming multipart uploads to the ML service"""
+
+import uuid
+from typing import BinaryIO, Iterator
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _quote(value: str) -> str:
+    """Escape a form-data header parameter value"""
+
+    return value.replace("\\", "\\\\").replace('"', "%22").replace("\r", "%0D").replace("\n", "%0A")
+
+
+def iter_multipart(
+    fields: dict,
+    file_field: str,
+    filename: str,
+    fileobj: BinaryIO,
+    content_type: str,
+    boundary: str,
+) -> Iterator[bytes]:
+    """Yield a multipart/form-data body, reading the file in chunks"""
+
+    for name, value in fields.items():
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'
+            f"{value}\r\n"
+        ).encode("utf-8")
+
+    yield (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{_quote(file_field)}"; '
+        f'filename="{_quote(filename)}"\r\n'
+        f"Content-Type: {content_type or 'application/octet-stream'}\r\n\r\n"
+    ).encode("utf-8")
+
+    while chunk := fileobj.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+    yield f"\r\n--{boundary}--\r\n".encode("utf-8")
+
+
+def stream_upload_request(fields: dict, file_field: str, upload) -> tuple[Iterator[bytes], dict]:
+    """Build a streamed body and headers for posting an UploadFile with requests"""
+
+    boundary = uuid.uuid4().hex
+    body = iter_multipart(
+        fields, file_field, upload.filename, upload.file, upload.content_type, boundary
+    )
+    headers = {"Content-Type": f"multipart/form-data; boundary={boundary}"}
+    return body, headers